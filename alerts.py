@@ -1,9 +1,15 @@
 import os
+import time
+import threading
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from datetime import datetime
 from dotenv import load_dotenv
+import numpy as np
+import pandas as pd
+from utils import load_data_from_json, update_json_file
+from instrumentation import timed, count
 
 # Load environment variables
 load_dotenv()
@@ -11,8 +17,44 @@ load_dotenv()
 # Alert history storage
 alert_history = []
 
-def get_alert_thresholds():
-    """Get configurable alert thresholds from environment or defaults"""
+# Alerts kept in memory by long-running processes (ingest service, shard workers)
+RECENT_ALERTS_LIMIT = int(os.getenv('RECENT_ALERTS_LIMIT', 1000))
+
+# Per-patient / per-cohort overrides of the default thresholds
+THRESHOLD_PROFILES_FILE = 'threshold_profiles.json'
+
+# Minimum seconds between checks of the profiles file for changes
+PROFILE_RELOAD_INTERVAL = 1.0
+
+# Repeats of an alert type for a patient within this many seconds are suppressed (AlertSuppressor)
+ALERT_COOLDOWN_SECONDS = float(os.getenv('ALERT_COOLDOWN_SECONDS', 300))
+
+# Column order of compiled threshold arrays
+THRESHOLD_KEYS = ['heart_rate_high', 'heart_rate_low', 'blood_oxygen_low', 'temperature_high',
+                  'temperature_low', 'respiration_high', 'respiration_low']
+INT_THRESHOLD_KEYS = {'heart_rate_high', 'heart_rate_low', 'blood_oxygen_low', 'respiration_high', 'respiration_low'}
+
+# (vital, threshold key, above?, severity, type, message) in the order alerts are raised;
+# a low-side rule only fires when the high-side rule for the same vital did not
+ALERT_RULES = [
+    ('heart_rate', 'heart_rate_high', True, 'HIGH', 'Tachycardia',
+     'Heart rate {value} BPM exceeds safe threshold ({threshold} BPM)'),
+    ('heart_rate', 'heart_rate_low', False, 'HIGH', 'Bradycardia',
+     'Heart rate {value} BPM below safe threshold ({threshold} BPM)'),
+    ('blood_oxygen', 'blood_oxygen_low', False, 'CRITICAL', 'Hypoxia',
+     'Blood oxygen {value}% is critically low (threshold: {threshold}%)'),
+    ('temperature', 'temperature_high', True, 'MEDIUM', 'Fever',
+     'Temperature {value}°C indicates potential fever (threshold: {threshold}°C)'),
+    ('temperature', 'temperature_low', False, 'HIGH', 'Hypothermia',
+     'Temperature {value}°C is dangerously low (threshold: {threshold}°C)'),
+    ('respiration_rate', 'respiration_high', True, 'MEDIUM', 'Tachypnea',
+     'Respiration rate {value} breaths/min is elevated (threshold: {threshold})'),
+    ('respiration_rate', 'respiration_low', False, 'HIGH', 'Bradypnea',
+     'Respiration rate {value} breaths/min is too low (threshold: {threshold})'),
+]
+
+def _default_thresholds():
+    """Global thresholds from environment or defaults"""
     return {
         'heart_rate_high': int(os.getenv('HEART_RATE_HIGH', 100)),
         'heart_rate_low': int(os.getenv('HEART_RATE_LOW', 50)),
@@ -23,89 +65,226 @@ def get_alert_thresholds():
         'respiration_low': int(os.getenv('RESPIRATION_LOW', 10)),
     }
 
+def _coerce_thresholds(values):
+    return {k: (int(v) if k in INT_THRESHOLD_KEYS and float(v).is_integer() else float(v))
+            for k, v in values.items() if k in THRESHOLD_KEYS and v is not None}
+
+class ThresholdProfiles:
+    """
+    Alert thresholds resolved per patient: defaults <- cohort profile <- user overrides
+    threshold_profiles.json shape:
+        {"cohorts": {"athlete": {"heart_rate_low": 40}},
+         "users": {"patient1": {"cohort": "athlete", "thresholds": {"heart_rate_high": 110}}}}
+    The file is reloaded when it changes. Resolved thresholds are compiled into one
+    float64 array (row 0 = defaults, one row per user with a profile) so batch checks
+    are a single gather.
+    """
+
+    def __init__(self, filename=THRESHOLD_PROFILES_FILE):
+        self.filename = filename
+        self._lock = threading.Lock()
+        self._signature = None
+        self._checked_at = 0.0
+        self._compile({}, _default_thresholds())
+
+    def _compile(self, profiles, defaults):
+        cohorts = profiles.get('cohorts', {})
+        users = profiles.get('users', {})
+        resolved = {}
+        for user_id, profile in users.items():
+            thresholds = dict(defaults)
+            thresholds.update(_coerce_thresholds(cohorts.get(profile.get('cohort'), {})))
+            thresholds.update(_coerce_thresholds(profile.get('thresholds', {})))
+            resolved[user_id] = thresholds
+        user_ids = list(resolved)
+        table = np.empty((len(user_ids) + 1, len(THRESHOLD_KEYS)), dtype=np.float64)
+        table[0] = [defaults[k] for k in THRESHOLD_KEYS]
+        for row, user_id in enumerate(user_ids, start=1):
+            table[row] = [resolved[user_id][k] for k in THRESHOLD_KEYS]
+        self.profiles = profiles
+        self.defaults = defaults
+        self.resolved = resolved
+        self.user_index = pd.Index(user_ids)
+        self.user_rows = {user_id: row for row, user_id in enumerate(user_ids, start=1)}
+        self.table = table
+
+    def refresh(self, force=False):
+        """Recompile if the profiles file or the environment defaults changed"""
+        now = time.monotonic()
+        if not force and now - self._checked_at < PROFILE_RELOAD_INTERVAL:
+            return
+        with self._lock:
+            self._checked_at = now
+            try:
+                stat = os.stat(self.filename)
+                file_signature = (stat.st_mtime_ns, stat.st_size)
+            except FileNotFoundError:
+                file_signature = None
+            defaults = _default_thresholds()
+            signature = (file_signature, tuple(defaults.values()))
+            if signature == self._signature and not force:
+                return
+            profiles = load_data_from_json(self.filename) if file_signature else {}
+            self._compile(profiles, defaults)
+            self._signature = signature
+
+    def get(self, user_id=None):
+        self.refresh()
+        if user_id is not None and user_id in self.resolved:
+            return dict(self.resolved[user_id])
+        return dict(self.defaults)
+
+    def gather(self, user_ids):
+        """Threshold rows [n, len(THRESHOLD_KEYS)] for an array of user ids (or one id for all)"""
+        self.refresh()
+        table = self.table
+        if isinstance(user_ids, str) or user_ids is None:
+            return table[self.user_rows.get(user_ids, 0)][None, :]
+        rows = self.user_index.get_indexer(np.asarray(user_ids, dtype=object)) + 1
+        return table[rows]
+
+threshold_profiles = ThresholdProfiles()
+
+def get_alert_thresholds(user_id=None):
+    """Alert thresholds for a patient (their cohort and overrides applied), or the global defaults"""
+    return threshold_profiles.get(user_id)
+
+def set_threshold_profile(user_id, thresholds=None, cohort=None):
+    """Store per-user overrides and/or cohort membership; takes effect on the next check"""
+    def update(profiles):
+        profile = profiles.setdefault('users', {}).setdefault(user_id, {})
+        if cohort is not None:
+            profile['cohort'] = cohort
+        if thresholds:
+            profile.setdefault('thresholds', {}).update(_coerce_thresholds(thresholds))
+    update_json_file(threshold_profiles.filename, update)
+    threshold_profiles.refresh(force=True)
+
+def set_cohort_thresholds(cohort, thresholds):
+    """Store thresholds shared by every patient in a cohort"""
+    def update(profiles):
+        profiles.setdefault('cohorts', {}).setdefault(cohort, {}).update(_coerce_thresholds(thresholds))
+    update_json_file(threshold_profiles.filename, update)
+    threshold_profiles.refresh(force=True)
+
+def remove_threshold_profile(user_id):
+    def update(profiles):
+        profiles.get('users', {}).pop(user_id, None)
+    update_json_file(threshold_profiles.filename, update)
+    threshold_profiles.refresh(force=True)
+
+@timed()
 def check_vitals_for_alerts(vitals, user_id="Unknown"):
-    """Check vitals against thresholds and return list of alerts"""
-    thresholds = get_alert_thresholds()
+    """Check vitals against the patient's thresholds and return list of alerts"""
+    # One-row batch, so single readings and batches share ALERT_RULES
+    row = {vital: [vitals[vital]] for vital in dict.fromkeys(rule[0] for rule in ALERT_RULES) if vital in vitals}
+    if not row:
+        return []
+    flags, thresholds = check_vitals_batch(user_id, row)
+    return alerts_from_flags(flags, thresholds, user_id, row)
+
+def _batch_length(vitals):
+    return len(vitals) if isinstance(vitals, pd.DataFrame) else len(next(iter(vitals.values())))
+
+@timed()
+def check_vitals_batch(user_ids, vitals):
+    """
+    Vectorized check_vitals_for_alerts over many readings from many patients
+    user_ids: one id per row, or a single id for every row
+    vitals: DataFrame or dict of columns; missing columns/NaN never alert
+    Returns: flags (bool [rows, len(ALERT_RULES)]), thresholds (float64 [rows, len(THRESHOLD_KEYS)])
+    """
+    length = _batch_length(vitals)
+    thresholds = threshold_profiles.gather(user_ids)
+    if len(thresholds) != length:
+        thresholds = np.broadcast_to(thresholds, (length, len(THRESHOLD_KEYS)))
+    flags = np.zeros((length, len(ALERT_RULES)), dtype=bool)
+    columns = {}
+    for i, (vital, key, above, _, _, _) in enumerate(ALERT_RULES):
+        if vital not in vitals:
+            continue
+        if vital not in columns:
+            columns[vital] = np.asarray(vitals[vital], dtype=np.float64)
+        limit = thresholds[:, THRESHOLD_KEYS.index(key)]
+        flags[:, i] = columns[vital] > limit if above else columns[vital] < limit
+        if not above and i > 0 and ALERT_RULES[i - 1][0] == vital:
+            flags[:, i] &= ~flags[:, i - 1]
+    return flags, thresholds
+
+def alerts_from_flags(flags, thresholds, user_ids, vitals, record=True, timestamps=None):
+    """
+    Alert dicts (as check_vitals_for_alerts builds them) for the flagged rows of a batch
+    timestamps: optional reading timestamp per row, used instead of now (e.g. for replays)
+    """
     alerts = []
-    
-    # Check heart rate
-    if 'heart_rate' in vitals:
-        hr = vitals['heart_rate']
-        if hr > thresholds['heart_rate_high']:
-            alerts.append({
-                'severity': 'HIGH',
-                'type': 'Tachycardia',
-                'message': f'Heart rate {hr} BPM exceeds safe threshold ({thresholds["heart_rate_high"]} BPM)',
-                'user_id': user_id,
-                'timestamp': datetime.now().isoformat()
-            })
-        elif hr < thresholds['heart_rate_low']:
-            alerts.append({
-                'severity': 'HIGH',
-                'type': 'Bradycardia',
-                'message': f'Heart rate {hr} BPM below safe threshold ({thresholds["heart_rate_low"]} BPM)',
-                'user_id': user_id,
-                'timestamp': datetime.now().isoformat()
-            })
-    
-    # Check blood oxygen
-    if 'blood_oxygen' in vitals:
-        o2 = vitals['blood_oxygen']
-        if o2 < thresholds['blood_oxygen_low']:
-            alerts.append({
-                'severity': 'CRITICAL',
-                'type': 'Hypoxia',
-                'message': f'Blood oxygen {o2}% is critically low (threshold: {thresholds["blood_oxygen_low"]}%)',
-                'user_id': user_id,
-                'timestamp': datetime.now().isoformat()
-            })
-    
-    # Check temperature
-    if 'temperature' in vitals:
-        temp = vitals['temperature']
-        if temp > thresholds['temperature_high']:
-            alerts.append({
-                'severity': 'MEDIUM',
-                'type': 'Fever',
-                'message': f'Temperature {temp}°C indicates potential fever (threshold: {thresholds["temperature_high"]}°C)',
-                'user_id': user_id,
-                'timestamp': datetime.now().isoformat()
-            })
-        elif temp < thresholds['temperature_low']:
-            alerts.append({
-                'severity': 'HIGH',
-                'type': 'Hypothermia',
-                'message': f'Temperature {temp}°C is dangerously low (threshold: {thresholds["temperature_low"]}°C)',
-                'user_id': user_id,
-                'timestamp': datetime.now().isoformat()
-            })
-    
-    # Check respiration
-    if 'respiration_rate' in vitals:
-        resp = vitals['respiration_rate']
-        if resp > thresholds['respiration_high']:
-            alerts.append({
-                'severity': 'MEDIUM',
-                'type': 'Tachypnea',
-                'message': f'Respiration rate {resp} breaths/min is elevated (threshold: {thresholds["respiration_high"]})',
-                'user_id': user_id,
-                'timestamp': datetime.now().isoformat()
-            })
-        elif resp < thresholds['respiration_low']:
-            alerts.append({
-                'severity': 'HIGH',
-                'type': 'Bradypnea',
-                'message': f'Respiration rate {resp} breaths/min is too low (threshold: {thresholds["respiration_low"]})',
-                'user_id': user_id,
-                'timestamp': datetime.now().isoformat()
-            })
-    
-    # Store in history
-    for alert in alerts:
-        alert_history.append(alert)
-    
+    rows, rules = np.nonzero(flags)
+    ids = None if isinstance(user_ids, str) else np.asarray(user_ids, dtype=object)
+    now = datetime.now().isoformat()
+    for row, rule in zip(rows, rules):
+        vital, key, _, severity, alert_type, message = ALERT_RULES[rule]
+        threshold = float(thresholds[row, THRESHOLD_KEYS.index(key)])
+        if key in INT_THRESHOLD_KEYS and threshold.is_integer():
+            threshold = int(threshold)
+        value = vitals[vital].iloc[row] if isinstance(vitals, pd.DataFrame) else vitals[vital][row]
+        alerts.append({
+            'severity': severity,
+            'type': alert_type,
+            'message': message.format(value=value, threshold=threshold),
+            'user_id': user_ids if ids is None else ids[row],
+            'timestamp': now if timestamps is None else str(timestamps[row])
+        })
+    if record and alerts:
+        alert_history.extend(alerts)
+        count('alerts_raised', len(alerts))
     return alerts
 
+class AlertSuppressor:
+    """
+    Drops repeats of the same alert type for a patient within `cooldown` seconds
+    Keeps the time of the last raised alert per (user_id, type), taken from the
+    alert timestamps, so replays of history suppress the same way live data does.
+    """
+
+    def __init__(self, cooldown=ALERT_COOLDOWN_SECONDS):
+        self.cooldown = cooldown
+        self.suppressed = 0
+        self._last = {}
+        self._lock = threading.Lock()
+
+    def filter(self, alerts):
+        """The alerts that should be raised, in order"""
+        kept = []
+        with self._lock:
+            for alert in alerts:
+                at = datetime.fromisoformat(alert['timestamp']).timestamp()
+                key = (alert['user_id'], alert['type'])
+                last = self._last.get(key)
+                if last is not None and 0 <= at - last < self.cooldown:
+                    self.suppressed += 1
+                    continue
+                self._last[key] = at
+                kept.append(alert)
+        return kept
+
+    def snapshot(self):
+        """JSON-serializable state, for checkpoints"""
+        with self._lock:
+            return {'suppressed': self.suppressed,
+                    'last': [[user_id, alert_type, at] for (user_id, alert_type), at in self._last.items()]}
+
+    def restore(self, state):
+        with self._lock:
+            self.suppressed = state.get('suppressed', 0)
+            self._last = {(user_id, alert_type): at for user_id, alert_type, at in state.get('last', [])}
+
+    def reset(self, user_id=None):
+        with self._lock:
+            if user_id is None:
+                self._last.clear()
+            else:
+                self._last = {key: at for key, at in self._last.items() if key[0] != user_id}
+
+@timed()
 def send_email_alert(to_email, subject, message):
     """Send email alert via SMTP"""
     enable_real_alerts = os.getenv('ENABLE_REAL_ALERTS', 'false').lower() == 'true'
@@ -148,6 +327,7 @@ def send_email_alert(to_email, subject, message):
         print(f"❌ Failed to send email: {e}")
         return False
 
+@timed()
 def send_sms_alert(phone_number, message):
     """Send SMS alert (Twilio simulation)"""
     enable_real_alerts = os.getenv('ENABLE_REAL_ALERTS', 'false').lower() == 'true'
@@ -164,6 +344,7 @@ def send_sms_alert(phone_number, message):
     print("SMS alerts require Twilio configuration. Using simulation mode.")
     return send_sms_alert(phone_number, message)
 
+@timed()
 def process_alerts_and_notify(vitals, user_id, email=None, phone=None):
     """Check vitals, generate alerts, and send notifications"""
     alerts = check_vitals_for_alerts(vitals, user_id)
@@ -178,6 +359,18 @@ def process_alerts_and_notify(vitals, user_id, email=None, phone=None):
     
     return alerts
 
+def send_reminder_notification(user_id, message, email=None, phone=None):
+    """Deliver a medication/appointment reminder through the alert channels"""
+    if not email and not phone:
+        print(f"\n⏰ [REMINDER] {user_id}: {message}")
+        return True
+    delivered = True
+    if email:
+        delivered = send_email_alert(email, "⏰ Health Reminder", message) and delivered
+    if phone:
+        delivered = send_sms_alert(phone, f"Reminder: {message}") and delivered
+    return delivered
+
 def get_alert_history(user_id=None, limit=50):
     """Get alert history, optionally filtered by user"""
     if user_id:
@@ -1,13 +1,24 @@
 import streamlit as st
 import streamlit_authenticator as stauth
 import yaml
-from data import load_user_data, add_user, add_health_record
+from data import load_user_data, add_user, add_health_record, seed_at_risk_index
 from utils import preprocess_data
+from reminders import get_reminder_scheduler
+import instrumentation
+
+# Stage timings for this rerun (shown in the debug panel when instrumentation is on)
+instrumentation.start_trace()
+instrumentation.configure_from_env()
 
 # Load config
 with open('config.yaml') as file:
     config = yaml.safe_load(file)
 
+# Restore pending medication/appointment reminders and start firing them
+get_reminder_scheduler()
+# Rank the cohort from stored history in the background (fits the anomaly scorer off the request path)
+seed_at_risk_index()
+
 # ---------------------------
 # Authentication Setup
 # ---------------------------
@@ -188,6 +199,9 @@ if authentication_status:
         st.page_link("pages/ai_predictions.py", label="🔮 AI Predictions", icon="🔮")
     with col4:
         st.page_link("pages/reports.py", label="📄 Reports", icon="📄")
+    st.page_link("pages/live_wall.py", label="📺 Live Monitor", icon="📺")
+
+    instrumentation.render_debug_panel()
 
 elif authentication_status == False:
     st.error('❌ Username/password is incorrect')
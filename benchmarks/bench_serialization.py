@@ -0,0 +1,84 @@
+"""Compare save/load time and on-disk size of the data store serializers.
+
+Usage: python benchmarks/bench_serialization.py [--users 20] [--minutes 5000] [--repeat 3]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data import simulate_health_data
+from utils import (save_data_to_json, load_data_from_json, SERIALIZERS,
+                   ORJSON_AVAILABLE, MSGPACK_AVAILABLE, ZSTD_AVAILABLE)
+
+
+def build_store(num_users, minutes):
+    """Health store shaped like health_data.json: user_id -> list of records"""
+    store = {}
+    for i in range(num_users):
+        user_id = f"User_{i+1}"
+        store[user_id] = simulate_health_data(user_id, minutes)
+    return store
+
+
+def available_formats():
+    formats = [('json', 'none')]
+    if ORJSON_AVAILABLE:
+        formats.append(('orjson', 'none'))
+    if MSGPACK_AVAILABLE:
+        formats.append(('msgpack', 'none'))
+    if ZSTD_AVAILABLE:
+        if ORJSON_AVAILABLE:
+            formats.append(('orjson', 'zstd'))
+        if MSGPACK_AVAILABLE:
+            formats.append(('msgpack', 'zstd'))
+    return [f for f in formats if f[0] in SERIALIZERS]
+
+
+def run(num_users, minutes, repeat):
+    store = build_store(num_users, minutes)
+    records = sum(len(v) for v in store.values())
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for serializer, compression in available_formats():
+            filename = os.path.join(tmp, f'store_{serializer}_{compression}.json')
+            save_times, load_times = [], []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                save_data_to_json(store, filename, serializer, compression)
+                save_times.append(time.perf_counter() - start)
+
+                start = time.perf_counter()
+                loaded = load_data_from_json(filename)
+                load_times.append(time.perf_counter() - start)
+            assert len(loaded) == len(store)
+            results.append({
+                'format': serializer if compression == 'none' else f'{serializer}+{compression}',
+                'save_ms': min(save_times) * 1000,
+                'load_ms': min(load_times) * 1000,
+                'size_mb': os.path.getsize(filename) / 1e6,
+            })
+    return records, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--minutes', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    records, results = run(args.users, args.minutes, args.repeat)
+    baseline = results[0]
+    print(f"{records} records, best of {args.repeat}")
+    print(f"{'format':<14}{'save ms':>10}{'load ms':>10}{'size MB':>10}{'size x':>8}")
+    for r in results:
+        print(f"{r['format']:<14}{r['save_ms']:>10.1f}{r['load_ms']:>10.1f}{r['size_mb']:>10.2f}"
+              f"{baseline['size_mb'] / r['size_mb']:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""Measure how sharded ingest and queries scale with the number of worker processes.
+
+Usage:
+  python benchmarks/bench_sharding.py [--shards 1,2,4] [--readings 100000] [--users 500]
+                                      [--batch 2000] [--output scaling.json]
+
+Every shard count runs against fresh stores in a temporary directory. Start-up
+(process spawn and model fitting) is excluded; the timed part is ingesting the
+same readings in batches, all submitted up front so every shard stays busy,
+followed by cohort-wide and single-patient queries.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from schema import parse_reading
+from sharding import ShardRouter
+from load_test_ingest import make_reading
+
+
+def make_readings(n, users, seed=0):
+    rng = random.Random(seed)
+    user_ids = [f'User_{i + 1}' for i in range(users)]
+    return [parse_reading(make_reading(rng.choice(user_ids), rng)) for _ in range(n)]
+
+
+def run(num_shards, readings, batch, query_repeat=50):
+    with tempfile.TemporaryDirectory() as data_dir, ShardRouter(num_shards, data_dir) as router:
+        router.ready()
+
+        start = time.perf_counter()
+        futures = []
+        for lo in range(0, len(readings), batch):
+            futures.extend(router.ingest_async(readings[lo:lo + batch]).values())
+        for future in futures:
+            future.result()
+        ingest_seconds = time.perf_counter() - start
+
+        users = sorted({user_id for user_id, _ in readings})
+        timings = {'top_at_risk': [], 'get_user_health_df': []}
+        for i in range(query_repeat):
+            t = time.perf_counter()
+            router.top_at_risk(10)
+            timings['top_at_risk'].append(time.perf_counter() - t)
+            t = time.perf_counter()
+            router.get_user_health_df(users[i % len(users)])
+            timings['get_user_health_df'].append(time.perf_counter() - t)
+
+        per_shard = [s['readings'] for s in router.stats()]
+    return {
+        'shards': num_shards,
+        'ingest_seconds': ingest_seconds,
+        'readings_per_s': len(readings) / ingest_seconds,
+        'shard_readings': per_shard,
+        'query_ms': {name: {'p50': float(np.percentile(v, 50) * 1000), 'p99': float(np.percentile(v, 99) * 1000)}
+                     for name, v in timings.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    cores = os.cpu_count() or 1
+    default_shards = sorted({1, 2, 4, cores} & set(range(1, cores + 1)) | {1})
+    parser.add_argument('--shards', default=','.join(map(str, default_shards)))
+    parser.add_argument('--readings', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--batch', type=int, default=2000)
+    parser.add_argument('--output', help='write the results as JSON')
+    args = parser.parse_args()
+
+    readings = make_readings(args.readings, args.users)
+    print(f"{len(readings):,} readings, {args.users} patients, batches of {args.batch}, {cores} CPU cores")
+    print(f"{'shards':>6}{'readings/s':>12}{'speedup':>9}{'efficiency':>11}"
+          f"{'top_at_risk p50 ms':>20}{'history p50 ms':>16}  readings per shard")
+    results = []
+    for num_shards in [int(s) for s in args.shards.split(',')]:
+        result = run(num_shards, readings, args.batch)
+        results.append(result)
+        speedup = result['readings_per_s'] / results[0]['readings_per_s']
+        result['speedup'] = speedup
+        print(f"{num_shards:>6}{result['readings_per_s']:>12,.0f}{speedup:>8.2f}x{speedup / num_shards:>10.0%}"
+              f"{result['query_ms']['top_at_risk']['p50']:>20.2f}"
+              f"{result['query_ms']['get_user_health_df']['p50']:>16.2f}  {result['shard_readings']}")
+    if cores == 1:
+        print("Only one CPU core is available, so shards share it and cannot show a parallel speedup.")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'cpu_count': cores, 'readings': len(readings), 'users': args.users,
+                       'batch': args.batch, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,356 @@
+"""Benchmark the hot paths and track regressions across commits.
+
+Usage:
+  python benchmarks/bench_suite.py [--sizes 10000,100000,1000000] [--repeat 5] [--only data]
+                                   [--output results.json]
+  python benchmarks/bench_suite.py --compare baseline.json current.json [--threshold 0.10]
+
+Every case runs offline against a throwaway working directory with fixed seeds.
+Reported per case: latency percentiles (ms), throughput (items/s) and peak traced
+memory (MB, measured on a separate run because tracing slows the code down).
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+# simulate_health_data seeds numpy from hash(user_id); pin string hashing so runs repeat
+HASH_SEED = '0'
+if os.environ.get('PYTHONHASHSEED') != HASH_SEED:
+    os.environ['PYTHONHASHSEED'] = HASH_SEED
+    os.execv(sys.executable, [sys.executable] + sys.argv)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+import pandas as pd
+
+SEED = 42
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+
+CASES = []
+
+
+def case(name, group):
+    """Register a benchmark; the function yields (label, fn, items) tuples"""
+    def register(fn):
+        CASES.append({'name': name, 'group': group, 'build': fn})
+        return fn
+    return register
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def measure(fn, items, repeat, warmup=1):
+    """Time fn() `repeat` times after warmup, then once more under tracemalloc"""
+    for _ in range(warmup):
+        fn()
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    ms = [t * 1000 for t in latencies]
+    return {
+        'repeat': repeat,
+        'items': items,
+        'p50_ms': percentile(ms, 50),
+        'p95_ms': percentile(ms, 95),
+        'p99_ms': percentile(ms, 99),
+        'mean_ms': float(np.mean(ms)),
+        'min_ms': float(np.min(ms)),
+        'throughput_per_s': items / np.median(latencies) if items else None,
+        'peak_mb': peak / 1e6,
+    }
+
+
+def synthetic_history(n, start=datetime(2024, 1, 1)):
+    """n per-minute readings as health_data.json records, generated vectorized with a fixed seed"""
+    rng = np.random.default_rng(SEED)
+    timestamps = pd.date_range(start, periods=n, freq='min')
+    columns = {
+        'timestamp': [ts.isoformat() for ts in timestamps],
+        'heart_rate': rng.integers(60, 100, n).tolist(),
+        'blood_oxygen': rng.integers(93, 100, n).tolist(),
+        'temperature': np.round(rng.uniform(36.2, 37.4, n), 2).tolist(),
+        'respiration_rate': rng.integers(12, 20, n).tolist(),
+        'activity_level': rng.choice(['low', 'moderate', 'high'], n).tolist(),
+    }
+    return [dict(zip(columns, values)) for values in zip(*columns.values())]
+
+
+def reading(i):
+    return {'heart_rate': 70 + i % 40, 'blood_oxygen': 97, 'temperature': 36.8,
+            'respiration_rate': 16, 'activity_level': 'low'}
+
+
+# --- Cases -------------------------------------------------------------------
+
+@case('simulate_health_data', 'simulation')
+def bench_simulate(sizes):
+    from data import simulate_health_data
+    for minutes in (1_000, 10_000):
+        yield f'{minutes} min', lambda minutes=minutes: simulate_health_data('Bench_User', minutes), minutes
+
+
+@case('simulate_multi_user_data', 'simulation')
+def bench_simulate_multi(sizes):
+    from data import simulate_multi_user_data
+    yield '5 users x 2000 min', lambda: simulate_multi_user_data(5, 2000), 10_000
+
+
+@case('add_health_record', 'data')
+def bench_add_record(sizes):
+    import data
+    from utils import save_data_to_json
+    from vitals_store import write_user_vitals
+    for n in sizes:
+        user_id = f'bench_{n}'
+        history = synthetic_history(n)
+        save_data_to_json({user_id: history}, data.HEALTH_DATA_FILE)
+        write_user_vitals(user_id, history)
+        del history
+        counter = iter(range(10**9))
+        yield f'history={n}', lambda user_id=user_id: data.add_health_record(user_id, reading(next(counter))), 1
+
+
+@case('get_user_health_df', 'data')
+def bench_get_df(sizes):
+    import data
+    from utils import save_data_to_json
+    from vitals_store import write_user_vitals
+    for n in sizes:
+        user_id = f'bench_read_{n}'
+        history = synthetic_history(n)
+        save_data_to_json({user_id: history}, data.HEALTH_DATA_FILE)
+        write_user_vitals(user_id, history)
+        last_day = pd.Timestamp(history[-1]['timestamp']) - pd.Timedelta(days=1)
+        del history
+
+        def with_backend(enabled, fn):
+            def run():
+                previous = os.environ.get('USE_VITALS_STORE')
+                os.environ['USE_VITALS_STORE'] = 'true' if enabled else 'false'
+                try:
+                    return fn()
+                finally:
+                    if previous is None:
+                        del os.environ['USE_VITALS_STORE']
+                    else:
+                        os.environ['USE_VITALS_STORE'] = previous
+            return run
+
+        yield f'store full n={n}', with_backend(True, lambda user_id=user_id: data.get_user_health_df(user_id)), n
+        yield f'store last day n={n}', with_backend(
+            True, lambda user_id=user_id, s=last_day: data.get_user_health_df(user_id, start=s)), 1440
+        yield f'json full n={n}', with_backend(False, lambda user_id=user_id: data.get_user_health_df(user_id)), n
+
+
+@case('preprocess_and_detect', 'models')
+def bench_detect(sizes):
+    from data import simulate_multi_user_data
+    from utils import preprocess_data
+    from models import detect_anomalies_with_evaluation
+    for users, minutes in ((3, 1000), (10, 5000)):
+        df = simulate_multi_user_data(users, minutes)
+
+        def run(df=df):
+            _, df_scaled, _ = preprocess_data(df)
+            return detect_anomalies_with_evaluation(df_scaled)
+        yield f'{users * minutes} rows', run, users * minutes
+
+
+@case('check_vitals_for_alerts', 'alerts')
+def bench_alerts(sizes):
+    import alerts
+    readings = [dict(r, heart_rate=r['heart_rate'] + (45 if i % 20 == 0 else 0))
+                for i, r in enumerate(synthetic_history(10_000))]
+
+    def run():
+        for r in readings:
+            alerts.check_vitals_for_alerts(r, 'bench')
+        alerts.clear_alert_history()
+    yield '10000 readings', run, len(readings)
+
+
+@case('prepare_sequences_for_lstm', 'models')
+def bench_sequences(sizes):
+    from models import prepare_sequences_for_lstm
+    rng = np.random.default_rng(SEED)
+    for n in (10_000, 100_000):
+        series = rng.normal(75, 5, n)
+        yield f'n={n}', lambda series=series: prepare_sequences_for_lstm(series, 10), n
+
+
+@case('visualizations', 'visualizations')
+def bench_visualizations(sizes):
+    import visualizations as viz
+    from data import simulate_multi_user_data
+    df = simulate_multi_user_data(5, 2000)
+    df['timestamp'] = pd.to_datetime(df['timestamp'])
+    df['anomaly'] = np.where(np.random.default_rng(SEED).random(len(df)) < 0.05, 'Anomaly', 'Normal')
+    user_df = df[df['user_id'] == 'User_1']
+    recent = user_df.tail(50)
+    builders = {
+        'create_multi_user_time_series': lambda: viz.create_multi_user_time_series(df),
+        'create_multi_metric_dashboard': lambda: viz.create_multi_metric_dashboard(user_df, 'User_1'),
+        'create_anomaly_heatmap': lambda: viz.create_anomaly_heatmap(df.copy()),
+        'create_correlation_matrix': lambda: viz.create_correlation_matrix(df),
+        'create_distribution_plots': lambda: viz.create_distribution_plots(df),
+        'create_prediction_comparison': lambda: viz.create_prediction_comparison(
+            recent['heart_rate'], recent['heart_rate'] + 1, recent['timestamp']),
+        'create_metric_cards_data': lambda: viz.create_metric_cards_data(df, 'User_1'),
+    }
+    for name, build in builders.items():
+        yield name, build, len(df)
+
+
+@case('live_monitor', 'visualizations')
+def bench_live_monitor(sizes):
+    import visualizations as viz
+    from data import get_user_health_df
+    from live_monitor import LiveMonitor
+    from vitals_store import append_user_vitals, write_user_vitals
+    users = [f'wall_{i}' for i in range(50)]
+    history = synthetic_history(10_000)
+    for user_id in users:
+        write_user_vitals(user_id, history)
+    monitor = LiveMonitor(users)
+    monitor.refresh()
+    clock = iter(pd.date_range(history[-1]['timestamp'], periods=10**6, freq='s')[1:])
+
+    def refresh():
+        # One new reading per patient, then the wall's delta refresh and figure updates
+        ts = next(clock).isoformat()
+        for i, user_id in enumerate(users):
+            append_user_vitals(user_id, [{'timestamp': ts, **reading(i)}])
+        monitor.refresh()
+        for feed in monitor.feeds.values():
+            feed.sparkline().to_plotly_json()
+
+    def rebuild():
+        for user_id in users:
+            df = get_user_health_df(user_id)
+            viz.create_metric_cards_data(df)
+            viz.create_multi_metric_dashboard(df.tail(monitor.window), user_id).to_plotly_json()
+
+    yield '50 patients delta refresh', refresh, len(users)
+    yield '50 patients full rebuild', rebuild, len(users)
+
+
+# --- Runner ------------------------------------------------------------------
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sizes, repeat, only=None):
+    results = []
+    workdir = tempfile.mkdtemp(prefix='health-bench-')
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        for spec in CASES:
+            if only and spec['group'] not in only and spec['name'] not in only:
+                continue
+            np.random.seed(SEED)
+            for label, fn, items in spec['build'](sizes):
+                np.random.seed(SEED)
+                result = {'case': spec['name'], 'variant': label, 'group': spec['group'],
+                          **measure(fn, items, repeat)}
+                results.append(result)
+                print(f"{spec['name']:<30}{label:<34}{result['p50_ms']:>10.2f}{result['p99_ms']:>10.2f}"
+                      f"{result['throughput_per_s'] or 0:>14,.0f}{result['peak_mb']:>10.1f}", flush=True)
+    finally:
+        os.chdir(cwd)
+    return {
+        'meta': {
+            'commit': git_commit(),
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'sizes': sizes,
+            'repeat': repeat,
+            'seed': SEED,
+        },
+        'results': results,
+    }
+
+
+def compare(baseline_file, current_file, threshold):
+    """Print p50/peak-memory changes per case; returns True if anything regressed"""
+    with open(baseline_file) as f:
+        baseline = {(r['case'], r['variant']): r for r in json.load(f)['results']}
+    with open(current_file) as f:
+        current = json.load(f)['results']
+
+    regressed = False
+    print(f"{'case':<30}{'variant':<34}{'p50 ms':>18}{'change':>9}{'peak MB':>16}{'change':>9}")
+    for r in current:
+        base = baseline.get((r['case'], r['variant']))
+        if base is None:
+            continue
+        time_change = r['p50_ms'] / base['p50_ms'] - 1 if base['p50_ms'] else 0.0
+        mem_change = r['peak_mb'] / base['peak_mb'] - 1 if base['peak_mb'] else 0.0
+        flag = ''
+        if time_change > threshold or mem_change > threshold:
+            flag = '  REGRESSION'
+            regressed = True
+        print(f"{r['case']:<30}{r['variant']:<34}{base['p50_ms']:>8.2f} -> {r['p50_ms']:<8.2f}{time_change:>+8.0%} "
+              f"{base['peak_mb']:>6.1f} -> {r['peak_mb']:<6.1f}{mem_change:>+8.0%}{flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default=','.join(str(s) for s in DEFAULT_SIZES),
+                        help='history sizes for the data cases (comma separated)')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--only', help='comma separated case names or groups')
+    parser.add_argument('--output', help='results file (default benchmarks/results/<commit>.json)')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'))
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='relative slowdown or memory growth counted as a regression')
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(*args.compare, args.threshold) else 0)
+
+    sizes = [int(s) for s in args.sizes.split(',') if s]
+    only = set(args.only.split(',')) if args.only else None
+    print(f"{'case':<30}{'variant':<34}{'p50 ms':>10}{'p99 ms':>10}{'items/s':>14}{'peak MB':>10}")
+    report = run(sizes, args.repeat, only)
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{report['meta']['commit'] or 'results'}.json")
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+"""Sweep anomaly detectors and settings against labelled simulated data.
+
+Usage:
+  python benchmarks/eval_anomaly_detectors.py [--users 10] [--minutes 3000] [--anomaly-rate 0.05]
+                                              [--recall-target 0.8] [--detectors isolation_forest,lof,elliptic]
+                                              [--output results.json]
+
+Each configuration is fitted on a training split (labels unused) and scored on a
+held-out split. The report lists precision/recall/F1, recall per injected anomaly
+type, training and scoring throughput, and picks the fastest configuration that
+meets the recall target.
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+
+# simulate_health_data seeds numpy from hash(user_id); pin string hashing so runs repeat
+HASH_SEED = '0'
+if os.environ.get('PYTHONHASHSEED') != HASH_SEED:
+    os.environ['PYTHONHASHSEED'] = HASH_SEED
+    os.execv(sys.executable, [sys.executable] + sys.argv)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from sklearn.covariance import EllipticEnvelope
+from sklearn.ensemble import IsolationForest
+from sklearn.model_selection import train_test_split
+from sklearn.neighbors import LocalOutlierFactor
+
+from data import simulate_multi_user_data
+from models import anomaly_scores
+from utils import preprocess_data
+
+SEED = 42
+
+FEATURE_SETS = {
+    'vitals': ['heart_rate', 'blood_oxygen', 'temperature', 'respiration_rate'],
+    'vitals+activity': ['heart_rate', 'blood_oxygen', 'temperature', 'respiration_rate', 'activity_level_encoded'],
+    'hr+o2+resp': ['heart_rate', 'blood_oxygen', 'respiration_rate'],
+}
+
+CONTAMINATION_GRID = [0.03, 0.05, 0.08]
+
+
+def detector_grid(names):
+    """(detector name, settings, factory) for every configuration in the sweep"""
+    grid = []
+    if 'isolation_forest' in names:
+        for n_estimators, max_samples, contamination in itertools.product(
+                [25, 50, 100, 200], [64, 256, 'auto'], CONTAMINATION_GRID):
+            settings = {'n_estimators': n_estimators, 'max_samples': max_samples, 'contamination': contamination}
+            grid.append(('isolation_forest', settings,
+                         lambda s=settings: IsolationForest(random_state=SEED, n_jobs=1, **s)))
+    if 'lof' in names:
+        for n_neighbors, contamination in itertools.product([10, 20, 50], CONTAMINATION_GRID):
+            settings = {'n_neighbors': n_neighbors, 'contamination': contamination}
+            grid.append(('lof', settings, lambda s=settings: LocalOutlierFactor(novelty=True, **s)))
+    if 'elliptic' in names:
+        for contamination in CONTAMINATION_GRID:
+            settings = {'contamination': contamination}
+            grid.append(('elliptic', settings,
+                         lambda s=settings: EllipticEnvelope(random_state=SEED, **s)))
+    return grid
+
+
+def load_dataset(users, minutes, anomaly_rate):
+    df = simulate_multi_user_data(users, minutes, anomaly_rate, include_labels=True)
+    df_processed, _, _ = preprocess_data(df)
+    return df_processed, df['is_anomaly'].to_numpy(dtype=bool), df['anomaly_type'].astype(object).fillna('normal').to_numpy()
+
+
+def evaluate(detector, train_X, test_X, test_labels, test_types):
+    start = time.perf_counter()
+    detector.fit(train_X)
+    fit_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    detected = detector.predict(test_X) == -1
+    score_seconds = time.perf_counter() - start
+
+    result = anomaly_scores(test_labels, detected)
+    result['recall_by_type'] = {
+        kind: round(float(detected[test_types == kind].mean()), 4)
+        for kind in sorted(set(test_types)) if kind != 'normal'
+    }
+    result.update({
+        'fit_seconds': fit_seconds,
+        'score_seconds': score_seconds,
+        'train_rows_per_s': len(train_X) / fit_seconds,
+        'score_rows_per_s': len(test_X) / score_seconds,
+    })
+    return result
+
+
+def run(users, minutes, anomaly_rate, detectors, test_size=0.3):
+    df, labels, types = load_dataset(users, minutes, anomaly_rate)
+    indices = np.arange(len(df))
+    train_idx, test_idx = train_test_split(indices, test_size=test_size, random_state=SEED, stratify=labels)
+
+    results = []
+    for feature_set, columns in FEATURE_SETS.items():
+        X = df[columns].to_numpy(dtype=np.float64)
+        # Scale with training statistics only
+        mean, std = X[train_idx].mean(axis=0), X[train_idx].std(axis=0)
+        X = (X - mean) / np.where(std == 0, 1, std)
+        for name, settings, factory in detector_grid(detectors):
+            result = evaluate(factory(), X[train_idx], X[test_idx], labels[test_idx], types[test_idx])
+            results.append({'detector': name, 'feature_set': feature_set, 'settings': settings, **result})
+    return {'rows': len(df), 'train_rows': len(train_idx), 'test_rows': len(test_idx),
+            'anomalies': int(labels.sum()), 'results': results}
+
+
+def select_fastest(results, recall_target, min_precision=0.0, optimize='total'):
+    """Fastest configuration with recall >= target (and precision >= min_precision), or None"""
+    key = {
+        'total': lambda r: r['fit_seconds'] + r['score_seconds'],
+        'score': lambda r: r['score_seconds'],
+        'fit': lambda r: r['fit_seconds'],
+    }[optimize]
+    eligible = [r for r in results if r['recall'] >= recall_target and r['precision'] >= min_precision]
+    return min(eligible, key=key) if eligible else None
+
+
+def describe(result):
+    settings = ', '.join(f'{k}={v}' for k, v in result['settings'].items())
+    return f"{result['detector']} [{result['feature_set']}] {settings}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--minutes', type=int, default=3000)
+    parser.add_argument('--anomaly-rate', type=float, default=0.05)
+    parser.add_argument('--recall-target', type=float, default=0.8)
+    parser.add_argument('--min-precision', type=float, default=0.0)
+    parser.add_argument('--optimize', choices=['total', 'score', 'fit'], default='total',
+                        help='which time the chosen configuration should minimise')
+    parser.add_argument('--detectors', default='isolation_forest,lof,elliptic')
+    parser.add_argument('--output', help='write all results as JSON')
+    args = parser.parse_args()
+
+    report = run(args.users, args.minutes, args.anomaly_rate, set(args.detectors.split(',')))
+    results = sorted(report['results'], key=lambda r: (-r['f1'], r['fit_seconds'] + r['score_seconds']))
+    print(f"{report['rows']} rows ({report['anomalies']} labelled anomalies), "
+          f"{report['train_rows']} train / {report['test_rows']} test")
+    print(f"{'configuration':<78}{'prec':>6}{'recall':>7}{'f1':>6}{'fit ms':>9}{'score rows/s':>14}")
+    for r in results:
+        print(f"{describe(r):<78}{r['precision']:>6.2f}{r['recall']:>7.2f}{r['f1']:>6.2f}"
+              f"{r['fit_seconds'] * 1000:>9.1f}{r['score_rows_per_s']:>14,.0f}")
+
+    best = select_fastest(report['results'], args.recall_target, args.min_precision, args.optimize)
+    print()
+    if best is None:
+        print(f"No configuration reaches recall {args.recall_target:.2f}")
+    else:
+        print(f"Fastest with recall >= {args.recall_target:.2f}: {describe(best)}")
+        print(f"  precision {best['precision']:.3f}, recall {best['recall']:.3f}, f1 {best['f1']:.3f}, "
+              f"fit {best['fit_seconds'] * 1000:.1f} ms, scoring {best['score_rows_per_s']:,.0f} rows/s")
+        print(f"  recall by type: {best['recall_by_type']}")
+    report['selected'] = best
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
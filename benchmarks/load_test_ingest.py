@@ -0,0 +1,221 @@
+"""Load-test the ingest service and report ingest latency percentiles.
+
+Usage:
+  python benchmarks/load_test_ingest.py --spawn [--rate 5000] [--duration 20] [--users 200]
+                                        [--concurrency 32] [--per-request 1] [--mode http|ws]
+  python benchmarks/load_test_ingest.py --url http://127.0.0.1:8765 ...
+
+--spawn starts ingest_service.py in a temporary directory so its stores start empty.
+Requests are paced open-loop at --rate readings/s; latency is measured from the
+scheduled send time, so a stalled server shows up in the tail instead of slowing
+the client down. A dashboard subscriber measures reading-to-publish lag.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import aiohttp
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_reading(user_id, rng):
+    """Plausible vitals with an occasional out-of-range value"""
+    reading = {
+        'user_id': user_id,
+        'timestamp': datetime.now().isoformat(),
+        'heart_rate': int(rng.gauss(75, 8)),
+        'blood_oxygen': min(100, int(rng.gauss(97, 1.5))),
+        'temperature': round(rng.gauss(36.8, 0.3), 1),
+        'respiration_rate': int(rng.gauss(16, 2)),
+        'activity_level': rng.choice(['low', 'moderate', 'high']),
+    }
+    if rng.random() < 0.02:
+        reading['heart_rate'] = rng.choice([38, 150])
+    return reading
+
+
+def percentiles(values_ms):
+    if not values_ms:
+        return {}
+    values = np.asarray(values_ms)
+    return {'p50': float(np.percentile(values, 50)), 'p95': float(np.percentile(values, 95)),
+            'p99': float(np.percentile(values, 99)), 'max': float(values.max())}
+
+
+async def http_worker(session, url, schedule, users, per_request, rng, latencies, errors):
+    for scheduled in schedule:
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        body = [make_reading(rng.choice(users), rng) for _ in range(per_request)]
+        try:
+            async with session.post(f'{url}/readings', json=body) as response:
+                await response.read()
+                ok = response.status == 202
+        except aiohttp.ClientError:
+            ok = False
+        latencies.append((time.perf_counter() - scheduled) * 1000)
+        if not ok:
+            errors.append(1)
+
+
+async def ws_worker(session, url, schedule, users, per_request, rng, latencies, errors):
+    async with session.ws_connect(f"{url.replace('http', 'ws', 1)}/ingest") as ws:
+        for scheduled in schedule:
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await ws.send_str(json.dumps([make_reading(rng.choice(users), rng) for _ in range(per_request)]))
+            ack = await ws.receive_json()
+            latencies.append((time.perf_counter() - scheduled) * 1000)
+            if 'error' in ack:
+                errors.append(1)
+
+
+async def subscribe(session, url, lags, ready):
+    """Reading timestamp -> publish lag for every reading event seen"""
+    async with session.ws_connect(f"{url.replace('http', 'ws', 1)}/subscribe") as ws:
+        ready.set()
+        async for msg in ws:
+            if msg.type != aiohttp.WSMsgType.TEXT:
+                break
+            event = json.loads(msg.data)
+            if event['type'] == 'readings':
+                now = datetime.now()
+                lags.extend((now - datetime.fromisoformat(r['timestamp'])).total_seconds() * 1000
+                            for r in event['readings'])
+
+
+async def wait_for_drain(session, url, timeout=120):
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        async with session.get(f'{url}/stats') as response:
+            stats = await response.json()
+        if stats['queued'] == 0 and stats['written'] + stats['failed_batches'] >= stats['accepted']:
+            return stats, time.perf_counter() - start
+        await asyncio.sleep(0.1)
+    return stats, None
+
+
+async def run(args):
+    users = [f'User_{i + 1}' for i in range(args.users)]
+    requests_total = int(args.rate * args.duration / args.per_request)
+    interval = args.per_request / args.rate
+    start = time.perf_counter() + 0.5
+    # Round-robin the global send schedule over the workers
+    schedules = [[start + i * interval for i in range(w, requests_total, args.concurrency)]
+                 for w in range(args.concurrency)]
+
+    latencies, errors, lags = [], [], []
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        ready = asyncio.Event()
+        subscriber = asyncio.create_task(subscribe(session, args.url, lags, ready))
+        await ready.wait()
+
+        worker = http_worker if args.mode == 'http' else ws_worker
+        began = time.perf_counter()
+        await asyncio.gather(*[
+            worker(session, args.url, schedule, users, args.per_request, random.Random(args.seed + w),
+                   latencies, errors)
+            for w, schedule in enumerate(schedules)])
+        elapsed = time.perf_counter() - began
+
+        stats, drain_seconds = await wait_for_drain(session, args.url)
+        await asyncio.sleep(0.2)
+        subscriber.cancel()
+
+    readings = len(latencies) * args.per_request
+    return {
+        'mode': args.mode,
+        'target_rate': args.rate,
+        'requests': len(latencies),
+        'readings': readings,
+        'errors': len(errors),
+        'readings_per_s': readings / elapsed,
+        'ingest_latency_ms': percentiles(latencies),
+        'publish_lag_ms': percentiles(lags),
+        'drain_seconds': drain_seconds,
+        'server': stats,
+    }
+
+
+def spawn_service(port, workdir):
+    env = dict(os.environ, INGEST_PORT=str(port))
+    process = subprocess.Popen([sys.executable, os.path.join(REPO_ROOT, 'ingest_service.py'), '--port', str(port)],
+                               cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f'http://127.0.0.1:{port}'
+
+    async def wait_ready():
+        async with aiohttp.ClientSession() as session:
+            for _ in range(600):
+                try:
+                    async with session.get(f'{url}/stats') as response:
+                        if response.status == 200:
+                            return True
+                except aiohttp.ClientError:
+                    pass
+                if process.poll() is not None:
+                    return False
+                await asyncio.sleep(0.1)
+        return False
+
+    if not asyncio.run(wait_ready()):
+        process.kill()
+        raise SystemExit('ingest service did not start')
+    return process, url
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='http://127.0.0.1:8765')
+    parser.add_argument('--spawn', action='store_true', help='run the service in a temporary directory')
+    parser.add_argument('--port', type=int, default=8765, help='port for --spawn')
+    parser.add_argument('--mode', choices=['http', 'ws'], default='http')
+    parser.add_argument('--rate', type=float, default=5000, help='target readings per second')
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--per-request', type=int, default=1, help='readings per request/frame')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the report as JSON')
+    args = parser.parse_args()
+
+    process = None
+    with tempfile.TemporaryDirectory() as workdir:
+        if args.spawn:
+            process, args.url = spawn_service(args.port, workdir)
+        try:
+            report = asyncio.run(run(args))
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait(timeout=60)
+
+    latency, lag = report['ingest_latency_ms'], report['publish_lag_ms']
+    print(f"{report['readings']:,} readings in {report['requests']:,} {args.mode} requests "
+          f"({report['readings_per_s']:,.0f} readings/s, target {args.rate:,.0f}), {report['errors']} errors")
+    print(f"ingest latency ms: p50 {latency['p50']:.2f}  p95 {latency['p95']:.2f}  "
+          f"p99 {latency['p99']:.2f}  max {latency['max']:.2f}")
+    if lag:
+        print(f"reading -> dashboard lag ms: p50 {lag['p50']:.1f}  p99 {lag['p99']:.1f}  max {lag['max']:.1f}")
+    server = report['server']
+    print(f"server: {server['batches']} batches, batch ms {server['batch_ms']}, "
+          f"{server['alerts']} alerts, {server['anomalies']} anomalies, drained in {report['drain_seconds']}s")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
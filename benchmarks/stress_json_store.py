@@ -0,0 +1,103 @@
+"""Stress the JSON stores with concurrent writers and check that no record is lost.
+
+Usage: python benchmarks/stress_json_store.py [--processes 8] [--threads 4] [--records 50]
+
+Every thread of every writer process appends its own numbered records through
+append_json_record and bumps a shared counter through update_json_file, while a
+reader process keeps loading the file to make sure it never sees a torn write.
+Exits non-zero if any record or increment is missing or duplicated.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import append_json_record, update_json_file, load_data_from_json
+
+
+def write(filename, process, threads, records):
+    def append_records(thread):
+        key = f'p{process}'
+        for i in range(records):
+            append_json_record(filename, key, {'thread': thread, 'seq': i})
+            update_json_file(filename, lambda data: data.update(counter=data.get('counter', 0) + 1))
+
+    workers = [threading.Thread(target=append_records, args=(t,)) for t in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+def read(filename, stop, errors):
+    while not stop.is_set():
+        try:
+            load_data_from_json(filename)
+        except Exception as e:
+            errors.put(repr(e))
+            return
+
+
+def check(data, processes, threads, records):
+    """Problems found in the final store (empty when every write landed exactly once)"""
+    problems = []
+    expected = {(t, i) for t in range(threads) for i in range(records)}
+    for process in range(processes):
+        stored = [(r['thread'], r['seq']) for r in data.get(f'p{process}', [])]
+        missing = expected - set(stored)
+        duplicates = len(stored) - len(set(stored))
+        if missing or duplicates:
+            problems.append(f'process {process}: {len(missing)} missing, {duplicates} duplicated')
+    if data.get('counter') != processes * threads * records:
+        problems.append(f"counter is {data.get('counter')}, expected {processes * threads * records}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--processes', type=int, default=8)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--records', type=int, default=50)
+    args = parser.parse_args()
+
+    # Separate interpreters, like several Streamlit server processes sharing the files
+    ctx = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, 'health_data.json')
+        stop, errors = ctx.Event(), ctx.Queue()
+        reader = ctx.Process(target=read, args=(filename, stop, errors))
+        writers = [ctx.Process(target=write, args=(filename, p, args.threads, args.records))
+                   for p in range(args.processes)]
+
+        start = time.perf_counter()
+        reader.start()
+        for writer in writers:
+            writer.start()
+        for writer in writers:
+            writer.join()
+        elapsed = time.perf_counter() - start
+        stop.set()
+        reader.join()
+
+        problems = check(load_data_from_json(filename), args.processes, args.threads, args.records)
+        problems += [f'process exited with {w.exitcode}' for w in writers if w.exitcode]
+        if not errors.empty():
+            problems.append(f'reader saw a torn file: {errors.get()}')
+
+    writes = args.processes * args.threads * args.records
+    print(f"{args.processes} processes x {args.threads} threads: {writes} appends and {writes} "
+          f"counter updates in {elapsed:.1f}s")
+    if problems:
+        for problem in problems:
+            print(f"FAIL {problem}")
+        sys.exit(1)
+    print("OK: no records lost or duplicated")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+import os
+import sys
+import pickle
+import threading
+import functools
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from data import simulate_health_data, get_user_health_df, HEALTH_DATA_FILE
+from schema import compact_vitals_frame
+from utils import preprocess_data
+from vitals_store import user_store_path
+from models import detect_anomalies_with_evaluation
+from visualizations import (create_multi_user_time_series, create_anomaly_heatmap,
+                            create_correlation_matrix, create_distribution_plots)
+try:
+    import streamlit as st
+    STREAMLIT_AVAILABLE = True
+except ImportError:
+    STREAMLIT_AVAILABLE = False
+
+
+def estimate_size(value):
+    """Approximate in-memory size of a cached value in bytes"""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_size(v) for v in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(v) for v in value.values())
+    if isinstance(value, (str, bytes, int, float, bool)) or value is None:
+        return sys.getsizeof(value)
+    try:
+        return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return sys.getsizeof(value)
+
+
+class BoundedLRUCache:
+    """Thread-safe LRU cache that evicts least recently used entries past max_bytes"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Return (found, value)"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, self._entries[key][0]
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value):
+        size = estimate_size(value)
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+# Process-wide cache shared by all Streamlit sessions
+pipeline_cache = BoundedLRUCache(int(float(os.getenv('CACHE_MAX_MB', 256)) * 1024 * 1024))
+
+
+def data_version(*filenames):
+    """Cheap version stamp for files backing a cached result"""
+    version = []
+    for filename in filenames:
+        try:
+            stat = os.stat(filename)
+            version.append((filename, stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            version.append((filename, None, None))
+    return tuple(version)
+
+
+def _copy_on_write():
+    # Always on from pandas 3; opt-in on pandas 2 (the option is deprecated in 3, so not read there)
+    return int(pd.__version__.split('.')[0]) >= 3 or pd.get_option('mode.copy_on_write') is True
+
+
+def detached(value):
+    """
+    Copy of a cached value that callers can mutate without touching the cache entry
+    Containers are copied recursively and arrays in full; DataFrames get a shallow
+    copy under copy-on-write (which keeps it apart from the cached frame) and a deep
+    copy otherwise. Other objects (fitted models, figures) are shared.
+    """
+    if isinstance(value, pd.DataFrame):
+        return value.copy(deep=not _copy_on_write())
+    if isinstance(value, np.ndarray):
+        return value.copy()
+    if isinstance(value, dict):
+        return {k: detached(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(detached(v) for v in value)
+    return value
+
+
+def memoize(cache=None, version_fn=None):
+    """Cache a function's results keyed on its arguments and an optional data version"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            target = cache or pipeline_cache
+            key = (func.__module__, func.__qualname__, args, tuple(sorted(kwargs.items())),
+                   version_fn(*args, **kwargs) if version_fn else None)
+            found, value = target.get(key)
+            if not found:
+                value = func(*args, **kwargs)
+                target.put(key, value)
+            # Callers may add columns (e.g. create_anomaly_heatmap) or edit records; keep the entry intact
+            return detached(value)
+        return wrapper
+    return decorator
+
+
+def _cache_resource(max_entries):
+    """st.cache_resource when Streamlit is installed, otherwise the shared LRU cache"""
+    if STREAMLIT_AVAILABLE:
+        return st.cache_resource(max_entries=max_entries, show_spinner=False)
+    return memoize()
+
+
+# Simulation: cached per user so parameter sweeps reuse users generated earlier
+@memoize()
+def cached_user_simulation(user_id, minutes, anomaly_rate):
+    return simulate_health_data(user_id, minutes, True, anomaly_rate)
+
+
+@memoize()
+def cached_multi_user_data(num_users=3, minutes_per_user=300, contamination=0.05):
+    """Cached equivalent of data.simulate_multi_user_data"""
+    all_data = []
+    for i in range(num_users):
+        all_data.extend(cached_user_simulation(f"User_{i+1}", minutes_per_user, contamination))
+    return compact_vitals_frame(pd.DataFrame(all_data))
+
+
+@memoize()
+def cached_preprocessed(num_users, minutes_per_user, contamination):
+    # Rolling-window features let the model see trends, not just the latest vitals
+    return preprocess_data(cached_multi_user_data(num_users, minutes_per_user, contamination), include_rolling=True)
+
+
+@_cache_resource(max_entries=32)
+def cached_anomaly_detection(num_users, minutes_per_user, contamination):
+    """(predictions, fitted IsolationForest, metrics) for a simulation setting"""
+    _, df_scaled, _ = cached_preprocessed(num_users, minutes_per_user, contamination)
+    return detect_anomalies_with_evaluation(df_scaled, contamination)
+
+
+@memoize()
+def run_anomaly_pipeline(num_users, minutes_per_user, contamination):
+    """Simulated data labelled with anomalies, plus the model and metrics"""
+    df_processed, df_scaled, features = cached_preprocessed(num_users, minutes_per_user, contamination)
+    preds, model, metrics = cached_anomaly_detection(num_users, minutes_per_user, contamination)
+    df_result = df_processed.copy()
+    df_result['anomaly'] = np.where(preds == -1, 'Anomaly', 'Normal')
+    return {
+        'df': df_result,
+        'df_scaled': df_scaled,
+        'features': features,
+        'predictions': preds,
+        'model': model,
+        'metrics': metrics,
+    }
+
+
+@memoize()
+def cached_anomaly_figures(num_users, minutes_per_user, contamination, metric='heart_rate'):
+    """Plotly figures for the anomaly detection view"""
+    df = run_anomaly_pipeline(num_users, minutes_per_user, contamination)['df']
+    return {
+        'time_series': create_multi_user_time_series(df, metric),
+        'heatmap': create_anomaly_heatmap(df.copy(deep=False)),
+        'correlation': create_correlation_matrix(df),
+        'distribution': create_distribution_plots(df, metric),
+    }
+
+
+# Stored history: keyed on the backing files so new readings invalidate the entry
+def _user_history_version(user_id, start=None, end=None):
+    return data_version(HEALTH_DATA_FILE, user_store_path(user_id))
+
+
+@memoize(version_fn=_user_history_version)
+def cached_user_health_df(user_id, start=None, end=None):
+    return get_user_health_df(user_id, start, end)
+
+
+def clear_caches():
+    pipeline_cache.clear()
+    if STREAMLIT_AVAILABLE:
+        cached_anomaly_detection.clear()
@@ -1,12 +1,89 @@
-from chatterbot import ChatBot
-from chatterbot.trainers import ChatterBotCorpusTrainer
+import os
+import re
+import sqlite3
+import threading
+from functools import lru_cache
+import numpy as np
 
-# Initialize ChatBot
-chatbot = ChatBot('HealthBot')
+# Versioned, read-only response database built once by `python chatbot.py`
+CHATBOT_INDEX_VERSION = 1
+CHATBOT_CORPUS = 'chatterbot.corpus.english'
+CHATBOT_DB_FILE = f'chatbot_index_v{CHATBOT_INDEX_VERSION}.sqlite3'
 
-# Train the chatbot with English corpus
-trainer = ChatterBotCorpusTrainer(chatbot)
-trainer.train('chatterbot.corpus.english')
+_response_index = None
+_index_lock = threading.Lock()
+
+def build_chatbot_index(db_file=CHATBOT_DB_FILE, corpus=CHATBOT_CORPUS):
+    """Train the corpus into a fresh database (offline, one time)"""
+    from chatterbot import ChatBot
+    from chatterbot.trainers import ChatterBotCorpusTrainer
+
+    tmp_file = db_file + '.building'
+    if os.path.exists(tmp_file):
+        os.remove(tmp_file)
+    chatbot = ChatBot('HealthBot', database_uri=f'sqlite:///{tmp_file}')
+    trainer = ChatterBotCorpusTrainer(chatbot)
+    trainer.train(corpus)
+    chatbot.storage.engine.dispose()
+    # Publish only a complete index
+    os.replace(tmp_file, db_file)
+    return db_file
+
+def load_statement_pairs(db_file=CHATBOT_DB_FILE):
+    """(prompt, response) pairs from the trained statement table, first response per prompt"""
+    conn = sqlite3.connect(f'file:{db_file}?mode=ro', uri=True)
+    try:
+        rows = conn.execute(
+            "SELECT in_response_to, text FROM statement "
+            "WHERE in_response_to IS NOT NULL AND in_response_to != '' ORDER BY id"
+        ).fetchall()
+    finally:
+        conn.close()
+    pairs = {}
+    for prompt, response in rows:
+        pairs.setdefault(prompt, response)
+    return list(pairs.items())
+
+class ResponseIndex:
+    """TF-IDF vectors of known prompts; a query returns the response of its nearest prompt"""
+
+    def __init__(self, pairs):
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        prompts = [normalize_query(p) for p, _ in pairs]
+        self.responses = [r for _, r in pairs]
+        vectorizer = TfidfVectorizer(analyzer='char_wb', ngram_range=(2, 4), sublinear_tf=True)
+        # Dense term x prompt matrix with unit-length prompt columns; the query norm
+        # does not change the argmax, so a dot product ranks by cosine similarity
+        self.matrix = np.ascontiguousarray(vectorizer.fit_transform(prompts).T.toarray(), dtype=np.float32)
+        self.vocabulary = vectorizer.vocabulary_
+        self.idf = vectorizer.idf_.astype(np.float32)
+        self.analyze = vectorizer.build_analyzer()
+
+    def lookup(self, query):
+        # Same weighting as TfidfVectorizer.transform, without its per-call overhead
+        counts = {}
+        for term in self.analyze(query):
+            col = self.vocabulary.get(term)
+            if col is not None:
+                counts[col] = counts.get(col, 0) + 1
+        if not counts:
+            return self.responses[0]
+        cols = np.fromiter(counts.keys(), dtype=np.intp, count=len(counts))
+        weights = (1 + np.log(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))) * self.idf[cols]
+        scores = weights @ self.matrix[cols]
+        return self.responses[int(np.argmax(scores))]
+
+def get_response_index():
+    """Build the in-memory index lazily from the prebuilt database"""
+    global _response_index
+    if _response_index is None:
+        with _index_lock:
+            if _response_index is None:
+                if not os.path.exists(CHATBOT_DB_FILE):
+                    print(f"⚠️ Chatbot index {CHATBOT_DB_FILE} not found. Building it once (python chatbot.py).")
+                    build_chatbot_index()
+                _response_index = ResponseIndex(load_statement_pairs())
+    return _response_index
 
 # Health-specific responses (extend as needed)
 health_responses = {
@@ -17,18 +94,38 @@ health_responses = {
     "default": "I'm here to help with health questions. Please provide more details."
 }
 
+# Single pass over the input for all health intents; order sets priority
+HEALTH_INTENTS = [
+    ('symptoms', 'symptom'),
+    ('fever', 'fever'),
+    ('headache', 'headache'),
+    ('chest_pain', 'chest pain'),
+]
+HEALTH_INTENT_RESPONSES = {
+    'symptoms': health_responses["symptoms"],
+    'fever': health_responses["fever"],
+    'headache': health_responses["headache"],
+    'chest_pain': health_responses["chest pain"],
+}
+_intent_pattern = re.compile('|'.join(f'(?P<{name}>{re.escape(keyword)})' for name, keyword in HEALTH_INTENTS))
+
+def normalize_query(text):
+    return ' '.join(text.lower().split())
+
+def match_health_intent(input_lower):
+    found = {m.lastgroup for m in _intent_pattern.finditer(input_lower)}
+    for name, _ in HEALTH_INTENTS:
+        if name in found:
+            return HEALTH_INTENT_RESPONSES[name]
+    return health_responses["default"]
+
+@lru_cache(maxsize=4096)
+def _cached_response(normalized_input):
+    response = get_response_index().lookup(normalized_input)
+    return response + " " + match_health_intent(normalized_input)
+
 def get_response(user_input):
-    response = str(chatbot.get_response(user_input))
-    # Add health-specific logic
-    input_lower = user_input.lower()
-    if "symptom" in input_lower:
-        response += " " + health_responses["symptoms"]
-    elif "fever" in input_lower:
-        response += " " + health_responses["fever"]
-    elif "headache" in input_lower:
-        response += " " + health_responses["headache"]
-    elif "chest pain" in input_lower:
-        response += " " + health_responses["chest pain"]
-    else:
-        response += " " + health_responses["default"]
-    return response
+    return _cached_response(normalize_query(user_input))
+
+if __name__ == '__main__':
+    print(f"Built {build_chatbot_index()} from {CHATBOT_CORPUS}")
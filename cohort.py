@@ -0,0 +1,144 @@
+import heapq
+import threading
+from collections import deque
+from datetime import datetime
+import numpy as np
+from models import predict_risks_batch, calculate_health_score_batch, SEVERITY_LEVELS
+
+# Readings considered for each patient's anomaly rate
+ANOMALY_WINDOW = 100
+
+
+class AtRiskIndex:
+    """
+    Cohort ranking of patients, sickest first
+    Order: highest active severity, then lowest latest health score, then highest anomaly rate.
+    Updates push onto a heap with lazy invalidation (O(log n)); queries walk the heap
+    in order, touching O((offset + limit) log) entries instead of sorting the panel.
+    """
+
+    def __init__(self, anomaly_window=ANOMALY_WINDOW):
+        self.anomaly_window = anomaly_window
+        self._heap = []
+        self._patients = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._patients)
+
+    @staticmethod
+    def _rank_key(entry):
+        return (-entry['severity'], entry['health_score'], -entry['anomaly_rate'])
+
+    def update(self, user_id, vitals_rows, anomaly_labels=None, timestamp=None):
+        """
+        Fold new readings for one patient into the index
+        vitals_rows: DataFrame or dict of columns (last row is the latest reading)
+        anomaly_labels: optional iterable of booleans, one per row
+        """
+        scores = calculate_health_score_batch(vitals_rows)
+        if len(scores) == 0:
+            return
+        _, _, max_severity = predict_risks_batch(vitals_rows)
+
+        with self._lock:
+            entry = self._patients.get(user_id)
+            if entry is None:
+                entry = {'user_id': user_id, 'version': 0, 'labels': deque(maxlen=self.anomaly_window),
+                         'anomaly_count': 0}
+                self._patients[user_id] = entry
+            if anomaly_labels is not None:
+                labels = entry['labels']
+                for label in anomaly_labels:
+                    if len(labels) == labels.maxlen:
+                        entry['anomaly_count'] -= labels[0]
+                    labels.append(int(bool(label)))
+                    entry['anomaly_count'] += int(bool(label))
+            entry['health_score'] = float(scores[-1])
+            entry['severity'] = int(max_severity[-1])
+            entry['anomaly_rate'] = entry['anomaly_count'] / len(entry['labels']) if entry['labels'] else 0.0
+            entry['updated_at'] = timestamp or datetime.now().isoformat()
+            entry['version'] += 1
+            heapq.heappush(self._heap, (self._rank_key(entry), user_id, entry['version']))
+            self._maybe_compact()
+
+    def update_reading(self, user_id, vitals, is_anomaly=None):
+        """Single-reading convenience wrapper around update()"""
+        row = {k: [v] for k, v in vitals.items() if k in
+               ('heart_rate', 'blood_oxygen', 'temperature', 'respiration_rate')}
+        if not row:
+            return
+        labels = None if is_anomaly is None else [is_anomaly]
+        self.update(user_id, row, labels, vitals.get('timestamp'))
+
+    def remove(self, user_id):
+        with self._lock:
+            self._patients.pop(user_id, None)
+            self._maybe_compact()
+
+    def _maybe_compact(self):
+        # Drop stale heap entries once they outnumber live ones
+        if len(self._heap) > 2 * len(self._patients) + 64:
+            self._heap = [item for item in self._heap if self._is_live(item)]
+            heapq.heapify(self._heap)
+
+    def _is_live(self, item):
+        entry = self._patients.get(item[1])
+        return entry is not None and entry['version'] == item[2]
+
+    def _ranked(self):
+        """Yield live heap items in rank order without mutating the heap"""
+        heap = self._heap
+        if not heap:
+            return
+        frontier = [(heap[0], 0)]
+        while frontier:
+            item, i = heapq.heappop(frontier)
+            if self._is_live(item):
+                yield item
+            for child in (2 * i + 1, 2 * i + 2):
+                if child < len(heap):
+                    heapq.heappush(frontier, (heap[child], child))
+
+    def _public(self, user_id, rank):
+        entry = self._patients[user_id]
+        return {
+            'rank': rank,
+            'user_id': user_id,
+            'health_score': entry['health_score'],
+            'severity': SEVERITY_LEVELS[entry['severity']],
+            'anomaly_rate': round(entry['anomaly_rate'], 4),
+            'updated_at': entry['updated_at'],
+        }
+
+    def page(self, offset=0, limit=20):
+        """Patients ranked offset+1 .. offset+limit"""
+        results = []
+        with self._lock:
+            for rank, item in enumerate(self._ranked(), start=1):
+                if rank > offset + limit:
+                    break
+                if rank > offset:
+                    results.append(self._public(item[1], rank))
+        return results
+
+    def top_at_risk(self, n=10):
+        return self.page(0, n)
+
+    def get(self, user_id):
+        with self._lock:
+            if user_id not in self._patients:
+                return None
+            return {k: v for k, v in self._patients[user_id].items() if k not in ('labels', 'version')}
+
+    def severity_counts(self):
+        with self._lock:
+            counts = np.bincount([e['severity'] for e in self._patients.values()], minlength=len(SEVERITY_LEVELS))
+        return {(SEVERITY_LEVELS[i] or 'NONE'): int(c) for i, c in enumerate(counts)}
+
+
+# Per-process index: seeded from storage by data.seed_at_risk_index, then kept current only by
+# readings written through this process (data.add_health_record / add_health_records). Readings
+# ingested by another process (ingest service, shard workers) appear after that process's own
+# index or a re-seed; sharded deployments query the workers via ShardRouter.top_at_risk.
+at_risk_index = AtRiskIndex()
@@ -1,8 +1,19 @@
+import os
+import threading
 import pandas as pd
 import json
 from datetime import datetime, timedelta
 import numpy as np
-from utils import save_data_to_json, load_data_from_json, encrypt_data, decrypt_data
+from vitals_store import (vitals_store_enabled, user_store_exists, append_user_vitals,
+                          backfill_user_vitals, read_user_vitals, vitals_to_dataframe)
+from cohort import at_risk_index
+from reminders import get_reminder_scheduler, schedule_medication_reminders, schedule_appointment_reminders
+from schedule_index import AppointmentBook, MedicationDoseIndex, DOSE_HORIZON
+from utils import save_data_to_json, load_data_from_json, update_json_file, append_json_record, encrypt_data, decrypt_data
+from instrumentation import timed
+from models import get_anomaly_scorer
+from features import RollingFeatureEngine
+from schema import compact_vitals_frame
 
 # Simulate database with JSON files
 USER_DATA_FILE = 'user_data.json'
@@ -15,18 +26,24 @@ def save_user_data(user_data):
     encrypted_data = encrypt_data(json.dumps(user_data))
     save_data_to_json({'data': encrypted_data}, USER_DATA_FILE)
 
-def load_user_data():
-    data = load_data_from_json(USER_DATA_FILE)
+def _decrypt_users(data):
     if 'data' in data:
         decrypted = decrypt_data(data['data'])
         return json.loads(decrypted)
     return {}
 
+@timed()
+def load_user_data():
+    return _decrypt_users(load_data_from_json(USER_DATA_FILE))
+
 def add_user(username, password, role='Patient', profile=None):
-    users = load_user_data()
-    users[username] = {'password': password, 'role': role, 'profile': profile or {}}
-    save_user_data(users)
+    def update(data):
+        users = _decrypt_users(data)
+        users[username] = {'password': password, 'role': role, 'profile': profile or {}}
+        return {'data': encrypt_data(json.dumps(users))}
+    update_json_file(USER_DATA_FILE, update)
 
+@timed()
 def authenticate_user(username, password):
     users = load_user_data()
     if username in users and users[username]['password'] == password:
@@ -37,16 +54,121 @@ def authenticate_user(username, password):
 def save_health_data(health_data):
     save_data_to_json(health_data, HEALTH_DATA_FILE)
 
-def load_health_data():
-    return load_data_from_json(HEALTH_DATA_FILE)
+@timed()
+def load_health_data(health_file=None):
+    return load_data_from_json(health_file or HEALTH_DATA_FILE)
 
+def ensure_vitals_stores(user_ids, create=False, health_data=None, health_file=None, store_dir=None):
+    """
+    Backfill memory-mapped vitals files from the JSON store for users that have none yet
+    health_data.json is parsed at most once per call, and not at all when every file
+    exists or the caller passes the parsed store. Reads leave no file behind for ids
+    without history. Writers pass create=True so the file exists (possibly empty) before
+    they touch the JSON store; a concurrent reader then never backfills a reading that
+    the writer is about to append. Returns the parsed store, or None if it was not needed.
+    health_file/store_dir: stores other than HEALTH_DATA_FILE and VITALS_STORE_DIR (shards)
+    """
+    for user_id in user_ids:
+        if user_store_exists(user_id, store_dir):
+            continue
+        if health_data is None:
+            health_data = load_health_data(health_file)
+        records = health_data.get(user_id, [])
+        if records or create:
+            backfill_user_vitals(user_id, records, store_dir)
+    return health_data
+
+@timed()
 def add_health_record(user_id, vitals):
-    data = load_health_data()
-    if user_id not in data:
-        data[user_id] = []
     record = {'timestamp': datetime.now().isoformat(), **vitals}
-    data[user_id].append(record)
-    save_health_data(data)
+    if vitals_store_enabled():
+        ensure_vitals_stores([user_id], create=True)
+    labels = _label_readings(user_id, [record])
+    append_json_record(HEALTH_DATA_FILE, user_id, record)
+    if vitals_store_enabled():
+        append_user_vitals(user_id, [record])
+    at_risk_index.update_reading(user_id, record, None if labels is None else bool(labels[0]))
+
+# Rolling features for readings labelled in this process, seeded per patient on first sight
+_live_features = None
+_live_features_warmed = set()
+_live_features_lock = threading.Lock()
+
+def _label_readings(user_id, records, health_file=None, store_dir=None):
+    """
+    Anomaly labels for new (not yet stored) readings, scored on the same rolling features as
+    batch; None while the shared scorer is still fitting in the background.
+    """
+    global _live_features
+    scorer = get_anomaly_scorer(wait=False)
+    if scorer is None:
+        return None
+    with _live_features_lock:
+        if _live_features is None:
+            _live_features = RollingFeatureEngine(scorer.windows)
+        if user_id not in _live_features_warmed:
+            warm_rolling_features(_live_features, [user_id], health_file, store_dir)
+            _live_features_warmed.add(user_id)
+        rolling = _live_features.update_many([user_id] * len(records), records)
+        labels = scorer.score(pd.DataFrame(records), rolling)
+        for record, label in zip(records, labels):
+            if label:
+                _live_features.mark_anomaly(user_id, record.get('timestamp'))
+    return labels
+
+@timed()
+def add_health_records(records_by_user, anomaly_labels_by_user=None, health_file=None, store_dir=None):
+    """
+    Batch form of add_health_record for ingest: one JSON store write for every
+    reading in the batch. records_by_user: user_id -> list of readings with timestamps.
+    anomaly_labels_by_user: user_id -> booleans per reading; users without labels are
+    scored with the shared AnomalyScorer once it is fitted (unlabelled until then).
+    """
+    anomaly_labels_by_user = dict(anomaly_labels_by_user or {})
+    for user_id, records in records_by_user.items():
+        if user_id not in anomaly_labels_by_user:
+            anomaly_labels_by_user[user_id] = _label_readings(user_id, records, health_file, store_dir)
+    if vitals_store_enabled():
+        ensure_vitals_stores(records_by_user, create=True, health_file=health_file, store_dir=store_dir)
+
+    def merge(data):
+        for user_id, records in records_by_user.items():
+            data.setdefault(user_id, []).extend(records)
+    update_json_file(health_file or HEALTH_DATA_FILE, merge)
+
+    for user_id, records in records_by_user.items():
+        if vitals_store_enabled():
+            append_user_vitals(user_id, records, store_dir)
+        columns = {k: [r.get(k) for r in records] for k in
+                   ('heart_rate', 'blood_oxygen', 'temperature', 'respiration_rate') if k in records[-1]}
+        if columns:
+            at_risk_index.update(user_id, columns, anomaly_labels_by_user[user_id], records[-1].get('timestamp'))
+
+def rebuild_at_risk_index(user_ids=None, anomaly_window=None):
+    """Seed the cohort ranking, anomaly rates included, from stored history (see seed_at_risk_index)"""
+    health_data = load_health_data()
+    if user_ids is None:
+        user_ids = list(health_data.keys())
+    window = anomaly_window or at_risk_index.anomaly_window
+    scorer = get_anomaly_scorer()
+    for user_id in user_ids:
+        df = get_user_health_df(user_id, health_data=health_data).tail(window)
+        if not df.empty:
+            at_risk_index.update(user_id, df, scorer.score(df))
+
+_at_risk_seed_thread = None
+
+def seed_at_risk_index():
+    """
+    Rebuild this process's at-risk ranking from stored history once, on a background thread
+    (fits the shared scorer there too). Returns True once seeding has finished.
+    """
+    global _at_risk_seed_thread
+    with _live_features_lock:
+        if _at_risk_seed_thread is None:
+            _at_risk_seed_thread = threading.Thread(target=rebuild_at_risk_index, daemon=True)
+            _at_risk_seed_thread.start()
+    return not _at_risk_seed_thread.is_alive()
 
 # Medications
 def save_medications(medications):
@@ -55,12 +177,40 @@ def save_medications(medications):
 def load_medications():
     return load_data_from_json(MEDICATIONS_FILE)
 
+def _file_version(filename):
+    try:
+        stat = os.stat(filename)
+        return (stat.st_mtime_ns, stat.st_size)
+    except FileNotFoundError:
+        return None
+
+def health_data_version(health_file=None):
+    """Cheap change marker for the JSON health store (None if it does not exist yet)"""
+    return _file_version(health_file or HEALTH_DATA_FILE)
+
+_dose_index = None
+_dose_index_version = None
+
+def get_medication_dose_index(start=None, end=None):
+    """Dose index covering [start, end), rebuilt when medications change or the window moves past it"""
+    global _dose_index, _dose_index_version
+    start = start or datetime.now()
+    end = end or start + timedelta(hours=1)
+    version = _file_version(MEDICATIONS_FILE)
+    if _dose_index is None or version != _dose_index_version or not _dose_index.covers(start, end):
+        _dose_index = MedicationDoseIndex(load_medications(), start, max(end - start, DOSE_HORIZON))
+        _dose_index_version = version
+    return _dose_index
+
+def get_doses_due(start=None, end=None, user_id=None):
+    """Medication doses due in [start, end) (default: the next hour)"""
+    start = start or datetime.now()
+    end = end or start + timedelta(hours=1)
+    return get_medication_dose_index(start, end).due(start, end, user_id)
+
 def add_medication(user_id, med_name, schedule):
-    meds = load_medications()
-    if user_id not in meds:
-        meds[user_id] = []
-    meds[user_id].append({'name': med_name, 'schedule': schedule})
-    save_medications(meds)
+    append_json_record(MEDICATIONS_FILE, user_id, {'name': med_name, 'schedule': schedule})
+    schedule_medication_reminders(get_reminder_scheduler(), user_id, med_name, schedule)
 
 # Appointments
 def save_appointments(appointments):
@@ -69,16 +219,56 @@ def save_appointments(appointments):
 def load_appointments():
     return load_data_from_json(APPOINTMENTS_FILE)
 
-def add_appointment(user_id, doctor, date_time, reason):
-    appts = load_appointments()
-    if user_id not in appts:
-        appts[user_id] = []
-    appts[user_id].append({'doctor': doctor, 'date_time': date_time, 'reason': reason})
-    save_appointments(appts)
+_appointment_book = None
+_appointment_book_version = None
+
+def get_appointment_book():
+    """Time/doctor/user-indexed appointments, rebuilt only when appointments.json changes"""
+    global _appointment_book, _appointment_book_version
+    version = _file_version(APPOINTMENTS_FILE)
+    if _appointment_book is None or version != _appointment_book_version:
+        _appointment_book = AppointmentBook.from_appointments(load_appointments())
+        _appointment_book_version = version
+    return _appointment_book
+
+def get_upcoming_appointments(start=None, end=None, doctor=None, user_id=None):
+    """Appointments in [start, end), e.g. one doctor's week"""
+    return get_appointment_book().upcoming(start or datetime.now(), end, doctor, user_id)
+
+def add_appointment(user_id, doctor, date_time, reason, allow_conflicts=True):
+    """Book an appointment; returns the doctor's overlapping appointments (raises instead if not allowed)"""
+    appt = {'doctor': doctor, 'date_time': date_time, 'reason': reason}
+    conflicts = []
+    books = []
+
+    def book(appointments):
+        # Under the file lock: the file cannot change until the write, so two sessions cannot both take the slot
+        current = _appointment_book
+        if current is None or _appointment_book_version != _file_version(APPOINTMENTS_FILE):
+            current = AppointmentBook.from_appointments(appointments)
+        books.append(current)
+        conflicts.extend(current.find_conflicts(doctor, date_time))
+        if conflicts and not allow_conflicts:
+            raise ValueError(f"{doctor} is already booked at {conflicts[0]['date_time']}")
+        appointments.setdefault(user_id, []).append(appt)
+
+    def index(_):
+        # Still under the lock, so the stamped version is exactly the file we just wrote
+        global _appointment_book, _appointment_book_version
+        books[0].add(user_id, appt)
+        _appointment_book, _appointment_book_version = books[0], _file_version(APPOINTMENTS_FILE)
+
+    update_json_file(APPOINTMENTS_FILE, book, on_write=index)
+    schedule_appointment_reminders(get_reminder_scheduler(), user_id, doctor, date_time, reason)
+    return conflicts
 
 # Enhanced health data simulation with anomaly injection
-def simulate_health_data(user_id, minutes=300, inject_anomalies=True, anomaly_rate=0.05):
-    """Simulate realistic health data with optional anomaly injection"""
+@timed()
+def simulate_health_data(user_id, minutes=300, inject_anomalies=True, anomaly_rate=0.05, include_labels=False):
+    """
+    Simulate realistic health data with optional anomaly injection
+    include_labels adds ground truth to each record: is_anomaly and anomaly_type (None when normal).
+    """
     start_time = datetime.now() - timedelta(minutes=minutes)
     data = []
     timestamp = start_time
@@ -98,6 +288,7 @@ def simulate_health_data(user_id, minutes=300, inject_anomalies=True, anomaly_ra
     
     for i in range(minutes):
         is_anomaly = i in anomaly_indices
+        anomaly_type = None
         
         if is_anomaly:
             # Generate anomalous values
@@ -138,7 +329,7 @@ def simulate_health_data(user_id, minutes=300, inject_anomalies=True, anomaly_ra
         
         activity_level = np.random.choice(["low", "moderate", "high"], p=[0.5, 0.35, 0.15])
         
-        data.append({
+        record = {
             "user_id": user_id,
             "timestamp": timestamp.isoformat(),
             "heart_rate": int(heart_rate),
@@ -146,25 +337,73 @@ def simulate_health_data(user_id, minutes=300, inject_anomalies=True, anomaly_ra
             "temperature": round(temperature, 2),
             "respiration_rate": int(respiration_rate),
             "activity_level": activity_level
-        })
+        }
+        if include_labels:
+            record["is_anomaly"] = is_anomaly
+            record["anomaly_type"] = str(anomaly_type) if is_anomaly else None
+        data.append(record)
         timestamp += timedelta(minutes=1)
     
     return data
 
-def simulate_multi_user_data(num_users=3, minutes_per_user=300, contamination=0.05):
+@timed()
+def simulate_multi_user_data(num_users=3, minutes_per_user=300, contamination=0.05, include_labels=False):
     """Generate data for multiple users simultaneously"""
     all_data = []
     
     for i in range(num_users):
         user_id = f"User_{i+1}"
-        user_data = simulate_health_data(user_id, minutes_per_user, True, contamination)
+        user_data = simulate_health_data(user_id, minutes_per_user, True, contamination, include_labels)
         all_data.extend(user_data)
     
-    return pd.DataFrame(all_data)
+    return compact_vitals_frame(pd.DataFrame(all_data))
 
 # Get user health data as DataFrame
-def get_user_health_df(user_id):
-    data = load_health_data()
+@timed()
+def get_user_health_df(user_id, start=None, end=None, health_data=None, health_file=None, store_dir=None):
+    """
+    User history, optionally limited to start <= timestamp < end
+    health_data: the already parsed JSON store, for callers reading many users in a row
+    """
+    if vitals_store_enabled():
+        ensure_vitals_stores([user_id], health_data=health_data, health_file=health_file, store_dir=store_dir)
+        return vitals_to_dataframe(read_user_vitals(user_id, start, end, store_dir))
+    data = load_health_data(health_file) if health_data is None else health_data
     if user_id in data:
-        return pd.DataFrame(data[user_id])
+        df = compact_vitals_frame(pd.DataFrame(data[user_id]))
+        if start is not None or end is not None:
+            mask = pd.Series(True, index=df.index)
+            if start is not None:
+                mask &= df['timestamp'] >= pd.Timestamp(start)
+            if end is not None:
+                mask &= df['timestamp'] < pd.Timestamp(end)
+            df = df[mask]
+        return df
     return pd.DataFrame()
+
+def warm_rolling_features(engine, user_ids, health_file=None, store_dir=None):
+    """Seed a RollingFeatureEngine with the last max(windows) stored readings of each patient"""
+    keep = max(engine.windows)
+    if vitals_store_enabled():
+        health_data = ensure_vitals_stores(user_ids, health_file=health_file, store_dir=store_dir)
+    else:
+        health_data = load_health_data(health_file)
+    for user_id in user_ids:
+        if vitals_store_enabled():
+            history = vitals_to_dataframe(read_user_vitals(user_id, store_dir=store_dir)[-keep:])
+        else:
+            history = get_user_health_df(user_id, health_data=health_data).tail(keep)
+        if not history.empty:
+            engine.warm_start(history.assign(user_id=user_id))
+
+def iter_user_history_chunks(user_id, chunk_size=50000, start=None, end=None):
+    """Yield a user's history as DataFrames of at most chunk_size rows, oldest first"""
+    if vitals_store_enabled():
+        ensure_vitals_stores([user_id])
+        arr = read_user_vitals(user_id, start, end)
+        for i in range(0, len(arr), chunk_size):
+            yield vitals_to_dataframe(arr[i:i + chunk_size])
+        return
+    df = get_user_health_df(user_id, start, end)
+    for i in range(0, len(df), chunk_size):
+        yield df.iloc[i:i + chunk_size]
@@ -0,0 +1,149 @@
+import os
+import numpy as np
+import pandas as pd
+from data import iter_user_history_chunks
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+EXPORT_COLUMNS = ['user_id', 'timestamp', 'heart_rate', 'blood_oxygen', 'temperature',
+                  'respiration_rate', 'activity_level']
+EXPORT_FORMATS = ('csv', 'xlsx', 'parquet')
+
+# Excel's hard limit per sheet, including the header row
+EXCEL_MAX_ROWS = 1048576
+
+PARQUET_COMPRESSION = 'zstd'
+
+
+def _as_user_list(user_ids):
+    return [user_ids] if isinstance(user_ids, str) else list(user_ids)
+
+
+def _normalize_chunk(chunk, user_id):
+    """Same columns and dtypes for every chunk, whichever storage backend produced it"""
+    out = pd.DataFrame({'user_id': user_id, 'timestamp': pd.to_datetime(chunk['timestamp'])},
+                       index=chunk.index)
+    for col in EXPORT_COLUMNS[2:-1]:
+        out[col] = pd.to_numeric(chunk[col], errors='coerce') if col in chunk.columns else np.nan
+    activity = chunk['activity_level'] if 'activity_level' in chunk.columns else None
+    out['activity_level'] = activity.astype(object) if activity is not None else None
+    return out.reset_index(drop=True)
+
+
+def iter_export_chunks(user_ids, start=None, end=None, chunk_size=50000):
+    """Normalized history chunks for each user in turn, read straight from storage"""
+    for user_id in _as_user_list(user_ids):
+        for chunk in iter_user_history_chunks(user_id, chunk_size, start, end):
+            if not chunk.empty:
+                yield _normalize_chunk(chunk, user_id)
+
+
+def export_csv(user_ids, filename, start=None, end=None, chunk_size=50000):
+    """Append each chunk to one CSV; returns rows written"""
+    rows = 0
+    with open(filename, 'w', newline='', encoding='utf-8') as f:
+        for chunk in iter_export_chunks(user_ids, start, end, chunk_size):
+            chunk.to_csv(f, index=False, header=rows == 0)
+            rows += len(chunk)
+        if rows == 0:
+            f.write(','.join(EXPORT_COLUMNS) + '\n')
+    return rows
+
+
+def write_xlsx(frames, filename, sheet_name='Data'):
+    """
+    Write DataFrames to one workbook in openpyxl write-only mode
+    Rows are streamed to disk instead of held as cells; a new sheet is started
+    whenever one reaches Excel's row limit. Returns rows written.
+    """
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    ws, sheet_rows, sheets, rows, header = None, 0, 0, 0, None
+    for frame in frames:
+        if header is None:
+            header = [str(c) for c in frame.columns]
+        # NaN/NaT become empty cells
+        values = frame.astype(object).where(frame.notna(), None)
+        for row in values.itertuples(index=False, name=None):
+            if ws is None or sheet_rows >= EXCEL_MAX_ROWS:
+                sheets += 1
+                ws = wb.create_sheet(sheet_name if sheets == 1 else f"{sheet_name} {sheets}")
+                ws.append(header)
+                sheet_rows = 1
+            ws.append(row)
+            sheet_rows += 1
+            rows += 1
+    if ws is None:
+        ws = wb.create_sheet(sheet_name)
+        if header:
+            ws.append(header)
+    wb.save(filename)
+    return rows
+
+
+def export_xlsx(user_ids, filename, start=None, end=None, chunk_size=50000):
+    return write_xlsx(iter_export_chunks(user_ids, start, end, chunk_size), filename)
+
+
+def _parquet_schema():
+    return pa.schema([
+        ('user_id', pa.string()),
+        ('timestamp', pa.timestamp('ns')),
+        ('heart_rate', pa.float32()),
+        ('blood_oxygen', pa.float32()),
+        ('temperature', pa.float32()),
+        ('respiration_rate', pa.float32()),
+        ('activity_level', pa.string()),
+    ])
+
+
+def _iter_user_days(chunks):
+    """Regroup chunks into one DataFrame per (user, day); chunks must be time-ordered per user"""
+    pending, key = [], None
+    for chunk in chunks:
+        days = chunk['timestamp'].dt.normalize().to_numpy()
+        user_id = chunk['user_id'].iat[0]
+        bounds = np.flatnonzero(days[1:] != days[:-1]) + 1
+        for lo, hi in zip(np.r_[0, bounds], np.r_[bounds, len(chunk)]):
+            part_key = (user_id, days[lo])
+            if key is not None and part_key != key:
+                yield pd.concat(pending, ignore_index=True)
+                pending = []
+            pending.append(chunk.iloc[lo:hi])
+            key = part_key
+    if pending:
+        yield pd.concat(pending, ignore_index=True)
+
+
+def export_parquet(user_ids, filename, start=None, end=None, chunk_size=50000,
+                   compression=PARQUET_COMPRESSION):
+    """Compressed Parquet with one row group per user and day; returns rows written"""
+    if not PARQUET_AVAILABLE:
+        raise ImportError("Parquet export requires pyarrow (pip install pyarrow)")
+    schema = _parquet_schema()
+    rows = 0
+    with pq.ParquetWriter(filename, schema, compression=compression) as writer:
+        for day in _iter_user_days(iter_export_chunks(user_ids, start, end, chunk_size)):
+            writer.write_table(pa.Table.from_pandas(day, schema=schema, preserve_index=False))
+            rows += len(day)
+    return rows
+
+
+EXPORTERS = {
+    'csv': export_csv,
+    'xlsx': export_xlsx,
+    'parquet': export_parquet,
+}
+
+
+def export_history(user_ids, filename, fmt=None, start=None, end=None, chunk_size=50000, **options):
+    """Export one or more users' histories; format defaults to the file extension"""
+    fmt = (fmt or os.path.splitext(filename)[1].lstrip('.')).lower()
+    if fmt not in EXPORTERS:
+        raise ValueError(f"Unsupported export format '{fmt}' (choose from {', '.join(EXPORT_FORMATS)})")
+    return EXPORTERS[fmt](user_ids, filename, start=start, end=end, chunk_size=chunk_size, **options)
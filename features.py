@@ -0,0 +1,315 @@
+import math
+import threading
+from collections import deque
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+ROLLING_VITALS = ['heart_rate', 'blood_oxygen', 'temperature', 'respiration_rate']
+
+# Window sizes in readings (per-minute data: 10 minutes and 1 hour)
+DEFAULT_WINDOWS = (10, 60)
+
+# seconds_since_anomaly for patients with no earlier anomaly, and its upper bound
+ANOMALY_GAP_CAP = 24 * 3600.0
+
+# Running sums are recomputed exactly from the window this often to stop float drift
+RESYNC_INTERVAL = 1000
+
+# Variances this small relative to the squared values are rounding noise -> 0
+_VARIANCE_EPS = 1e-12
+
+WINDOW_STATS = ['mean', 'std', 'min', 'max', 'slope']
+
+
+def feature_names(windows=DEFAULT_WINDOWS, vitals=ROLLING_VITALS):
+    """Rolling feature columns, in the order both the batch and live paths produce them"""
+    names = []
+    for vital in vitals:
+        names.append(f'{vital}_delta')
+        for size in windows:
+            names.extend(f'{vital}_{stat}_{size}' for stat in WINDOW_STATS)
+    names.append('seconds_since_anomaly')
+    return names
+
+
+def _timestamp_seconds(value):
+    return pd.Timestamp(value).value / 1e9
+
+
+def _is_missing(value):
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def _anomaly_mask(labels):
+    """Boolean anomalies from bools, IsolationForest output (-1) or 'Anomaly'/'Normal' labels"""
+    values = np.asarray(labels)
+    if values.dtype == bool:
+        return values
+    if np.issubdtype(values.dtype, np.number):
+        return values == -1
+    return values == 'Anomaly'
+
+
+class RollingWindow:
+    """
+    Last `size` values of one vital with O(1) push
+    Mean/std/slope come from running sums; min/max from monotonic deques.
+    Slope is the least-squares slope per reading over the window.
+    """
+
+    __slots__ = ('size', 'values', 'sum', 'sumsq', 'sxy', 'mins', 'maxs', 'index')
+
+    def __init__(self, size):
+        self.size = size
+        self.values = deque(maxlen=size)
+        self.sum = 0.0
+        self.sumsq = 0.0
+        self.sxy = 0.0
+        self.mins = deque()
+        self.maxs = deque()
+        self.index = 0
+
+    def push(self, value):
+        values = self.values
+        if len(values) == self.size:
+            out = values[0]
+            # Shift x positions down by one as the oldest value leaves
+            self.sxy += (self.size - 1) * value - (self.sum - out)
+            self.sum += value - out
+            self.sumsq += value * value - out * out
+        else:
+            self.sxy += len(values) * value
+            self.sum += value
+            self.sumsq += value * value
+        values.append(value)
+
+        i = self.index
+        self.index += 1
+        mins, maxs = self.mins, self.maxs
+        while mins and mins[-1][1] >= value:
+            mins.pop()
+        mins.append((i, value))
+        if mins[0][0] <= i - self.size:
+            mins.popleft()
+        while maxs and maxs[-1][1] <= value:
+            maxs.pop()
+        maxs.append((i, value))
+        if maxs[0][0] <= i - self.size:
+            maxs.popleft()
+
+        if self.index % RESYNC_INTERVAL == 0:
+            self.sum = math.fsum(values)
+            self.sumsq = math.fsum(v * v for v in values)
+            self.sxy = math.fsum(x * v for x, v in enumerate(values))
+
+    def stats(self):
+        """(mean, std, min, max, slope); zeros before the first value"""
+        c = len(self.values)
+        if c == 0:
+            return 0.0, 0.0, 0.0, 0.0, 0.0
+        mean = self.sum / c
+        var = self.sumsq / c - mean * mean
+        if var <= _VARIANCE_EPS * (self.sumsq / c):
+            var = 0.0
+        sx = c * (c - 1) / 2
+        sxx = (c - 1) * c * (2 * c - 1) / 6
+        denom = c * sxx - sx * sx
+        slope = (c * self.sxy - sx * self.sum) / denom if denom > 0 else 0.0
+        return mean, math.sqrt(var), self.mins[0][1], self.maxs[0][1], slope
+
+
+class RollingFeatureEngine:
+    """
+    Per-user rolling features for the live path, updated in O(1) per reading
+    update() returns the same values compute_rolling_features() gives for that row in batch.
+    """
+
+    def __init__(self, windows=DEFAULT_WINDOWS, vitals=ROLLING_VITALS, anomaly_gap_cap=ANOMALY_GAP_CAP):
+        self.windows = tuple(windows)
+        self.vitals = list(vitals)
+        self.anomaly_gap_cap = anomaly_gap_cap
+        self.feature_names = feature_names(self.windows, self.vitals)
+        self._users = {}
+        self._lock = threading.Lock()
+
+    def _state(self, user_id):
+        state = self._users.get(user_id)
+        if state is None:
+            state = {
+                'windows': {vital: [RollingWindow(size) for size in self.windows] for vital in self.vitals},
+                'last': dict.fromkeys(self.vitals),
+                'last_anomaly': None,
+            }
+            self._users[user_id] = state
+        return state
+
+    def update(self, user_id, reading, is_anomaly=None):
+        """
+        Fold one reading into the user's windows and return its feature dict
+        seconds_since_anomaly looks at earlier readings only; is_anomaly (if known)
+        applies from the next reading on.
+        """
+        timestamp = reading.get('timestamp')
+        seconds = _timestamp_seconds(timestamp) if timestamp is not None else pd.Timestamp.now().value / 1e9
+        features = {}
+        with self._lock:
+            state = self._state(user_id)
+            for vital in self.vitals:
+                value = reading.get(vital)
+                windows = state['windows'][vital]
+                delta = 0.0
+                if not _is_missing(value):
+                    value = float(value)
+                    previous = state['last'][vital]
+                    if previous is not None:
+                        delta = value - previous
+                    state['last'][vital] = value
+                    for window in windows:
+                        window.push(value)
+                features[f'{vital}_delta'] = delta
+                for window in windows:
+                    for stat, result in zip(WINDOW_STATS, window.stats()):
+                        features[f'{vital}_{stat}_{window.size}'] = result
+            last_anomaly = state['last_anomaly']
+            features['seconds_since_anomaly'] = (self.anomaly_gap_cap if last_anomaly is None
+                                                 else min(seconds - last_anomaly, self.anomaly_gap_cap))
+            if is_anomaly:
+                state['last_anomaly'] = seconds
+        return features
+
+    def mark_anomaly(self, user_id, timestamp=None):
+        """Record that a user's reading at `timestamp` was scored anomalous"""
+        seconds = _timestamp_seconds(timestamp) if timestamp is not None else pd.Timestamp.now().value / 1e9
+        with self._lock:
+            self._state(user_id)['last_anomaly'] = seconds
+
+    def feature_vector(self, user_id, reading, is_anomaly=None):
+        """update() as a float64 array in feature_names order"""
+        features = self.update(user_id, reading, is_anomaly)
+        return np.array([features[name] for name in self.feature_names], dtype=np.float64)
+
+    def update_many(self, user_ids, readings):
+        """Fold readings (with their user ids) in order; one row of features per reading"""
+        rows = [self.feature_vector(user_id, reading) for user_id, reading in zip(user_ids, readings)]
+        return pd.DataFrame(np.reshape(rows, (len(rows), len(self.feature_names))), columns=self.feature_names)
+
+    def warm_start(self, df, anomaly_col=None):
+        """Seed live state from history (only the last max(windows) readings per user are replayed)"""
+        keep = max(self.windows)
+        for user_id, rows in _user_groups(df):
+            labels = _anomaly_mask(rows[anomaly_col]) if anomaly_col and anomaly_col in rows.columns else None
+            if labels is not None and labels.any():
+                self.mark_anomaly(user_id, rows['timestamp'].iloc[np.flatnonzero(labels)[-1]])
+            tail = rows.iloc[-keep:]
+            for reading in tail.to_dict('records'):
+                self.update(user_id, reading)
+
+    def reset(self, user_id=None):
+        with self._lock:
+            if user_id is None:
+                self._users.clear()
+            else:
+                self._users.pop(user_id, None)
+
+    def transform(self, df, anomaly_col=None):
+        """Replay a frame through fresh per-user state (reference for compute_rolling_features)"""
+        engine = RollingFeatureEngine(self.windows, self.vitals, self.anomaly_gap_cap)
+        out = pd.DataFrame(index=df.index, columns=self.feature_names, dtype=np.float64)
+        for user_id, rows in _user_groups(df):
+            labels = _anomaly_mask(rows[anomaly_col]) if anomaly_col and anomaly_col in rows.columns else None
+            for i, (index, reading) in enumerate(zip(rows.index, rows.to_dict('records'))):
+                features = engine.update(user_id, reading, None if labels is None else bool(labels[i]))
+                out.loc[index] = [features[name] for name in self.feature_names]
+        return out
+
+
+def _user_groups(df):
+    """(user_id, rows in time order) per user; frames without user_id are one user"""
+    if 'timestamp' in df.columns:
+        order = np.argsort(pd.to_datetime(df['timestamp']).to_numpy(dtype='datetime64[ns]'), kind='stable')
+        df = df.iloc[order]
+    if 'user_id' not in df.columns:
+        yield None, df
+        return
+    for user_id, rows in df.groupby('user_id', sort=False, observed=True):
+        yield user_id, rows
+
+
+def _window_stats(values, size, chunk_rows=65536):
+    """mean/std/min/max/slope per position of a trailing window over values (no NaN), shape [5, n]"""
+    n = len(values)
+    out = np.zeros((5, n))
+    if n == 0:
+        return out
+    windows = sliding_window_view(np.concatenate([np.full(size - 1, np.nan), values]), size)
+    x = np.arange(size, dtype=np.float64)
+    for lo in range(0, n, chunk_rows):
+        w = windows[lo:lo + chunk_rows]
+        valid = ~np.isnan(w)
+        count = valid.sum(axis=1)
+        filled = np.where(valid, w, 0.0)
+        mean = filled.sum(axis=1) / count
+        meansq = (filled * filled).sum(axis=1) / count
+        dev = np.where(valid, w - mean[:, None], 0.0)
+        var = (dev * dev).sum(axis=1) / count
+        var[var <= _VARIANCE_EPS * meansq] = 0.0
+        x_mean = (valid * x).sum(axis=1) / count
+        dx = np.where(valid, x - x_mean[:, None], 0.0)
+        sxx = (dx * dx).sum(axis=1)
+        slope = np.where(sxx > 0, (dx * dev).sum(axis=1) / np.where(sxx > 0, sxx, 1.0), 0.0)
+        hi = lo + len(w)
+        out[0, lo:hi] = mean
+        out[1, lo:hi] = np.sqrt(var)
+        out[2, lo:hi] = np.where(valid, w, np.inf).min(axis=1)
+        out[3, lo:hi] = np.where(valid, w, -np.inf).max(axis=1)
+        out[4, lo:hi] = slope
+    return out
+
+
+def compute_rolling_features(df, windows=DEFAULT_WINDOWS, vitals=ROLLING_VITALS, anomaly_col=None,
+                             anomaly_gap_cap=ANOMALY_GAP_CAP):
+    """
+    Vectorized rolling features for a whole frame (one or many users), aligned to df.index
+    Same definitions as RollingFeatureEngine.update: windows count readings, missing values
+    are skipped (stats carry forward, delta 0), and warm-up windows use what is available.
+    """
+    if not df.index.is_unique:
+        raise ValueError("compute_rolling_features needs a DataFrame with a unique index")
+    names = feature_names(windows, vitals)
+    out = np.zeros((len(df), len(names)))
+    positions = pd.Series(np.arange(len(df)), index=df.index)
+    for user_id, rows in _user_groups(df):
+        rows_at = positions.loc[rows.index].to_numpy()
+        col = 0
+        for vital in vitals:
+            width = 1 + len(windows) * len(WINDOW_STATS)
+            block = np.zeros((len(rows), width))
+            if vital in rows.columns:
+                values = pd.to_numeric(rows[vital], errors='coerce').to_numpy(dtype=np.float64)
+                valid = ~np.isnan(values)
+                present = values[valid]
+                valid_at = np.flatnonzero(valid)
+                if len(present):
+                    block[valid_at[1:], 0] = np.diff(present)
+                    for w, size in enumerate(windows):
+                        stats = _window_stats(present, size)
+                        block[valid_at, 1 + w * 5:1 + (w + 1) * 5] = stats.T
+                    # Rows with a missing value repeat the last window stats
+                    last_valid = np.maximum.accumulate(np.where(valid, np.arange(len(values)), -1))
+                    carry = (~valid) & (last_valid >= 0)
+                    block[carry, 1:] = block[last_valid[carry], 1:]
+            out[rows_at, col:col + width] = block
+            col += width
+
+        if anomaly_col and anomaly_col in rows.columns and 'timestamp' in rows.columns:
+            seconds = pd.to_datetime(rows['timestamp']).to_numpy(dtype='datetime64[ns]').astype(np.int64) / 1e9
+            flagged = _anomaly_mask(rows[anomaly_col])
+            # Index of the latest anomaly strictly before each row
+            latest = np.maximum.accumulate(np.where(flagged, np.arange(len(rows)), -1))
+            previous = np.concatenate([[-1], latest[:-1]])
+            gap = np.where(previous >= 0, seconds - seconds[np.maximum(previous, 0)], anomaly_gap_cap)
+            out[rows_at, col] = np.minimum(gap, anomaly_gap_cap)
+        else:
+            out[rows_at, col] = anomaly_gap_cap
+    return pd.DataFrame(out, index=df.index, columns=names)
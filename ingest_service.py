@@ -0,0 +1,295 @@
+"""Standalone asyncio ingest service for device readings.
+
+Usage: python ingest_service.py [--host 127.0.0.1] [--port 8765] [--batch-size 20000] [--linger 0.05]
+
+  POST /readings    one reading or {"readings": [...]}; answers 202 once queued
+  GET  /ingest      WebSocket for devices: each text frame is a reading or a list of readings
+  GET  /subscribe   WebSocket for dashboards: reading/alert/anomaly events (?user_id=a,b filters)
+  GET  /stats       queue depth, batch and latency counters
+
+The request path only validates and queues. A batcher drains the queue into
+micro-batches; storage writes, alert checks and anomaly scoring run on a worker
+thread, one batch at a time, and the results are published to subscribers.
+"""
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from aiohttp import web, WSMsgType
+
+from alerts import check_vitals_batch, alerts_from_flags, RECENT_ALERTS_LIMIT
+from data import add_health_records, warm_rolling_features
+from features import RollingFeatureEngine
+from instrumentation import stage, count
+from models import AnomalyScorer
+from schema import parse_payload
+
+INGEST_HOST = os.getenv('INGEST_HOST', '127.0.0.1')
+INGEST_PORT = int(os.getenv('INGEST_PORT', 8765))
+
+BATCH_SIZE = 20000           # most readings written per batch
+BATCH_LINGER = 0.05          # seconds to wait for more readings after the first of a batch
+MAX_QUEUE = 100000           # readings queued before POSTs are refused with 503
+SUBSCRIBER_BUFFER = 1000     # events buffered per dashboard; the oldest are dropped beyond this
+
+
+class Subscriber:
+    def __init__(self, ws, user_ids=None):
+        self.ws = ws
+        self.user_ids = user_ids
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_BUFFER)
+        self.dropped = 0
+
+    def wants(self, user_id):
+        return self.user_ids is None or user_id in self.user_ids
+
+    def offer(self, event):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+
+class IngestService:
+    """Queue, micro-batcher and publisher behind the HTTP/WebSocket endpoints"""
+
+    def __init__(self, batch_size=BATCH_SIZE, linger=BATCH_LINGER, max_queue=MAX_QUEUE, scorer=None):
+        self.batch_size = batch_size
+        self.linger = linger
+        self.max_queue = max_queue
+        self.scorer = scorer
+        self.rolling = None
+        self.queue = None
+        self.subscribers = set()
+        # One worker thread: batches are written in arrival order and never concurrently
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ingest-batch')
+        self._batcher = None
+        self.warmed = set()
+        self.batch_seconds = deque(maxlen=1000)
+        # Bounded, unlike alerts.alert_history, so a long-running service does not grow without limit
+        self.recent_alerts = deque(maxlen=RECENT_ALERTS_LIMIT)
+        self.stats = {'accepted': 0, 'rejected': 0, 'written': 0, 'batches': 0,
+                      'alerts': 0, 'anomalies': 0, 'failed_batches': 0}
+
+    async def start(self):
+        self.queue = asyncio.Queue(maxsize=self.max_queue)
+        if self.scorer is None:
+            loop = asyncio.get_running_loop()
+            self.scorer = await loop.run_in_executor(self.executor, AnomalyScorer().fit_from_storage)
+        # Live rolling features with the scorer's windows; patients are seeded from history on first sight
+        self.rolling = RollingFeatureEngine(self.scorer.windows)
+        self._batcher = asyncio.create_task(self._run_batcher())
+
+    async def stop(self):
+        """Flush what is queued, then stop the batcher"""
+        if self._batcher is not None:
+            await self.queue.join()
+            self._batcher.cancel()
+            try:
+                await self._batcher
+            except asyncio.CancelledError:
+                pass
+        for subscriber in list(self.subscribers):
+            await subscriber.ws.close()
+        self.executor.shutdown(wait=True)
+
+    def submit(self, readings):
+        """Queue parsed readings; False (nothing queued) when the queue cannot take them all"""
+        if self.queue.qsize() + len(readings) > self.max_queue:
+            self.stats['rejected'] += len(readings)
+            return False
+        for reading in readings:
+            self.queue.put_nowait(reading)
+        self.stats['accepted'] += len(readings)
+        return True
+
+    async def _next_batch(self):
+        batch = [await self.queue.get()]
+        if self.linger and self.queue.qsize() < self.batch_size:
+            await asyncio.sleep(self.linger)
+        while len(batch) < self.batch_size and not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+        return batch
+
+    async def _run_batcher(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            start = time.perf_counter()
+            try:
+                events = await loop.run_in_executor(self.executor, self.process_batch, batch)
+                self.stats['written'] += len(batch)
+                self.stats['batches'] += 1
+                self.publish(events)
+            except Exception as e:
+                self.stats['failed_batches'] += 1
+                print(f"Ingest batch of {len(batch)} readings failed: {e}")
+            finally:
+                self.batch_seconds.append(time.perf_counter() - start)
+                for _ in batch:
+                    self.queue.task_done()
+
+    def process_batch(self, batch):
+        """Write one micro-batch and derive its events (runs on the worker thread)"""
+        user_ids = [user_id for user_id, _ in batch]
+        records = [record for _, record in batch]
+        df = pd.DataFrame(records)
+
+        with stage('ingest.score'):
+            new_users = [user_id for user_id in dict.fromkeys(user_ids) if user_id not in self.warmed]
+            if new_users:
+                warm_rolling_features(self.rolling, new_users)
+                self.warmed.update(new_users)
+            rolling = self.rolling.update_many(user_ids, records)
+            anomalies = self.scorer.score(df, rolling)
+            for i in np.flatnonzero(anomalies):
+                self.rolling.mark_anomaly(user_ids[i], records[i].get('timestamp'))
+
+        records_by_user, labels_by_user = {}, {}
+        for user_id, (_, record), anomaly in zip(user_ids, batch, anomalies):
+            records_by_user.setdefault(user_id, []).append(record)
+            labels_by_user.setdefault(user_id, []).append(bool(anomaly))
+        with stage('ingest.store'):
+            add_health_records(records_by_user, labels_by_user)
+
+        with stage('ingest.alerts'):
+            flags, thresholds = check_vitals_batch(user_ids, df)
+            alerts = alerts_from_flags(flags, thresholds, user_ids, df, record=False)
+            self.recent_alerts.extend(alerts)
+        if alerts:
+            count('alerts_raised', len(alerts))
+        count('readings_ingested', len(batch))
+
+        events = [{'type': 'readings', 'user_id': user_id, 'readings': records}
+                  for user_id, records in records_by_user.items()]
+        events += [{'type': 'alert', 'user_id': alert['user_id'], 'alert': alert} for alert in alerts]
+        events += [{'type': 'anomaly', 'user_id': user_ids[i], **batch[i][1]} for i in np.flatnonzero(anomalies)]
+        self.stats['alerts'] += len(alerts)
+        self.stats['anomalies'] += int(anomalies.sum())
+        return events
+
+    def publish(self, events):
+        for subscriber in self.subscribers:
+            for event in events:
+                if subscriber.wants(event['user_id']):
+                    subscriber.offer(event)
+
+    def snapshot(self):
+        seconds = np.array(self.batch_seconds) * 1000
+        return {
+            **self.stats,
+            'queued': self.queue.qsize() if self.queue is not None else 0,
+            'subscribers': len(self.subscribers),
+            'scorer': {'source': self.scorer.source, 'rows': self.scorer.rows} if self.scorer else None,
+            'batch_ms': {'p50': float(np.percentile(seconds, 50)), 'p99': float(np.percentile(seconds, 99)),
+                         'max': float(seconds.max())} if len(seconds) else None,
+        }
+
+
+SERVICE_KEY = web.AppKey('ingest_service', IngestService)
+
+
+def _error(status, message):
+    return web.json_response({'error': message}, status=status)
+
+
+async def post_readings(request):
+    service = request.app[SERVICE_KEY]
+    try:
+        readings = parse_payload(await request.json())
+    except json.JSONDecodeError:
+        return _error(400, 'body must be JSON')
+    except ValueError as e:
+        return _error(400, str(e))
+    if not service.submit(readings):
+        return web.json_response({'error': 'ingest queue full'}, status=503, headers={'Retry-After': '1'})
+    return web.json_response({'accepted': len(readings)}, status=202)
+
+
+async def ingest_socket(request):
+    """Device WebSocket: every frame is acknowledged with {"accepted": n} or {"error": ...}"""
+    service = request.app[SERVICE_KEY]
+    ws = web.WebSocketResponse()
+    await ws.prepare(request)
+    async for msg in ws:
+        if msg.type != WSMsgType.TEXT:
+            continue
+        try:
+            payload = json.loads(msg.data)
+            readings = parse_payload(payload)
+        except ValueError as e:
+            await ws.send_json({'error': str(e)})
+            continue
+        ack = {'accepted': len(readings)} if service.submit(readings) else {'error': 'ingest queue full'}
+        if isinstance(payload, dict) and 'id' in payload:
+            ack['id'] = payload['id']
+        await ws.send_json(ack)
+    return ws
+
+
+async def subscribe_socket(request):
+    """Dashboard WebSocket: pushes events for all patients or the ?user_id=a,b subset"""
+    service = request.app[SERVICE_KEY]
+    user_ids = request.query.get('user_id')
+    ws = web.WebSocketResponse(heartbeat=30)
+    await ws.prepare(request)
+    subscriber = Subscriber(ws, set(user_ids.split(',')) if user_ids else None)
+    service.subscribers.add(subscriber)
+
+    async def forward():
+        while True:
+            event = await subscriber.queue.get()
+            await ws.send_json(event)
+
+    sender = asyncio.create_task(forward())
+    try:
+        async for _ in ws:
+            pass  # dashboards only listen; reading keeps ping/close handling alive
+    finally:
+        service.subscribers.discard(subscriber)
+        sender.cancel()
+    return ws
+
+
+async def get_stats(request):
+    return web.json_response(request.app[SERVICE_KEY].snapshot())
+
+
+def create_app(service=None):
+    service = service or IngestService()
+    app = web.Application(client_max_size=16 * 1024 ** 2)
+    app[SERVICE_KEY] = service
+
+    async def lifecycle(app):
+        await service.start()
+        yield
+        await service.stop()
+
+    app.cleanup_ctx.append(lifecycle)
+    app.add_routes([
+        web.post('/readings', post_readings),
+        web.get('/ingest', ingest_socket),
+        web.get('/subscribe', subscribe_socket),
+        web.get('/stats', get_stats),
+    ])
+    return app
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default=INGEST_HOST)
+    parser.add_argument('--port', type=int, default=INGEST_PORT)
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--linger', type=float, default=BATCH_LINGER)
+    parser.add_argument('--max-queue', type=int, default=MAX_QUEUE)
+    args = parser.parse_args()
+
+    service = IngestService(args.batch_size, args.linger, args.max_queue)
+    web.run_app(create_app(service), host=args.host, port=args.port, access_log=None)
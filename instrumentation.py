@@ -0,0 +1,305 @@
+import os
+import time
+import json
+import bisect
+import functools
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Off unless HEALTH_INSTRUMENTATION=true; disabled hooks cost one flag check
+_enabled = os.getenv('HEALTH_INSTRUMENTATION', 'false').lower() == 'true'
+
+# Histogram bucket upper bounds in seconds (Prometheus style, +Inf implied)
+DURATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRIC_PREFIX = 'health'
+
+
+def enabled():
+    return _enabled
+
+
+def set_enabled(value=True):
+    global _enabled
+    _enabled = bool(value)
+
+
+class Histogram:
+    """Cumulative-bucket duration histogram for one stage"""
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def snapshot(self):
+        return {'count': self.count, 'sum': self.sum, 'max': self.max,
+                'mean': self.sum / self.count if self.count else 0.0,
+                'buckets': dict(zip([str(b) for b in self.buckets] + ['+Inf'], self.counts))}
+
+
+class MetricsRegistry:
+    """Process-wide stage histograms, error counts and free-form counters"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}
+        self.errors = {}
+        self.counters = {}
+
+    def observe(self, stage, seconds, error=False):
+        with self._lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.observe(seconds)
+            if error:
+                self.errors[stage] = self.errors.get(stage, 0) + 1
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'stages': {stage: h.snapshot() for stage, h in self.histograms.items()},
+                'errors': dict(self.errors),
+                'counters': dict(self.counters),
+            }
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.errors.clear()
+            self.counters.clear()
+
+
+registry = MetricsRegistry()
+
+# Per-thread trace of the stages run since start_trace(); Streamlit runs each rerun on one thread
+_local = threading.local()
+
+
+def start_trace():
+    """Begin collecting stage timings for the current script run / request"""
+    _local.trace = []
+    _local.depth = 0
+
+
+def get_trace():
+    """[{'stage', 'ms', 'depth', 'error'}] in start order for the current thread"""
+    return list(getattr(_local, 'trace', []))
+
+
+def _record(name, seconds, error, entry):
+    registry.observe(name, seconds, error)
+    if entry is not None:
+        entry['ms'] = seconds * 1000
+        entry['error'] = error
+
+
+def _enter(name):
+    trace = getattr(_local, 'trace', None)
+    if trace is None:
+        return None
+    entry = {'stage': name, 'ms': None, 'depth': _local.depth, 'error': False}
+    trace.append(entry)
+    _local.depth += 1
+    return entry
+
+
+def _exit(entry):
+    if entry is not None:
+        _local.depth -= 1
+
+
+@contextmanager
+def stage(name):
+    """Time a block under `name`"""
+    if not _enabled:
+        yield
+        return
+    entry = _enter(name)
+    error = False
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        _record(name, time.perf_counter() - start, error, entry)
+        _exit(entry)
+
+
+def timed(name=None):
+    """Decorator: time every call under `name` (default module.function)"""
+    def decorate(fn):
+        stage_name = name or f"{fn.__module__}.{fn.__qualname__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            entry = _enter(stage_name)
+            error = False
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            except BaseException:
+                error = True
+                raise
+            finally:
+                _record(stage_name, time.perf_counter() - start, error, entry)
+                _exit(entry)
+        return wrapper
+    return decorate
+
+
+def count(name, value=1):
+    """Increment a free-form counter"""
+    if _enabled:
+        registry.increment(name, value)
+
+
+def _metric_name(name):
+    return ''.join(c if c.isalnum() else '_' for c in name)
+
+
+def render_prometheus():
+    """All metrics in the Prometheus text exposition format"""
+    snapshot = registry.snapshot()
+    lines = [
+        f"# HELP {METRIC_PREFIX}_stage_seconds Time spent per instrumented stage",
+        f"# TYPE {METRIC_PREFIX}_stage_seconds histogram",
+    ]
+    for stage_name, h in sorted(snapshot['stages'].items()):
+        cumulative = 0
+        for bound, bucket_count in h['buckets'].items():
+            cumulative += bucket_count
+            lines.append(f'{METRIC_PREFIX}_stage_seconds_bucket{{stage="{stage_name}",le="{bound}"}} {cumulative}')
+        lines.append(f'{METRIC_PREFIX}_stage_seconds_sum{{stage="{stage_name}"}} {h["sum"]:.6f}')
+        lines.append(f'{METRIC_PREFIX}_stage_seconds_count{{stage="{stage_name}"}} {h["count"]}')
+    lines += [
+        f"# HELP {METRIC_PREFIX}_stage_errors_total Stage calls that raised",
+        f"# TYPE {METRIC_PREFIX}_stage_errors_total counter",
+    ]
+    for stage_name, errors in sorted(snapshot['errors'].items()):
+        lines.append(f'{METRIC_PREFIX}_stage_errors_total{{stage="{stage_name}"}} {errors}')
+    for name, value in sorted(snapshot['counters'].items()):
+        metric = f"{METRIC_PREFIX}_{_metric_name(name)}_total"
+        lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+    return '\n'.join(lines) + '\n'
+
+
+_server = None
+
+
+def start_metrics_server(port=None, host='127.0.0.1'):
+    """Serve /metrics on a daemon thread (port from METRICS_PORT, default 9464); idempotent"""
+    global _server
+    if _server is not None:
+        return _server
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = render_prometheus().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    port = int(port or os.getenv('METRICS_PORT', 9464))
+    _server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=_server.serve_forever, name='metrics-server', daemon=True).start()
+    return _server
+
+
+def write_metrics_log(filename='metrics.log'):
+    """Append one JSON line with the current metric snapshot"""
+    with open(filename, 'a', encoding='utf-8') as f:
+        f.write(json.dumps({'time': datetime.now().isoformat(), **registry.snapshot()}) + '\n')
+
+
+_logger_thread = None
+
+
+def start_metrics_logger(filename='metrics.log', interval=60.0):
+    """Write a snapshot to `filename` every `interval` seconds on a daemon thread; idempotent"""
+    global _logger_thread
+    if _logger_thread is not None:
+        return _logger_thread
+
+    def run():
+        while True:
+            time.sleep(interval)
+            write_metrics_log(filename)
+    _logger_thread = threading.Thread(target=run, name='metrics-logger', daemon=True)
+    _logger_thread.start()
+    return _logger_thread
+
+
+def configure_from_env():
+    """Start the exporters selected by METRICS_PORT / METRICS_LOG_FILE when enabled"""
+    if not _enabled:
+        return
+    if os.getenv('METRICS_PORT'):
+        start_metrics_server()
+    if os.getenv('METRICS_LOG_FILE'):
+        start_metrics_logger(os.getenv('METRICS_LOG_FILE'), float(os.getenv('METRICS_LOG_INTERVAL', 60)))
+
+
+def plotly_chart(fig, **kwargs):
+    """st.plotly_chart timed as 'streamlit.plotly_chart' (includes figure serialization)"""
+    import streamlit as st
+    with stage('streamlit.plotly_chart'):
+        return st.plotly_chart(fig, **kwargs)
+
+
+def render_debug_panel(container=None):
+    """Per-rerun stage timings plus process-wide totals in a Streamlit expander"""
+    if not _enabled:
+        return
+    import streamlit as st
+    import pandas as pd
+    container = container or st.sidebar
+    with container.expander("🛠️ Performance (this rerun)"):
+        trace = [t for t in get_trace() if t['ms'] is not None]
+        if trace:
+            st.dataframe(pd.DataFrame({
+                'stage': ['  ' * t['depth'] + t['stage'] for t in trace],
+                'ms': [round(t['ms'], 2) for t in trace],
+                'error': [t['error'] for t in trace],
+            }), hide_index=True, use_container_width=True)
+            st.caption(f"Top-level total: {sum(t['ms'] for t in trace if t['depth'] == 0):.1f} ms")
+        else:
+            st.caption("No instrumented stages ran in this rerun.")
+        stages = registry.snapshot()['stages']
+        if stages:
+            st.markdown("**Since process start**")
+            st.dataframe(pd.DataFrame([
+                {'stage': name, 'calls': h['count'], 'mean ms': round(h['mean'] * 1000, 2),
+                 'max ms': round(h['max'] * 1000, 2), 'total ms': round(h['sum'] * 1000, 1)}
+                for name, h in sorted(stages.items(), key=lambda item: -item[1]['sum'])
+            ]), hide_index=True, use_container_width=True)
@@ -0,0 +1,174 @@
+import os
+import uuid
+import hashlib
+import threading
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, CancelledError
+from utils import save_data_to_json, load_data_from_json
+from vitals_store import vitals_store_enabled, user_store_path
+
+REPORTS_DIR = 'generated_reports'
+REPORT_FORMATS = ('pdf', 'xlsx', 'csv', 'parquet')
+
+
+def patient_data_version(user_id):
+    """
+    Version stamp of a patient's stored history; changes whenever readings are added
+    From file stats only: patients without a vitals file share health_data.json's stamp,
+    so any write to it invalidates their reports.
+    """
+    path = user_store_path(user_id)
+    if vitals_store_enabled() and os.path.exists(path):
+        stat = os.stat(path)
+        return f"vitals:{stat.st_size}:{stat.st_mtime_ns}"
+    from data import health_data_version
+    version = health_data_version()
+    return f"json:{version[1]}:{version[0]}" if version else "json:none"
+
+
+def _report_key(user_id, fmt, start, end):
+    return f"{user_id}|{fmt}|{start or ''}|{end or ''}"
+
+
+def _report_path(output_dir, user_id, fmt, start, end):
+    safe = os.path.basename(user_store_path(user_id))[:-len('.vitals')]
+    period = ''
+    if start or end:
+        period = '_' + hashlib.sha1(f"{start}|{end}".encode()).hexdigest()[:8]
+    return os.path.join(output_dir, f"{safe}{period}.{fmt}")
+
+
+def generate_patient_report(user_id, fmt, path, start=None, end=None, cached=None):
+    """
+    Worker entry point (runs in a pool process): write one patient's report
+    cached: the report's manifest entry, reused if the patient's data version still matches.
+    Returns (path, version, reused).
+    """
+    version = patient_data_version(user_id)
+    if cached and cached['version'] == version and os.path.exists(cached['path']):
+        return cached['path'], version, True
+    if fmt == 'pdf':
+        from reports import generate_history_pdf
+        generate_history_pdf(user_id, path, start, end)
+    else:
+        from exports import export_history
+        export_history(user_id, path, fmt, start, end)
+    return path, version, False
+
+
+class ReportJobQueue:
+    """
+    Local queue that fans report generation for many patients out to a process pool
+    Reports whose patient data version is unchanged since the last run are reused; the
+    version is checked in the worker, so submit() does no per-patient I/O.
+    """
+
+    def __init__(self, max_workers=None, output_dir=REPORTS_DIR):
+        self.output_dir = output_dir
+        self.manifest_file = os.path.join(output_dir, 'manifest.json')
+        os.makedirs(output_dir, exist_ok=True)
+        self._executor = ProcessPoolExecutor(max_workers=max_workers)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._manifest = load_data_from_json(self.manifest_file)
+
+    def submit(self, user_ids, fmt='pdf', start=None, end=None, force=False):
+        """Queue reports for user_ids; returns a job id for progress()/cancel()"""
+        if fmt not in REPORT_FORMATS:
+            raise ValueError(f"Unsupported report format '{fmt}' (choose from {', '.join(REPORT_FORMATS)})")
+        job_id = uuid.uuid4().hex[:12]
+        job = {
+            'id': job_id,
+            'format': fmt,
+            'status': 'running',
+            'created_at': datetime.now().isoformat(),
+            'total': len(user_ids),
+            'completed': 0,
+            'skipped': 0,
+            'failed': 0,
+            'cancelled': 0,
+            'results': {},
+            'errors': {},
+            'futures': {},
+            'done': threading.Event(),
+        }
+        with self._lock:
+            self._jobs[job_id] = job
+
+        for user_id in user_ids:
+            key = _report_key(user_id, fmt, start, end)
+            path = _report_path(self.output_dir, user_id, fmt, start, end)
+            cached = None if force else self._manifest.get(key)
+            future = self._executor.submit(generate_patient_report, user_id, fmt, path, start, end, cached)
+            with self._lock:
+                job['futures'][user_id] = future
+            future.add_done_callback(lambda f, user_id=user_id, key=key: self._on_done(job, user_id, key, f))
+        self._maybe_finish(job)
+        return job_id
+
+    def _on_done(self, job, user_id, key, future):
+        with self._lock:
+            try:
+                path, version, reused = future.result()
+                job['results'][user_id] = path
+                if reused:
+                    job['skipped'] += 1
+                else:
+                    job['completed'] += 1
+                    self._manifest[key] = {'version': version, 'path': path,
+                                           'generated_at': datetime.now().isoformat()}
+            except CancelledError:
+                job['cancelled'] += 1
+            except Exception as e:
+                job['errors'][user_id] = str(e)
+                job['failed'] += 1
+        self._maybe_finish(job)
+
+    def _maybe_finish(self, job):
+        with self._lock:
+            finished = job['completed'] + job['skipped'] + job['failed'] + job['cancelled']
+            if finished < job['total'] or job['done'].is_set():
+                return
+            if job['status'] == 'running':
+                job['status'] = 'failed' if job['failed'] else 'completed'
+            job['finished_at'] = datetime.now().isoformat()
+            manifest = dict(self._manifest)
+            job['done'].set()
+        save_data_to_json(manifest, self.manifest_file)
+
+    def progress(self, job_id):
+        """Counts, status and per-patient results of a job"""
+        with self._lock:
+            job = self._jobs[job_id]
+            finished = job['completed'] + job['skipped'] + job['failed'] + job['cancelled']
+            return {
+                'id': job_id,
+                'status': job['status'],
+                'total': job['total'],
+                'finished': finished,
+                'completed': job['completed'],
+                'skipped': job['skipped'],
+                'failed': job['failed'],
+                'cancelled': job['cancelled'],
+                'percent': round(100 * finished / job['total'], 1) if job['total'] else 100.0,
+                'results': dict(job['results']),
+                'errors': dict(job['errors']),
+            }
+
+    def cancel(self, job_id):
+        """Cancel reports that have not started; reports already running are left to finish"""
+        with self._lock:
+            job = self._jobs[job_id]
+            job['status'] = 'cancelled'
+            futures = list(job['futures'].values())
+        return sum(1 for future in futures if future.cancel())
+
+    def wait(self, job_id, timeout=None):
+        self._jobs[job_id]['done'].wait(timeout)
+        return self.progress(job_id)
+
+    def jobs(self):
+        return [self.progress(job_id) for job_id in list(self._jobs)]
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait, cancel_futures=not wait)
@@ -0,0 +1,219 @@
+"""Incremental state for the live monitoring wall (pages/live_wall.py).
+
+Each browser session keeps a LiveMonitor in st.session_state. A refresh reads only
+the readings newer than each patient's cursor, appends them to bounded per-patient
+buffers and to the figures built on the first refresh, and recomputes status for
+the patients that changed. The page runs it inside an st.fragment instead of a
+full app.py rerun that reloads and re-plots every history. With the vitals store
+a refresh binary-searches each patient's file and copies out only the new rows;
+patients read from the JSON store (no vitals file, or the store is off) are re-read
+only when health_data.json has changed, with one parse shared by all of them.
+"""
+import os
+import time
+from collections import deque
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+from data import get_user_health_df, ensure_vitals_stores, load_health_data, health_data_version
+from models import calculate_health_score_batch, predict_risks_batch, SEVERITY_LEVELS
+from vitals_store import vitals_store_enabled, user_store_exists, read_user_vitals, INT_FIELDS
+from instrumentation import timed
+
+LIVE_VITALS = ['heart_rate', 'blood_oxygen', 'temperature', 'respiration_rate']
+LIVE_WINDOW = 120             # readings kept per patient for sparklines and metric deltas
+LIVE_REFRESH_SECONDS = float(os.getenv('LIVE_REFRESH_SECONDS', 3))
+MAX_WALL_PATIENTS = 50
+WALL_COLUMNS = 5
+
+SEVERITY_BADGES = {None: '🟢', 'MEDIUM': '🟡', 'HIGH': '🟠', 'CRITICAL': '🔴'}
+
+
+def read_new_readings(user_id, after=None, limit=LIVE_WINDOW, health_data=None):
+    """
+    Readings with timestamp > after (ns since epoch), at most the latest `limit`
+    Returns columns: 'timestamp' (int64 ns) and float64 vitals with NaN where missing.
+    health_data: the already parsed JSON store, when reading several patients in a row
+    """
+    start = None if after is None else pd.Timestamp(after + 1)
+    if vitals_store_enabled() and user_store_exists(user_id):
+        # Memmap slice past the cursor; only these rows are copied out, with no DataFrame
+        arr = read_user_vitals(user_id, start)[-limit:]
+        columns = {'timestamp': np.asarray(arr['timestamp'], dtype=np.int64)}
+        for field in LIVE_VITALS:
+            values = np.asarray(arr[field], dtype=np.float64)
+            if field in INT_FIELDS:
+                values[np.asarray(arr[field]) == INT_FIELDS[field]] = np.nan
+            columns[field] = values
+        return columns
+
+    df = get_user_health_df(user_id, start, health_data=health_data).tail(limit)
+    if df.empty:
+        return {'timestamp': np.zeros(0, dtype=np.int64), **{f: np.zeros(0) for f in LIVE_VITALS}}
+    columns = {'timestamp': pd.to_datetime(df['timestamp']).to_numpy(dtype='datetime64[ns]').view(np.int64)}
+    for field in LIVE_VITALS:
+        columns[field] = (pd.to_numeric(df[field], errors='coerce').to_numpy(dtype=np.float64)
+                          if field in df else np.full(len(df), np.nan))
+    return columns
+
+
+class PatientFeed:
+    """Cursor, recent readings and sparkline figure of one patient on the wall"""
+
+    def __init__(self, user_id, window=LIVE_WINDOW):
+        self.user_id = user_id
+        self.cursor = None
+        self.columns = {name: deque(maxlen=window) for name in ['timestamp'] + LIVE_VITALS}
+        self.figure = None
+        self.stale_figure = True
+        self.health_score = None
+        self.severity = None
+
+    def __len__(self):
+        return len(self.columns['timestamp'])
+
+    def append(self, new):
+        """Fold new columns in and advance the cursor; returns the number of readings added"""
+        count = len(new['timestamp'])
+        if count:
+            for name, values in new.items():
+                self.columns[name].extend(values.tolist())
+            self.cursor = int(new['timestamp'][-1])
+            self.stale_figure = True
+        return count
+
+    def latest(self, vital):
+        return self.columns[vital][-1] if len(self) else None
+
+    def previous(self, vital):
+        return self.columns[vital][-2] if len(self) > 1 else None
+
+    def sparkline(self):
+        """Figure of the buffered heart rate and SpO2, created once and then updated in place"""
+        if self.figure is None:
+            self.figure = go.Figure([
+                go.Scatter(name='Heart Rate', mode='lines', line=dict(color='#e74c3c', width=1.5)),
+                go.Scatter(name='SpO2', mode='lines', line=dict(color='#3498db', width=1.5), yaxis='y2'),
+            ])
+            self.figure.update_layout(
+                height=120, margin=dict(l=0, r=0, t=0, b=0), showlegend=False,
+                xaxis=dict(visible=False), yaxis=dict(visible=False),
+                yaxis2=dict(visible=False, overlaying='y', side='right'),
+                uirevision=self.user_id)
+        if self.stale_figure:
+            x = np.array(self.columns['timestamp'], dtype='datetime64[ns]')
+            with self.figure.batch_update():
+                self.figure.data[0].x = x
+                self.figure.data[0].y = np.array(self.columns['heart_rate'])
+                self.figure.data[1].x = x
+                self.figure.data[1].y = np.array(self.columns['blood_oxygen'])
+            self.stale_figure = False
+        return self.figure
+
+
+class LiveMonitor:
+    """
+    Per-session wall state: one PatientFeed per displayed patient
+    The first refresh loads the last `window` readings of each patient; later
+    refreshes only read past each cursor.
+    """
+
+    def __init__(self, user_ids=(), window=LIVE_WINDOW):
+        self.window = window
+        self.feeds = {}
+        self.last_refresh = None
+        self.last_new_readings = 0
+        self._json_versions = {}   # user_id -> health_data.json version last read from
+        self.set_patients(user_ids)
+
+    def set_patients(self, user_ids):
+        """Show these patients, keeping the state of those already on the wall"""
+        self.feeds = {user_id: self.feeds.get(user_id) or PatientFeed(user_id, self.window)
+                      for user_id in list(user_ids)[:MAX_WALL_PATIENTS]}
+        self._json_versions = {u: v for u, v in self._json_versions.items() if u in self.feeds}
+
+    @timed()
+    def refresh(self):
+        """Pull readings past every cursor; returns the number of new readings"""
+        changed = []
+        total = 0
+        use_store = vitals_store_enabled()
+        version = health_data_version()
+        # Patients without a vitals file come from the JSON store: skip them while it is
+        # unchanged since their last read, and parse it at most once for the rest
+        from_json = {user_id for user_id in self.feeds if not (use_store and user_store_exists(user_id))}
+        stale = [user_id for user_id in from_json if self._json_versions.get(user_id) != version]
+        health_data = None
+        if stale:
+            health_data = ensure_vitals_stores(stale) if use_store else load_health_data()
+        for feed in self.feeds.values():
+            if feed.user_id in from_json:
+                if self._json_versions.get(feed.user_id) == version:
+                    continue
+                self._json_versions[feed.user_id] = version
+            added = feed.append(read_new_readings(feed.user_id, feed.cursor, self.window, health_data))
+            if added:
+                changed.append(feed)
+                total += added
+        if changed:
+            latest = {vital: [feed.latest(vital) for feed in changed] for vital in LIVE_VITALS}
+            scores = calculate_health_score_batch(latest)
+            _, _, max_severity = predict_risks_batch(latest)
+            for feed, score, severity in zip(changed, scores, max_severity):
+                feed.health_score = float(score)
+                feed.severity = SEVERITY_LEVELS[severity]
+        self.last_refresh = time.time()
+        self.last_new_readings = total
+        return total
+
+    def ranked(self):
+        """Feeds ordered for display: most severe first, then lowest health score"""
+        severity_order = {level: rank for rank, level in enumerate(SEVERITY_LEVELS)}
+        return sorted(self.feeds.values(), key=lambda feed: (
+            -severity_order[feed.severity],
+            feed.health_score if feed.health_score is not None else 101))
+
+
+def _metric_delta(feed, vital, fmt):
+    latest, previous = feed.latest(vital), feed.previous(vital)
+    if latest is None or previous is None or np.isnan(latest) or np.isnan(previous):
+        return None
+    return fmt.format(latest - previous)
+
+
+def _metric_value(value, fmt):
+    return '—' if value is None or np.isnan(value) else fmt.format(value)
+
+
+def render_patient_tile(feed):
+    """One wall tile: status header, HR/SpO2 metric cards, sparkline and the other vitals"""
+    import streamlit as st
+    from instrumentation import plotly_chart
+    with st.container(border=True):
+        score = '—' if feed.health_score is None else f"{feed.health_score:.0f}"
+        st.markdown(f"{SEVERITY_BADGES[feed.severity]} **{feed.user_id}** · score {score}")
+        if not len(feed):
+            st.caption("No readings yet")
+            return
+        col1, col2 = st.columns(2)
+        col1.metric("HR", _metric_value(feed.latest('heart_rate'), '{:.0f}'),
+                    _metric_delta(feed, 'heart_rate', '{:+.0f}'), delta_color='off')
+        col2.metric("SpO2", _metric_value(feed.latest('blood_oxygen'), '{:.0f}%'),
+                    _metric_delta(feed, 'blood_oxygen', '{:+.0f}'), delta_color='normal')
+        plotly_chart(feed.sparkline(), key=f"live_{feed.user_id}",
+                     config={'displayModeBar': False, 'staticPlot': True})
+        last_seen = pd.Timestamp(feed.cursor).strftime('%H:%M:%S')
+        st.caption(f"{_metric_value(feed.latest('temperature'), '{:.1f} °C')} · "
+                   f"RR {_metric_value(feed.latest('respiration_rate'), '{:.0f}')} · {last_seen}")
+
+
+def render_live_wall(monitor, columns=WALL_COLUMNS):
+    """Grid of patient tiles, most at-risk first"""
+    import streamlit as st
+    feeds = monitor.ranked()
+    for row in range(0, len(feeds), columns):
+        for column, feed in zip(st.columns(columns), feeds[row:row + columns]):
+            with column:
+                render_patient_tile(feed)
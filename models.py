@@ -1,9 +1,14 @@
+import threading
 import pandas as pd
 import numpy as np
 from sklearn.ensemble import IsolationForest, RandomForestClassifier
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import StandardScaler
+from sklearn.pipeline import make_pipeline
 from sklearn.metrics import classification_report, confusion_matrix, precision_score, recall_score, f1_score
+from instrumentation import timed, stage
+from vitals_store import ACTIVITY_CODES
+from features import compute_rolling_features, feature_names, DEFAULT_WINDOWS
 try:
     import tensorflow as tf
     from tensorflow import keras
@@ -14,23 +19,40 @@ except ImportError:
     print("⚠️ TensorFlow not available. LSTM predictions will not be available.")
 
 # Anomaly Detection using IsolationForest with evaluation
-def detect_anomalies_with_evaluation(df_scaled, contamination=0.05, test_size=0.2):
+@timed()
+def detect_anomalies_with_evaluation(df_scaled, contamination=0.05, test_size=0.2, labels=None,
+                                     n_estimators=100, max_samples='auto'):
     """
     Detect anomalies and provide evaluation metrics
+    labels: optional ground truth (truthy = anomaly, e.g. the simulator's is_anomaly column);
+    adds precision/recall/F1 on all rows and on the held-out split.
     Returns: predictions, model, metrics_dict
     """
+    if labels is not None:
+        labels = np.asarray(labels, dtype=bool)
+        if len(labels) != len(df_scaled):
+            raise ValueError("labels must have one entry per row of df_scaled")
+
     # Split data for evaluation
     if len(df_scaled) > 50:  # Only split if we have enough data
-        train_data, test_data = train_test_split(df_scaled, test_size=test_size, random_state=42)
+        if labels is not None:
+            train_data, test_data, _, test_labels = train_test_split(
+                df_scaled, labels, test_size=test_size, random_state=42)
+        else:
+            train_data, test_data = train_test_split(df_scaled, test_size=test_size, random_state=42)
     else:
         train_data = test_data = df_scaled
+        test_labels = labels
     
     # Train model
-    model = IsolationForest(contamination=contamination, random_state=42, n_estimators=100)
-    model.fit(train_data)
+    model = IsolationForest(contamination=contamination, random_state=42, n_estimators=n_estimators,
+                            max_samples=max_samples)
+    with stage('models.isolation_forest.fit'):
+        model.fit(train_data)
     
     # Predict on all data
-    all_preds = model.fit_predict(df_scaled)
+    with stage('models.isolation_forest.fit_predict'):
+        all_preds = model.fit_predict(df_scaled)
     test_preds = model.predict(test_data)
     
     # Calculate metrics
@@ -44,15 +66,149 @@ def detect_anomalies_with_evaluation(df_scaled, contamination=0.05, test_size=0.
         'anomaly_percentage': round((anomaly_count / len(df_scaled)) * 100, 2),
         'contamination_used': contamination
     }
+
+    if labels is not None:
+        metrics.update(anomaly_scores(labels, all_preds == -1))
+        metrics.update({f'test_{k}': v for k, v in anomaly_scores(test_labels, test_preds == -1).items()})
     
     return all_preds, model, metrics
 
+def anomaly_scores(labels, detected):
+    """Precision/recall/F1 and confusion counts of boolean detections against boolean labels"""
+    labels = np.asarray(labels, dtype=bool)
+    detected = np.asarray(detected, dtype=bool)
+    tn, fp, fn, tp = confusion_matrix(labels, detected, labels=[False, True]).ravel()
+    return {
+        'precision': round(float(precision_score(labels, detected, zero_division=0)), 4),
+        'recall': round(float(recall_score(labels, detected, zero_division=0)), 4),
+        'f1': round(float(f1_score(labels, detected, zero_division=0)), 4),
+        'true_positives': int(tp),
+        'false_positives': int(fp),
+        'false_negatives': int(fn),
+        'true_negatives': int(tn),
+    }
+
 # Simple anomaly detection (backward compatible)
+@timed()
 def detect_anomalies(df_scaled, contamination=0.05):
     model = IsolationForest(contamination=contamination, random_state=42)
     preds = model.fit_predict(df_scaled)
     return preds, model
 
+# Streaming anomaly scoring (ingest service, shard workers, replays)
+SCORING_FEATURES = ['heart_rate', 'blood_oxygen', 'temperature', 'respiration_rate', 'activity_level_encoded']
+SCORER_HISTORY_ROWS = 50000
+SCORER_CONTAMINATION = 0.05
+
+def rolling_scoring_features(windows=DEFAULT_WINDOWS):
+    """
+    Rolling columns the scorer uses, as compute_rolling_features and RollingFeatureEngine name them
+    seconds_since_anomaly is left out: it depends on the scorer's own earlier output.
+    """
+    return [name for name in feature_names(windows) if name != 'seconds_since_anomaly']
+
+def _scoring_matrix(df):
+    X = pd.DataFrame(index=df.index)
+    for field in SCORING_FEATURES[:-1]:
+        X[field] = pd.to_numeric(df[field], errors='coerce') if field in df else np.nan
+    activity = df['activity_level'].astype(object) if 'activity_level' in df else pd.Series(index=df.index)
+    X['activity_level_encoded'] = activity.map(ACTIVITY_CODES)
+    return X[SCORING_FEATURES].astype(np.float64)
+
+class AnomalyScorer:
+    """
+    IsolationForest over scaled vitals, activity and per-patient rolling-window features
+    Fitted once and reused for every reading. Fitted on stored history when there is
+    enough of it, otherwise on a simulated reference panel. Missing values are filled
+    with the training means.
+    Rolling features come from compute_rolling_features over the frame being scored
+    (batch: fitting, replays) or from a RollingFeatureEngine with the same windows
+    (live: pass its update_many() output as `rolling`), so both paths see the same columns.
+    """
+
+    def __init__(self, contamination=SCORER_CONTAMINATION, windows=DEFAULT_WINDOWS):
+        self.contamination = contamination
+        self.windows = tuple(windows)
+        self.rolling_features = rolling_scoring_features(self.windows)
+        self.model = None
+        self.means = None
+        self.source = None
+        self.rows = 0
+
+    @property
+    def context_rows(self):
+        """Earlier readings per patient that fully determine a reading's rolling features"""
+        return max(self.windows)
+
+    def features(self, df, rolling=None):
+        """
+        Scoring matrix for df (one reading per row)
+        rolling: DataFrame of live rolling features aligned with df; computed from df
+        (grouped by its user_id column, if any) when omitted
+        """
+        X = _scoring_matrix(df)
+        if rolling is None:
+            rolling = compute_rolling_features(df.reset_index(drop=True), self.windows)
+        values = np.asarray(rolling[self.rolling_features], dtype=np.float64)
+        return pd.concat([X, pd.DataFrame(values, index=X.index, columns=self.rolling_features)], axis=1)
+
+    def fit(self, df, source='history'):
+        X = self.features(df)
+        self.means = X.mean().fillna(0.0)
+        self.model = make_pipeline(
+            StandardScaler(),
+            IsolationForest(contamination=self.contamination, random_state=42, n_jobs=1))
+        self.model.fit(X.fillna(self.means).to_numpy())
+        self.source = source
+        self.rows = len(X)
+        return self
+
+    def fit_from_storage(self, max_rows=SCORER_HISTORY_ROWS, min_rows=1000, health_file=None, store_dir=None):
+        # data imports cohort, which imports this module
+        from data import get_user_health_df, load_health_data, simulate_multi_user_data
+        frames, rows = [], 0
+        health_data = load_health_data(health_file)
+        for user_id in health_data:
+            df = get_user_health_df(user_id, health_data=health_data, store_dir=store_dir)
+            if not df.empty:
+                frames.append(df.tail(max_rows - rows).assign(user_id=user_id))
+                rows += len(frames[-1])
+            if rows >= max_rows:
+                break
+        if rows >= min_rows:
+            return self.fit(pd.concat(frames, ignore_index=True), 'history')
+        return self.fit(simulate_multi_user_data(num_users=5, minutes_per_user=1440), 'simulated')
+
+    def score(self, df, rolling=None):
+        """True where a reading is anomalous (see features() for `rolling`)"""
+        if self.model is None or df.empty:
+            return np.zeros(len(df), dtype=bool)
+        X = self.features(df, rolling).fillna(self.means).to_numpy()
+        return self.model.predict(X) == -1
+
+_anomaly_scorer = None
+_anomaly_scorer_lock = threading.Lock()
+
+_anomaly_scorer_thread = None
+
+def get_anomaly_scorer(wait=True):
+    """
+    Process-wide AnomalyScorer, fitted from storage on first use (labels for the at-risk index)
+    wait=False never fits on the caller's thread: returns None and fits in the background until ready.
+    """
+    global _anomaly_scorer, _anomaly_scorer_thread
+    if not wait:
+        if _anomaly_scorer is None and _anomaly_scorer_thread is None:
+            with _anomaly_scorer_lock:
+                if _anomaly_scorer is None and _anomaly_scorer_thread is None:
+                    _anomaly_scorer_thread = threading.Thread(target=get_anomaly_scorer, daemon=True)
+                    _anomaly_scorer_thread.start()
+        return _anomaly_scorer
+    with _anomaly_scorer_lock:
+        if _anomaly_scorer is None:
+            _anomaly_scorer = AnomalyScorer().fit_from_storage()
+        return _anomaly_scorer
+
 # Simple Risk Prediction Model (e.g., for BP risk)
 def train_risk_model(X, y):
     X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
@@ -79,6 +235,7 @@ def build_lstm_model(input_shape):
     model.compile(optimizer='adam', loss='mse', metrics=['mae'])
     return model
 
+@timed()
 def prepare_sequences_for_lstm(data, time_steps=10):
     """Prepare sequences for LSTM training"""
     X, y = [], []
@@ -87,6 +244,7 @@ def prepare_sequences_for_lstm(data, time_steps=10):
         y.append(data[i+time_steps])
     return np.array(X), np.array(y)
 
+@timed()
 def train_lstm_model(data, time_steps=10, epochs=20, verbose=0):
     """Train LSTM model on time-series data"""
     if not TENSORFLOW_AVAILABLE:
@@ -120,6 +278,7 @@ def train_lstm_model(data, time_steps=10, epochs=20, verbose=0):
     
     return model, history
 
+@timed()
 def predict_future_values(model, recent_data, time_steps=10, future_steps=10):
     """Predict future values using trained LSTM model"""
     if model is None or not TENSORFLOW_AVAILABLE:
@@ -142,6 +301,7 @@ def predict_future_values(model, recent_data, time_steps=10, future_steps=10):
     return np.array(predictions)
 
 # Predict risks (enhanced rule-based)
+@timed()
 def predict_risks(vitals):
     """Predict health risks based on vital signs"""
     risks = []
@@ -178,6 +338,7 @@ def predict_risks(vitals):
     
     return risks
 
+@timed()
 def calculate_health_score(vitals):
     """Calculate overall health score from 0-100"""
     score = 100
@@ -201,3 +362,113 @@ def calculate_health_score(vitals):
         score -= min(15, abs(respiration_rate - 16) * 2)
     
     return max(0, min(100, round(score, 1)))
+
+# Vectorized risk flags and health scores over whole histories
+RISK_TYPES = ['Tachycardia', 'Bradycardia', 'Hypoxia', 'Fever', 'Hypothermia', 'Tachypnea', 'Bradypnea']
+RISK_TACHYCARDIA = 1 << 0
+RISK_BRADYCARDIA = 1 << 1
+RISK_HYPOXIA = 1 << 2
+RISK_FEVER = 1 << 3
+RISK_HYPOTHERMIA = 1 << 4
+RISK_TACHYPNEA = 1 << 5
+RISK_BRADYPNEA = 1 << 6
+
+SEVERITY_LEVELS = [None, 'MEDIUM', 'HIGH', 'CRITICAL']
+SEVERITY_RANK = {name: rank for rank, name in enumerate(SEVERITY_LEVELS) if name}
+
+def _vital_column(vitals, name, default):
+    """Column from a DataFrame or dict of arrays as float64; missing values take the scalar default"""
+    if name not in vitals:
+        length = len(vitals) if isinstance(vitals, pd.DataFrame) else len(next(iter(vitals.values())))
+        return np.full(length, default, dtype=np.float64)
+    column = np.asarray(vitals[name], dtype=np.float64)
+    return np.where(np.isnan(column), default, column)
+
+@timed()
+def predict_risks_batch(vitals):
+    """
+    Vectorized predict_risks over a DataFrame (or dict of columns)
+    Returns: flags (uint8 bitmask of RISK_* per row),
+             severities (int8 array [rows, len(RISK_TYPES)], index into SEVERITY_LEVELS),
+             max_severity (int8 per row)
+    """
+    hr = _vital_column(vitals, 'heart_rate', 0)
+    o2 = _vital_column(vitals, 'blood_oxygen', 100)
+    temp = _vital_column(vitals, 'temperature', 36.5)
+    resp = _vital_column(vitals, 'respiration_rate', 15)
+
+    medium, high, critical = 1, 2, 3
+    severities = np.zeros((len(hr), len(RISK_TYPES)), dtype=np.int8)
+    severities[:, 0] = np.where(hr > 100, np.where(hr > 120, high, medium), 0)
+    severities[:, 1] = np.where((hr < 60) & (hr > 0), medium, 0)
+    severities[:, 2] = np.where((o2 < 95) & (o2 > 0), np.where(o2 < 90, critical, high), 0)
+    severities[:, 3] = np.where(temp > 37.5, np.where(temp > 38.5, high, medium), 0)
+    severities[:, 4] = np.where(temp < 36.0, high, 0)
+    severities[:, 5] = np.where(resp > 20, medium, 0)
+    severities[:, 6] = np.where((resp < 12) & (resp > 0), medium, 0)
+
+    bits = (1 << np.arange(len(RISK_TYPES))).astype(np.uint8)
+    flags = ((severities > 0) * bits).sum(axis=1).astype(np.uint8)
+    return flags, severities, severities.max(axis=1, initial=0)
+
+def risks_from_flags(severities_row, vitals):
+    """Render one row of predict_risks_batch output as the strings predict_risks returns"""
+    heart_rate = vitals.get('heart_rate', 0)
+    blood_oxygen = vitals.get('blood_oxygen', 100)
+    temperature = vitals.get('temperature', 36.5)
+    respiration_rate = vitals.get('respiration_rate', 15)
+    templates = [
+        "Tachycardia - Heart rate {heart_rate} BPM is elevated",
+        "Bradycardia - Heart rate {heart_rate} BPM is low",
+        "Hypoxia - Blood oxygen {blood_oxygen}% is low",
+        "Fever - Temperature {temperature}°C is elevated",
+        "Hypothermia - Temperature {temperature}°C is low",
+        "Tachypnea - Respiration rate {respiration_rate} is elevated",
+        "Bradypnea - Respiration rate {respiration_rate} is low",
+    ]
+    risks = []
+    for template, severity in zip(templates, severities_row):
+        if severity:
+            message = template.format(heart_rate=heart_rate, blood_oxygen=blood_oxygen,
+                                      temperature=temperature, respiration_rate=respiration_rate)
+            risks.append(f"[{SEVERITY_LEVELS[severity]}] {message}")
+    return risks
+
+def _round_like_python(values, ndigits=1):
+    """np.round, with near-ties re-rounded by Python's correctly rounded round()"""
+    rounded = np.round(values, ndigits)
+    scaled = values * 10 ** ndigits
+    near_tie = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    for i in np.flatnonzero(near_tie):
+        rounded[i] = round(float(values[i]), ndigits)
+    return rounded
+
+@timed()
+def calculate_health_score_batch(vitals):
+    """Vectorized calculate_health_score: float64 score per row, identical to the scalar version"""
+    heart_rate = _vital_column(vitals, 'heart_rate', 75)
+    blood_oxygen = _vital_column(vitals, 'blood_oxygen', 98)
+    temperature = _vital_column(vitals, 'temperature', 36.5)
+    respiration_rate = _vital_column(vitals, 'respiration_rate', 16)
+
+    # Same deductions, applied in the same order as the scalar function
+    score = np.full(len(heart_rate), 100.0)
+    score -= np.where((heart_rate > 100) | (heart_rate < 60),
+                      np.minimum(20, np.abs(heart_rate - 80) / 2), 0)
+    score -= np.where(blood_oxygen < 95, (95 - blood_oxygen) * 3, 0)
+    score -= np.where((temperature > 37.5) | (temperature < 36.0),
+                      np.abs(temperature - 36.5) * 10, 0)
+    score -= np.where((respiration_rate > 20) | (respiration_rate < 12),
+                      np.minimum(15, np.abs(respiration_rate - 16) * 2), 0)
+
+    return np.clip(_round_like_python(score, 1), 0, 100)
+
+def health_score_trend(df, freq='1D'):
+    """Mean health score per user and time bucket (rows: timestamp buckets, columns: users)"""
+    scores = pd.DataFrame({
+        'timestamp': pd.to_datetime(df['timestamp']),
+        'user_id': df['user_id'] if 'user_id' in df.columns else 'user',
+        'health_score': calculate_health_score_batch(df),
+    })
+    trend = scores.groupby(['user_id', pd.Grouper(key='timestamp', freq=freq)], observed=True)['health_score'].mean()
+    return trend.unstack('user_id')
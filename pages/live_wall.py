@@ -0,0 +1,63 @@
+import streamlit as st
+from data import load_health_data, seed_at_risk_index
+from cohort import at_risk_index
+from live_monitor import (LiveMonitor, render_live_wall, LIVE_REFRESH_SECONDS, MAX_WALL_PATIENTS,
+                          WALL_COLUMNS)
+import instrumentation
+
+instrumentation.start_trace()
+
+st.set_page_config(page_title="Live Monitor", page_icon="📺", layout="wide")
+
+if not st.session_state.get("authentication_status"):
+    st.warning("Please log in on the main page first.")
+    st.stop()
+
+username = st.session_state.get("username")
+user_role = st.session_state.get("user_role", "Patient")
+
+st.title("📺 Live Monitor")
+
+# Patient list is read once per session; the wall itself never reloads whole histories
+if user_role == 'Doctor':
+    if 'live_patients' not in st.session_state:
+        patients = sorted(load_health_data().keys())
+        # Sickest patients first if the at-risk ranking is seeded by now, else alphabetical
+        top = [p['user_id'] for p in at_risk_index.top_at_risk(MAX_WALL_PATIENTS)] if seed_at_risk_index() else []
+        st.session_state.live_patients = patients
+        st.session_state.live_default = [user_id for user_id in top if user_id in patients] or patients[:MAX_WALL_PATIENTS]
+    patients = st.session_state.live_patients
+    selected = st.sidebar.multiselect(
+        "Patients on the wall", patients, default=st.session_state.live_default,
+        max_selections=MAX_WALL_PATIENTS)
+    if st.sidebar.button("Reload patient list", use_container_width=True):
+        del st.session_state.live_patients
+        st.rerun()
+else:
+    selected = [username]
+
+refresh_seconds = st.sidebar.slider("Refresh every (s)", 1.0, 30.0, LIVE_REFRESH_SECONDS, 0.5)
+columns = st.sidebar.slider("Tiles per row", 2, 8, WALL_COLUMNS)
+
+# Per-session cursor and buffers survive reruns; only the patient set is updated here
+if 'live_monitor' not in st.session_state:
+    st.session_state.live_monitor = LiveMonitor(selected)
+monitor = st.session_state.live_monitor
+monitor.set_patients(selected)
+
+
+@st.fragment(run_every=refresh_seconds)
+def live_wall():
+    """Reruns on its own timer without rerunning the page: new readings only"""
+    instrumentation.start_trace()
+    monitor.refresh()
+    if not monitor.feeds:
+        st.info("Select patients in the sidebar.")
+        return
+    render_live_wall(monitor, columns)
+    st.caption(f"{len(monitor.feeds)} patients · {monitor.last_new_readings} new readings this refresh · "
+               f"every {refresh_seconds:g}s")
+    instrumentation.render_debug_panel(st.container())
+
+
+live_wall()
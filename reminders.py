@@ -0,0 +1,443 @@
+import os
+import re
+import heapq
+import threading
+from datetime import datetime, timedelta
+from utils import load_data_from_json, update_json_file, try_acquire_lease
+from alerts import send_reminder_notification
+
+REMINDERS_FILE = 'reminders.json'
+
+# Seconds between state saves while there are unsaved changes, and between checks
+# of the state file for reminders added or cancelled by other processes
+PERSIST_INTERVAL = 5.0
+
+# Reminder ids reserved at a time from the shared id counter
+ID_BLOCK = 1000
+
+# Appointment reminders go out this long before the appointment
+APPOINTMENT_REMINDER_LEADS = [timedelta(hours=24), timedelta(hours=1)]
+
+# Frequency phrases -> dose times
+FREQUENCY_TIMES = [
+    (re.compile(r'\b(qid|four times (a|per) day|four times daily|4x daily)\b'), [(8, 0), (12, 0), (16, 0), (20, 0)]),
+    (re.compile(r'\b(tid|three times (a|per) day|three times daily|3x daily)\b'), [(8, 0), (14, 0), (20, 0)]),
+    (re.compile(r'\b(bid|twice (a|per) day|twice daily|2x daily)\b'), [(9, 0), (21, 0)]),
+    (re.compile(r'\b(once (a|per) day|once daily|daily|every day|qd)\b'), [(9, 0)]),
+    (re.compile(r'\b(morning)\b'), [(8, 0)]),
+    (re.compile(r'\b(bedtime|night|evening)\b'), [(21, 0)]),
+]
+_time_pattern = re.compile(r'\b(\d{1,2})(?::(\d{2}))?\s*(am|pm)?\b')
+_interval_pattern = re.compile(r'\bevery\s+(\d+)\s*(h|hr|hrs|hour|hours)\b')
+
+
+def parse_medication_schedule(schedule):
+    """
+    Parse a free-form medication schedule into a recurrence rule
+    Supports clock times ("08:00, 20:00", "8am and 8pm"), intervals ("every 8 hours")
+    and frequencies ("twice daily", "TID", "at bedtime"). Returns None if nothing matches.
+    """
+    text = str(schedule).lower().strip()
+
+    interval = _interval_pattern.search(text)
+    if interval and int(interval.group(1)) > 0:
+        return {'interval_hours': int(interval.group(1))}
+
+    times = []
+    for match in _time_pattern.finditer(text):
+        hour, minute, meridiem = int(match.group(1)), int(match.group(2) or 0), match.group(3)
+        # Bare numbers are only clock times when written as HH:MM or with am/pm
+        if match.group(2) is None and meridiem is None:
+            continue
+        if meridiem == 'pm' and hour < 12:
+            hour += 12
+        elif meridiem == 'am' and hour == 12:
+            hour = 0
+        if 0 <= hour < 24 and 0 <= minute < 60:
+            times.append((hour, minute))
+    if times:
+        return {'times': sorted(set(times))}
+
+    for pattern, default_times in FREQUENCY_TIMES:
+        if pattern.search(text):
+            return {'times': default_times}
+    return None
+
+
+def to_local_naive(value):
+    """Naive local time for a datetime; offset-aware values are converted first"""
+    if value.tzinfo is not None:
+        return value.astimezone().replace(tzinfo=None)
+    return value
+
+
+def parse_appointment_time(date_time):
+    """Naive local datetime for an appointment's date_time string (ISO or 'YYYY-MM-DD HH:MM'), or None"""
+    if isinstance(date_time, datetime):
+        return to_local_naive(date_time)
+    text = str(date_time).strip()
+    try:
+        return to_local_naive(datetime.fromisoformat(text))
+    except ValueError:
+        pass
+    for fmt in ('%Y-%m-%d %H:%M', '%Y-%m-%d %I:%M %p', '%d/%m/%Y %H:%M', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def next_occurrence(rule, after):
+    """First occurrence of a recurrence rule strictly after `after`"""
+    if 'interval_hours' in rule:
+        # Anchor intervals at midnight so restarts keep the same dose times
+        step = timedelta(hours=rule['interval_hours'])
+        midnight = after.replace(hour=0, minute=0, second=0, microsecond=0)
+        elapsed = (after - midnight) // step + 1
+        return midnight + elapsed * step
+    for day_offset in (0, 1):
+        day = after.date() + timedelta(days=day_offset)
+        for hour, minute in rule['times']:
+            candidate = datetime.combine(day, datetime.min.time()).replace(hour=hour, minute=minute)
+            if candidate > after:
+                return candidate
+    return None
+
+
+def iter_occurrences(rule, start, end):
+    """All occurrences of a rule in (start, end]"""
+    current = next_occurrence(rule, start)
+    while current is not None and current <= end:
+        yield current
+        current = next_occurrence(rule, current)
+
+
+def _stored_next_id(state):
+    return state.get('next_id', max((r['id'] for r in state.get('reminders', [])), default=0) + 1)
+
+
+def _file_signature(filename):
+    try:
+        stat = os.stat(filename)
+        return (stat.st_mtime_ns, stat.st_size)
+    except FileNotFoundError:
+        return None
+
+
+class ReminderScheduler:
+    """
+    Heap-based reminder queue served by a background thread
+    Inserts and fires are O(log n). While idle the runner sleeps until the next due
+    reminder; a second thread saves changes at most every PERSIST_INTERVAL seconds,
+    so slow writes never delay a reminder or an insert.
+
+    Several processes (e.g. Streamlit servers) may share the state file:
+    - ids come from blocks of ID_BLOCK reserved in a small `<state_file>.ids` counter
+    - saves merge this process's added, changed and removed reminders by id
+    - every PERSIST_INTERVAL the file is re-read if another process wrote it, so
+      reminders added or cancelled elsewhere show up here
+    - only the process holding the `<state_file>.owner` lease fires reminders; the
+      others take over the lease when its holder exits
+    """
+
+    def __init__(self, state_file=REMINDERS_FILE, notify=send_reminder_notification):
+        self.state_file = state_file
+        self.notify = notify
+        self._heap = []
+        self._reminders = {}
+        self._next_id = 1
+        self._id_limit = 0
+        self._changed = set()
+        self._removed = set()
+        self._signature = None
+        self._lease = None
+        self._condition = threading.Condition()
+        self._dirty = threading.Event()
+        self._stop = False
+        self._stopped = threading.Event()
+        self._thread = None
+        self._persist_thread = None
+
+    @property
+    def is_owner(self):
+        """True if this process fires the reminders"""
+        return self._lease is not None
+
+    def load(self):
+        signature = _file_signature(self.state_file)
+        state = load_data_from_json(self.state_file)
+        with self._condition:
+            self._heap = []
+            self._reminders = {}
+            for reminder in state.get('reminders', []):
+                self._reminders[reminder['id']] = reminder
+                self._heap.append((reminder['fire_at'], reminder['id']))
+            heapq.heapify(self._heap)
+            self._next_id = max(self._next_id, _stored_next_id(state))
+            self._changed.clear()
+            self._removed.clear()
+            self._signature = signature
+            self._condition.notify()
+
+    def _sync(self, state):
+        """
+        Fold the stored reminders into memory (caller holds the lock)
+        Reminders with unsaved local changes keep the local version; anything else
+        missing from the file was fired or cancelled by another process.
+        """
+        stored = {r['id']: r for r in state.get('reminders', [])}
+        for reminder_id in [rid for rid in self._reminders if rid not in stored and rid not in self._changed]:
+            del self._reminders[reminder_id]
+        woken = False
+        for reminder_id, reminder in stored.items():
+            if reminder_id in self._changed or reminder_id in self._removed:
+                continue
+            current = self._reminders.get(reminder_id)
+            self._reminders[reminder_id] = reminder
+            if current is None or current['fire_at'] != reminder['fire_at']:
+                heapq.heappush(self._heap, (reminder['fire_at'], reminder_id))
+                woken = woken or self._heap[0][1] == reminder_id
+        # Processes that do not fire never pop superseded entries; drop them here
+        if len(self._heap) > 2 * len(self._reminders) + 64:
+            self._heap = [(r['fire_at'], rid) for rid, r in self._reminders.items()]
+            heapq.heapify(self._heap)
+            woken = True
+        if woken:
+            self._condition.notify()
+
+    def persist(self):
+        """Merge this process's changes since the last save into the state file"""
+        with self._condition:
+            changed = {rid: dict(self._reminders[rid]) for rid in self._changed if rid in self._reminders}
+            removed = set(self._removed)
+            self._changed.clear()
+            self._removed.clear()
+            self._dirty.clear()
+
+        def merge(state):
+            reminders = {r['id']: r for r in state.get('reminders', []) if r['id'] not in removed}
+            reminders.update(changed)
+            state['reminders'] = list(reminders.values())
+            state['next_id'] = max(_stored_next_id(state), self._next_id)
+            # Pick up what other processes saved since our last read
+            with self._condition:
+                self._sync(state)
+
+        try:
+            update_json_file(self.state_file, merge)
+            self._signature = _file_signature(self.state_file)
+        except Exception:
+            # Keep the changes for the next save
+            with self._condition:
+                self._changed.update(rid for rid in changed if rid in self._reminders)
+                self._removed.update(removed)
+            self._dirty.set()
+            raise
+
+    def reload_if_changed(self):
+        """Re-read the state file if another process wrote it since our last read or save"""
+        signature = _file_signature(self.state_file)
+        if signature is None or signature == self._signature:
+            return False
+        state = load_data_from_json(self.state_file)
+        with self._condition:
+            self._sync(state)
+            self._signature = signature
+        return True
+
+    def _reserve_ids(self):
+        """Reserve the next ID_BLOCK ids from the shared counter (caller holds the lock)"""
+        reserved = []
+
+        def reserve(counter):
+            start = max(counter.get('next_id', 1), self._next_id)
+            counter['next_id'] = start + ID_BLOCK
+            reserved.append(start)
+
+        update_json_file(self.state_file + '.ids', reserve)
+        self._next_id, self._id_limit = reserved[0], reserved[0] + ID_BLOCK
+
+    def add(self, fire_at, message, user_id=None, kind='reminder', rule=None, contact=None):
+        """Queue a reminder; `rule` makes it recur (see parse_medication_schedule)"""
+        if isinstance(fire_at, str):
+            fire_at = parse_appointment_time(fire_at)
+        if fire_at is None:
+            raise ValueError("Reminder time could not be parsed")
+        # The runner compares against naive datetime.now()
+        fire_at = to_local_naive(fire_at)
+        with self._condition:
+            if self._next_id >= self._id_limit:
+                self._reserve_ids()
+            reminder_id = self._next_id
+            self._next_id += 1
+            reminder = {
+                'id': reminder_id,
+                'fire_at': fire_at.isoformat(),
+                'message': message,
+                'user_id': user_id,
+                'kind': kind,
+                'rule': rule,
+                'contact': contact or {},
+            }
+            self._reminders[reminder_id] = reminder
+            self._changed.add(reminder_id)
+            heapq.heappush(self._heap, (reminder['fire_at'], reminder_id))
+            # Wake the runner only if its next deadline changed
+            if self._heap[0][1] == reminder_id:
+                self._condition.notify()
+        self._dirty.set()
+        return reminder_id
+
+    def cancel(self, reminder_id):
+        """Cancel a reminder; its heap entry is skipped when it comes due"""
+        with self._condition:
+            removed = self._reminders.pop(reminder_id, None) is not None
+            if removed:
+                self._changed.discard(reminder_id)
+                self._removed.add(reminder_id)
+        if removed:
+            self._dirty.set()
+        return removed
+
+    def pending(self, user_id=None):
+        with self._condition:
+            reminders = [r for r in self._reminders.values() if user_id is None or r['user_id'] == user_id]
+        return sorted(reminders, key=lambda r: r['fire_at'])
+
+    def __len__(self):
+        return len(self._reminders)
+
+    def start(self):
+        with self._condition:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop = False
+            self._stopped.clear()
+            self._take_lease()
+            self._thread = threading.Thread(target=self._run, name='reminder-scheduler', daemon=True)
+            self._persist_thread = threading.Thread(target=self._persist_loop, name='reminder-persist', daemon=True)
+            self._thread.start()
+            self._persist_thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._stop = True
+            self._condition.notify()
+        self._stopped.set()
+        for thread in (self._thread, self._persist_thread):
+            if thread is not None:
+                thread.join()
+        self.persist()
+        with self._condition:
+            if self._lease is not None:
+                self._lease.close()
+                self._lease = None
+
+    def _take_lease(self):
+        """Become the process that fires reminders if no other process is (caller holds the lock)"""
+        if self._lease is None:
+            self._lease = try_acquire_lease(self.state_file + '.owner')
+            if self._lease is not None:
+                self._condition.notify()
+
+    def _pop_due(self, now):
+        """Remove and return reminders due at or before now (caller holds the lock)"""
+        due = []
+        now_iso = now.isoformat()
+        while self._heap and self._heap[0][0] <= now_iso:
+            fire_at, reminder_id = heapq.heappop(self._heap)
+            reminder = self._reminders.get(reminder_id)
+            # Skip cancelled reminders and superseded heap entries
+            if reminder is None or reminder['fire_at'] != fire_at:
+                continue
+            due.append(reminder)
+            next_fire = None
+            if reminder['rule']:
+                # After downtime, resume from now instead of replaying every missed dose
+                next_fire = next_occurrence(reminder['rule'], max(datetime.fromisoformat(fire_at), now))
+            if next_fire is not None:
+                reminder['fire_at'] = next_fire.isoformat()
+                self._changed.add(reminder_id)
+                heapq.heappush(self._heap, (reminder['fire_at'], reminder_id))
+            else:
+                del self._reminders[reminder_id]
+                self._changed.discard(reminder_id)
+                self._removed.add(reminder_id)
+        if due:
+            self._dirty.set()
+        return due
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if self._stop:
+                    return
+                now = datetime.now()
+                # Only the lease holder fires; the others wait until they take over
+                due = self._pop_due(now) if self.is_owner else []
+                if not due:
+                    timeout = None
+                    if self._heap and self.is_owner:
+                        timeout = max(0.0, (datetime.fromisoformat(self._heap[0][0]) - now).total_seconds())
+                    self._condition.wait(timeout)
+            for reminder in due:
+                try:
+                    self.notify(reminder['user_id'], reminder['message'], **reminder['contact'])
+                except Exception as e:
+                    print(f"❌ Failed to deliver reminder {reminder['id']}: {e}")
+
+    def _persist_loop(self):
+        while not self._stopped.wait(PERSIST_INTERVAL):
+            try:
+                # Changes in a burst are coalesced into one save per interval
+                if self._dirty.is_set():
+                    self.persist()
+                else:
+                    self.reload_if_changed()
+                with self._condition:
+                    self._take_lease()
+            except Exception as e:
+                print(f"❌ Failed to sync reminders: {e}")
+
+
+def schedule_medication_reminders(scheduler, user_id, med_name, schedule, contact=None, now=None):
+    """Recurring reminders for a medication; returns the reminder id or None if unparseable"""
+    rule = parse_medication_schedule(schedule)
+    if rule is None:
+        print(f"⚠️ Could not parse schedule '{schedule}' for {med_name}. No reminders set.")
+        return None
+    first = next_occurrence(rule, now or datetime.now())
+    return scheduler.add(first, f"Time to take {med_name} ({schedule})", user_id,
+                         kind='medication', rule=rule, contact=contact)
+
+
+def schedule_appointment_reminders(scheduler, user_id, doctor, date_time, reason, contact=None, now=None):
+    """One-off reminders ahead of an appointment; returns the reminder ids"""
+    appointment_time = parse_appointment_time(date_time)
+    if appointment_time is None:
+        print(f"⚠️ Could not parse appointment time '{date_time}'. No reminders set.")
+        return []
+    now = now or datetime.now()
+    ids = []
+    for lead in APPOINTMENT_REMINDER_LEADS:
+        fire_at = appointment_time - lead
+        if fire_at > now:
+            message = f"Appointment with {doctor} at {appointment_time:%Y-%m-%d %H:%M}: {reason}"
+            ids.append(scheduler.add(fire_at, message, user_id, kind='appointment', contact=contact))
+    return ids
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_reminder_scheduler():
+    """Process-wide scheduler, restored from REMINDERS_FILE and started on first use"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = ReminderScheduler()
+            _scheduler.load()
+            _scheduler.start()
+    return _scheduler
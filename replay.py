@@ -0,0 +1,363 @@
+"""Replay stored history through the current alert rules, anomaly model and health score.
+
+Usage: python replay.py OUTPUT_DIR [--partitions 4] [--chunk-rows 200000] [--users a,b]
+                        [--start 2024-01-01] [--end 2024-02-01] [--format parquet|csv] [--fresh]
+
+Patients are split into partitions by the same stable hash as sharding.py, and
+each partition is replayed in time order, in chunks of about `chunk_rows`
+readings across its patients. Every chunk is written as one part file
+(derived columns per reading, plus the raised alerts as JSON lines) before the
+partition's checkpoint moves past it, so an interrupted run resumes from the
+last finished chunk. Partitions run in parallel worker processes; alert
+suppression is per patient, so it is exact within each partition.
+"""
+import os
+import json
+import hashlib
+import pickle
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from alerts import AlertSuppressor, ALERT_RULES, check_vitals_batch, alerts_from_flags
+from data import get_user_health_df, load_health_data
+from exports import PARQUET_AVAILABLE, PARQUET_COMPRESSION
+from models import calculate_health_score_batch, predict_risks_batch
+from sharding import shard_for
+from utils import save_data_to_json, load_data_from_json
+from vitals_store import (vitals_store_enabled, user_store_exists, read_user_vitals, records_to_array,
+                          vitals_to_dataframe, VITALS_DTYPE)
+
+if PARQUET_AVAILABLE:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+CHUNK_ROWS = 200000
+MANIFEST_FILE = 'replay.json'
+MODEL_FILE = 'model.pkl'
+
+DERIVED_COLUMNS = ['user_id', 'timestamp', 'health_score', 'max_severity', 'risk_flags', 'alert_rules', 'anomaly']
+
+
+def _to_ns(value):
+    return None if value is None else int(pd.Timestamp(value).value)
+
+
+def _checkpoint_path(output_dir, partition):
+    return os.path.join(output_dir, f'checkpoint-{partition:02d}.json')
+
+
+def _part_name(partition, seq, fmt):
+    return f'part-{partition:02d}-{seq:06d}.{fmt}'
+
+
+def _read_range(user_id, start_ns=None, end_ns=None):
+    """A user's readings with start <= timestamp < end as a VITALS_DTYPE array"""
+    start = None if start_ns is None else pd.Timestamp(start_ns)
+    end = None if end_ns is None else pd.Timestamp(end_ns)
+    if vitals_store_enabled():
+        if not user_store_exists(user_id):
+            get_user_health_df(user_id, start, end)  # backfills the user's store from JSON
+        return read_user_vitals(user_id, start, end)
+    # JSON backend: every window re-reads the store, so large replays want the vitals store
+    df = get_user_health_df(user_id, start, end)
+    if df.empty:
+        return np.zeros(0, dtype=VITALS_DTYPE)
+    return records_to_array(df.astype(object).where(df.notna(), None).to_dict('records'))
+
+
+def plan_replay(user_ids=None, partitions=1, chunk_rows=CHUNK_ROWS, start=None, end=None):
+    """
+    Split patients into partitions and size each partition's time window
+    so that one window holds about chunk_rows readings across its patients.
+    """
+    if user_ids is None:
+        user_ids = sorted(load_health_data().keys())
+    start_ns, end_ns = _to_ns(start), _to_ns(end)
+    plan = {'start': start_ns, 'end': end_ns, 'chunk_rows': chunk_rows, 'partitions': []}
+    members = [[] for _ in range(partitions)]
+    for user_id in user_ids:
+        members[shard_for(user_id, partitions)].append(user_id)
+
+    for partition, users in enumerate(members):
+        rows, first, last = 0, None, None
+        for user_id in users:
+            arr = _read_range(user_id, start_ns, end_ns)
+            if len(arr):
+                rows += len(arr)
+                first = int(arr['timestamp'][0]) if first is None else min(first, int(arr['timestamp'][0]))
+                last = int(arr['timestamp'][-1]) if last is None else max(last, int(arr['timestamp'][-1]))
+        window = None
+        if rows:
+            span = last - first + 1
+            window = max(int(span * min(1.0, chunk_rows / rows)), 1)
+        plan['partitions'].append({'partition': partition, 'users': users, 'rows': rows,
+                                   'first': first, 'last': last, 'window_ns': window})
+    return plan
+
+
+def _read_chunk(users, lo, hi, context=0):
+    """
+    Readings of all users with lo <= timestamp < hi in time order, as (user ids, frame, skip)
+    Each user's last `context` readings before lo come first (the leading `skip` rows),
+    so rolling-window features carry across chunk boundaries.
+    """
+    arrays, owners = [], []
+    skip = 0
+    for user_id in users:
+        arr = _read_range(user_id, lo, hi)
+        if not len(arr):
+            continue
+        if context:
+            before = _read_range(user_id, None, lo)[-context:]
+            skip += len(before)
+            arrays.append(np.asarray(before))
+            owners.append(np.full(len(before), user_id, dtype=object))
+        arrays.append(np.asarray(arr))
+        owners.append(np.full(len(arr), user_id, dtype=object))
+    if not arrays:
+        return None, None, 0
+    merged = np.concatenate(arrays)
+    user_ids = np.concatenate(owners)
+    # Context rows are all earlier than lo, so they sort to the front
+    order = np.argsort(merged['timestamp'], kind='stable')
+    return user_ids[order], vitals_to_dataframe(merged[order]), skip
+
+
+def derive_chunk(user_ids, df, scorer, suppressor, skip=0):
+    """Derived columns per reading and the alerts raised for one chunk (after `skip` context rows)"""
+    anomalies = scorer.score(df.assign(user_id=user_ids))[skip:]
+    user_ids, df = user_ids[skip:], df.iloc[skip:].reset_index(drop=True)
+    scores = calculate_health_score_batch(df)
+    risk_flags, _, max_severity = predict_risks_batch(df)
+
+    flags, thresholds = check_vitals_batch(user_ids, df)
+    rule_bits = (1 << np.arange(len(ALERT_RULES))).astype(np.uint8)
+    alert_rules = (flags * rule_bits).sum(axis=1).astype(np.uint8)
+    timestamps = df['timestamp'].to_numpy(dtype='datetime64[us]')
+    alerts = suppressor.filter(alerts_from_flags(flags, thresholds, user_ids, df, record=False,
+                                                 timestamps=timestamps))
+
+    derived = pd.DataFrame({
+        'user_id': user_ids,
+        'timestamp': df['timestamp'].to_numpy(),
+        'health_score': scores.astype(np.float32),
+        'max_severity': max_severity,
+        'risk_flags': risk_flags,
+        'alert_rules': alert_rules,
+        'anomaly': anomalies,
+    })
+    return derived, alerts
+
+
+def _write_part(derived, alerts, output_dir, name, fmt):
+    """Write a part and its alerts through temp files, so a crash never leaves half a part"""
+    path = os.path.join(output_dir, name)
+    tmp = path + '.tmp'
+    if fmt == 'parquet':
+        pq.write_table(pa.Table.from_pandas(derived, preserve_index=False), tmp, compression=PARQUET_COMPRESSION)
+    else:
+        derived.to_csv(tmp, index=False)
+    os.replace(tmp, path)
+
+    alerts_path = os.path.join(output_dir, os.path.splitext(name)[0] + '.alerts.jsonl')
+    with open(alerts_path + '.tmp', 'w', encoding='utf-8') as f:
+        for alert in alerts:
+            f.write(json.dumps(alert) + '\n')
+    os.replace(alerts_path + '.tmp', alerts_path)
+
+
+def replay_partition(output_dir, partition):
+    """Replay one partition from its checkpoint to the end; returns its final checkpoint"""
+    manifest = load_data_from_json(os.path.join(output_dir, MANIFEST_FILE))
+    spec = manifest['partitions'][partition]
+    checkpoint_file = _checkpoint_path(output_dir, partition)
+    checkpoint = load_data_from_json(checkpoint_file) or {
+        'partition': partition, 'next_start': spec['first'], 'seq': 0,
+        'rows': 0, 'alerts': 0, 'anomalies': 0, 'seconds': 0.0, 'done': spec['rows'] == 0,
+        'suppressor': {},
+    }
+    if checkpoint['done']:
+        return checkpoint
+
+    with open(os.path.join(output_dir, MODEL_FILE), 'rb') as f:
+        scorer = pickle.load(f)
+    suppressor = AlertSuppressor()
+    suppressor.restore(checkpoint['suppressor'])
+
+    stop = spec['last'] + 1 if manifest['end'] is None else min(manifest['end'], spec['last'] + 1)
+    while checkpoint['next_start'] < stop:
+        started = time.perf_counter()
+        lo = checkpoint['next_start']
+        hi = min(lo + spec['window_ns'], stop)
+        user_ids, df, skip = _read_chunk(spec['users'], lo, hi, scorer.context_rows)
+        if df is not None:
+            derived, alerts = derive_chunk(user_ids, df, scorer, suppressor, skip)
+            _write_part(derived, alerts, output_dir, _part_name(partition, checkpoint['seq'], manifest['format']),
+                        manifest['format'])
+            checkpoint['seq'] += 1
+            checkpoint['rows'] += len(derived)
+            checkpoint['alerts'] += len(alerts)
+            checkpoint['anomalies'] += int(derived['anomaly'].sum())
+        checkpoint['next_start'] = hi
+        checkpoint['suppressor'] = suppressor.snapshot()
+        checkpoint['seconds'] += time.perf_counter() - started
+        save_data_to_json(checkpoint, checkpoint_file)
+
+    checkpoint['done'] = True
+    save_data_to_json(checkpoint, checkpoint_file)
+    return checkpoint
+
+
+def _run_params(user_ids, partitions, chunk_rows, start, end, fmt):
+    """Settings that decide a run's output; a resume must repeat them"""
+    return {'user_ids': None if user_ids is None else list(user_ids), 'partitions': partitions,
+            'chunk_rows': chunk_rows, 'start': _to_ns(start), 'end': _to_ns(end), 'format': fmt}
+
+
+def model_fingerprint(model_bytes):
+    """Hash of a pickled scorer, so a retrained model is told apart from the one a run started with"""
+    return hashlib.sha256(model_bytes).hexdigest()
+
+
+def _open_run(output_dir, user_ids, partitions, chunk_rows, start, end, fmt, scorer, fresh):
+    """
+    Load the run's manifest, or plan a new run and save its manifest and model
+    Resuming with different settings, or with a scorer other than the saved one, raises
+    ValueError instead of returning the old run's results. Without a scorer a resume
+    keeps the saved model; start fresh to refit it on the current history.
+    """
+    manifest_file = os.path.join(output_dir, MANIFEST_FILE)
+    if fresh and os.path.exists(output_dir):
+        shutil.rmtree(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    params = _run_params(user_ids, partitions, chunk_rows, start, end, fmt)
+    model_bytes = None if scorer is None else pickle.dumps(scorer, protocol=pickle.HIGHEST_PROTOCOL)
+    if os.path.exists(manifest_file):
+        manifest = load_data_from_json(manifest_file)
+        stored = manifest.get('params', {})
+        changed = [key for key, value in params.items() if stored.get(key) != value]
+        if model_bytes is not None and model_fingerprint(model_bytes) != manifest['model'].get('fingerprint'):
+            changed.append('scorer')
+        if changed:
+            raise ValueError(f"{output_dir} holds a replay with different {', '.join(changed)}; "
+                             f"resume with the same settings or start fresh (--fresh)")
+        return manifest
+
+    if scorer is None:
+        from models import AnomalyScorer
+        scorer = AnomalyScorer().fit_from_storage()
+        model_bytes = pickle.dumps(scorer, protocol=pickle.HIGHEST_PROTOCOL)
+    with open(os.path.join(output_dir, MODEL_FILE), 'wb') as f:
+        f.write(model_bytes)
+    manifest = plan_replay(user_ids, partitions, chunk_rows, start, end)
+    manifest.update({'format': fmt, 'params': params, 'created_at': pd.Timestamp.now().isoformat(),
+                     'model': {'source': scorer.source, 'rows': scorer.rows,
+                               'fingerprint': model_fingerprint(model_bytes)}})
+    save_data_to_json(manifest, manifest_file)
+    return manifest
+
+
+def run_replay(output_dir, user_ids=None, partitions=1, chunk_rows=CHUNK_ROWS, start=None, end=None,
+               fmt=None, scorer=None, max_workers=None, fresh=False):
+    """
+    Replay (or resume replaying) history into output_dir; returns a run summary
+    The anomaly model is the given scorer, or one fitted on stored history, and is
+    saved with the run so resumed partitions score with the same model. Resuming
+    with other settings or another scorer raises ValueError unless fresh=True.
+    """
+    fmt = fmt or ('parquet' if PARQUET_AVAILABLE else 'csv')
+    if fmt == 'parquet' and not PARQUET_AVAILABLE:
+        raise ImportError("Parquet output requires pyarrow (pip install pyarrow)")
+    manifest = _open_run(output_dir, user_ids, partitions, chunk_rows, start, end, fmt, scorer, fresh)
+
+    started = time.perf_counter()
+    if partitions == 1 or max_workers == 1:
+        checkpoints = [replay_partition(output_dir, p) for p in range(partitions)]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers or min(partitions, os.cpu_count() or 1)) as executor:
+            futures = [executor.submit(replay_partition, output_dir, p) for p in range(partitions)]
+            checkpoints = [future.result() for future in futures]
+    elapsed = time.perf_counter() - started
+
+    rows = sum(c['rows'] for c in checkpoints)
+    return {
+        'output_dir': output_dir,
+        'format': manifest['format'],
+        'partitions': partitions,
+        'rows': rows,
+        'planned_rows': sum(p['rows'] for p in manifest['partitions']),
+        'alerts': sum(c['alerts'] for c in checkpoints),
+        'alerts_suppressed': sum(c['suppressor'].get('suppressed', 0) for c in checkpoints),
+        'anomalies': sum(c['anomalies'] for c in checkpoints),
+        'seconds': elapsed,
+        'rows_per_s': rows / elapsed if elapsed else None,
+    }
+
+
+def replay_progress(output_dir):
+    """Rows replayed so far per partition, from the checkpoints"""
+    manifest = load_data_from_json(os.path.join(output_dir, MANIFEST_FILE))
+    progress = []
+    for spec in manifest['partitions']:
+        checkpoint = load_data_from_json(_checkpoint_path(output_dir, spec['partition']))
+        progress.append({'partition': spec['partition'], 'planned_rows': spec['rows'],
+                         'rows': checkpoint.get('rows', 0), 'done': checkpoint.get('done', False)})
+    return progress
+
+
+def load_replay_results(output_dir, user_id=None):
+    """Derived rows of a replay (optionally one patient) in time order"""
+    manifest = load_data_from_json(os.path.join(output_dir, MANIFEST_FILE))
+    fmt = manifest['format']
+    partitions = range(len(manifest['partitions']))
+    if user_id is not None:
+        partitions = [shard_for(user_id, len(manifest['partitions']))]
+    frames = []
+    for partition in partitions:
+        prefix = f'part-{partition:02d}-'
+        for name in sorted(os.listdir(output_dir)):
+            if name.startswith(prefix) and name.endswith('.' + fmt):
+                path = os.path.join(output_dir, name)
+                frame = pd.read_parquet(path) if fmt == 'parquet' else pd.read_csv(path, parse_dates=['timestamp'])
+                frames.append(frame[frame['user_id'] == user_id] if user_id is not None else frame)
+    if not frames:
+        return pd.DataFrame(columns=DERIVED_COLUMNS)
+    return pd.concat(frames, ignore_index=True).sort_values('timestamp', kind='stable', ignore_index=True)
+
+
+def load_replay_alerts(output_dir):
+    """All alerts raised by a replay, in part order"""
+    alerts = []
+    for name in sorted(os.listdir(output_dir)):
+        if name.endswith('.alerts.jsonl'):
+            with open(os.path.join(output_dir, name), encoding='utf-8') as f:
+                alerts.extend(json.loads(line) for line in f)
+    return alerts
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('output_dir')
+    parser.add_argument('--partitions', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--workers', type=int, help='worker processes (default: one per partition, up to the core count)')
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS)
+    parser.add_argument('--users', help='comma separated user ids (default: every stored patient)')
+    parser.add_argument('--start')
+    parser.add_argument('--end')
+    parser.add_argument('--format', choices=['parquet', 'csv'])
+    parser.add_argument('--fresh', action='store_true', help='discard checkpoints and start over')
+    args = parser.parse_args()
+
+    summary = run_replay(args.output_dir, args.users.split(',') if args.users else None, args.partitions,
+                         args.chunk_rows, args.start, args.end, args.format, max_workers=args.workers,
+                         fresh=args.fresh)
+    print(f"Replayed {summary['rows']:,} of {summary['planned_rows']:,} readings in {summary['seconds']:.1f}s "
+          f"({summary['rows_per_s'] or 0:,.0f} rows/s) into {summary['output_dir']} ({summary['format']})")
+    print(f"{summary['alerts']:,} alerts raised ({summary['alerts_suppressed']:,} suppressed), "
+          f"{summary['anomalies']:,} anomalies")
@@ -0,0 +1,261 @@
+import io
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from data import iter_user_history_chunks
+from models import predict_risks_batch, calculate_health_score_batch, RISK_TYPES
+
+VITAL_COLUMNS = ['heart_rate', 'blood_oxygen', 'temperature', 'respiration_rate']
+VITAL_LABELS = {
+    'heart_rate': 'Heart Rate (BPM)',
+    'blood_oxygen': 'Blood Oxygen (%)',
+    'temperature': 'Temperature (°C)',
+    'respiration_rate': 'Respiration Rate',
+}
+
+# Page layout (points)
+PAGE_MARGIN = 50
+ROW_HEIGHT = 14
+
+
+class DailySummary:
+    """Per-day aggregates folded in chunk by chunk; memory grows with days, not readings"""
+
+    def __init__(self):
+        self.parts = []
+        self.risk_counts = np.zeros(len(RISK_TYPES), dtype=np.int64)
+        self.readings = 0
+        self.first = None
+        self.last = None
+
+    def add_chunk(self, chunk):
+        if chunk.empty:
+            return
+        timestamps = pd.to_datetime(chunk['timestamp'])
+        frame = pd.DataFrame({'day': timestamps.dt.normalize()})
+        for col in VITAL_COLUMNS:
+            if col in chunk.columns:
+                frame[col] = pd.to_numeric(chunk[col], errors='coerce').to_numpy(dtype=np.float64)
+        frame['health_score'] = calculate_health_score_batch(chunk)
+        _, severities, max_severity = predict_risks_batch(chunk)
+        frame['at_risk'] = max_severity > 0
+        self.risk_counts += (severities > 0).sum(axis=0)
+
+        value_cols = [c for c in frame.columns if c != 'day']
+        grouped = frame.groupby('day')
+        part = pd.concat({
+            'sum': grouped[value_cols].sum(),
+            'count': grouped[value_cols].count(),
+            'min': grouped[value_cols].min(),
+            'max': grouped[value_cols].max(),
+        }, axis=1)
+        self.parts.append(part)
+        # Collapse periodically so memory stays bounded by the number of days
+        if len(self.parts) >= 16:
+            self.parts = [self._combine()]
+
+        self.readings += len(chunk)
+        self.first = timestamps.iloc[0] if self.first is None else self.first
+        self.last = timestamps.iloc[-1]
+
+    def _combine(self):
+        stacked = pd.concat(self.parts)
+        return pd.concat({
+            'sum': stacked['sum'].groupby(level=0).sum(),
+            'count': stacked['count'].groupby(level=0).sum(),
+            'min': stacked['min'].groupby(level=0).min(),
+            'max': stacked['max'].groupby(level=0).max(),
+        }, axis=1)
+
+    def daily(self):
+        """DataFrame indexed by day with mean/min/max per vital, mean health score and at-risk share"""
+        if not self.parts:
+            return pd.DataFrame()
+        combined = self._combine()
+        means = combined['sum'] / combined['count'].replace(0, np.nan)
+        daily = pd.DataFrame(index=combined.index)
+        daily['readings'] = combined['count']['health_score'].astype(int)
+        for col in VITAL_COLUMNS:
+            if col in means.columns:
+                daily[f'{col}_mean'] = means[col]
+                daily[f'{col}_min'] = combined['min'][col]
+                daily[f'{col}_max'] = combined['max'][col]
+        daily['health_score_mean'] = means['health_score']
+        daily['at_risk_pct'] = means['at_risk'] * 100
+        return daily.sort_index()
+
+    def overall(self, daily):
+        """Period-wide mean/min/max per vital"""
+        rows = []
+        weights = daily['readings']
+        for col in VITAL_COLUMNS + ['health_score']:
+            if f'{col}_mean' not in daily.columns:
+                continue
+            rows.append({
+                'metric': VITAL_LABELS.get(col, 'Health Score'),
+                'mean': float(np.average(daily[f'{col}_mean'].fillna(0), weights=weights)),
+                'min': float(daily[f'{col}_min'].min()) if f'{col}_min' in daily.columns else None,
+                'max': float(daily[f'{col}_max'].max()) if f'{col}_max' in daily.columns else None,
+            })
+        return rows
+
+
+def render_trend_chart(daily, width_in=7.0, height_in=4.2):
+    """Pre-render daily mean trends as a PNG (bytes) for embedding"""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    fig, axes = plt.subplots(2, 2, figsize=(width_in, height_in), sharex=True)
+    for ax, col in zip(axes.ravel(), VITAL_COLUMNS):
+        if f'{col}_mean' in daily.columns:
+            ax.fill_between(daily.index, daily[f'{col}_min'], daily[f'{col}_max'], alpha=0.2)
+            ax.plot(daily.index, daily[f'{col}_mean'], linewidth=1)
+        ax.set_title(VITAL_LABELS[col], fontsize=8)
+        ax.tick_params(labelsize=6)
+    fig.autofmt_xdate()
+    fig.tight_layout()
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', dpi=150)
+    plt.close(fig)
+    return buffer.getvalue()
+
+
+class _PagedCanvas:
+    """reportlab canvas wrapper that starts a new page when the cursor runs out"""
+
+    def __init__(self, filename, title):
+        from reportlab.lib.pagesizes import letter
+        from reportlab.pdfgen import canvas
+        self.canvas = canvas.Canvas(filename, pagesize=letter)
+        self.width, self.height = letter
+        self.title = title
+        self.page = 1
+        self.y = self.height - PAGE_MARGIN
+
+    def _footer(self):
+        self.canvas.setFont('Helvetica', 8)
+        self.canvas.drawString(PAGE_MARGIN, PAGE_MARGIN / 2, self.title)
+        self.canvas.drawRightString(self.width - PAGE_MARGIN, PAGE_MARGIN / 2, f"Page {self.page}")
+
+    def new_page(self):
+        self._footer()
+        self.canvas.showPage()
+        self.page += 1
+        self.y = self.height - PAGE_MARGIN
+
+    def ensure(self, height, on_new_page=None):
+        if self.y - height < PAGE_MARGIN:
+            self.new_page()
+            if on_new_page:
+                on_new_page()
+
+    def text(self, value, size=10, bold=False, x=PAGE_MARGIN):
+        self.ensure(size + 6)
+        self.canvas.setFont('Helvetica-Bold' if bold else 'Helvetica', size)
+        self.canvas.drawString(x, self.y - size, str(value))
+        self.y -= size + 6
+
+    def row(self, values, widths, bold=False, on_new_page=None):
+        self.ensure(ROW_HEIGHT, on_new_page)
+        self.canvas.setFont('Helvetica-Bold' if bold else 'Helvetica', 8)
+        x = PAGE_MARGIN
+        for value, width in zip(values, widths):
+            self.canvas.drawString(x, self.y - 10, str(value))
+            x += width
+        self.y -= ROW_HEIGHT
+
+    def table(self, header, rows, widths):
+        """Rows may be any iterable; the header repeats on every page"""
+        def repeat_header():
+            self.row(header, widths, bold=True)
+        self.row(header, widths, bold=True)
+        for values in rows:
+            self.row(values, widths, on_new_page=repeat_header)
+
+    def image(self, png_bytes, width, height):
+        from reportlab.lib.utils import ImageReader
+        self.ensure(height)
+        self.canvas.drawImage(ImageReader(io.BytesIO(png_bytes)), PAGE_MARGIN, self.y - height,
+                              width=width, height=height)
+        self.y -= height + 10
+
+    def save(self):
+        self._footer()
+        self.canvas.save()
+
+
+def _fmt(value, digits=1):
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return '-'
+    return f"{value:.{digits}f}"
+
+
+def generate_history_pdf(user_id, filename, start=None, end=None, chunk_size=50000,
+                         detail_days=1, patient_name=None):
+    """
+    Multi-page PDF of a patient's history, streamed from storage in chunks
+    Contents: period summary table, embedded trend chart, risk counts, one row per day,
+    and individual readings for the last `detail_days` days (0 to omit).
+    Returns the number of readings covered.
+    """
+    summary = DailySummary()
+    for chunk in iter_user_history_chunks(user_id, chunk_size, start, end):
+        summary.add_chunk(chunk)
+    daily = summary.daily()
+
+    pdf = _PagedCanvas(filename, f"Health Report - {patient_name or user_id}")
+    pdf.text("Health Report", size=18, bold=True)
+    pdf.text(f"Patient: {patient_name or user_id}")
+    pdf.text(f"Generated: {datetime.now():%Y-%m-%d %H:%M}")
+    if summary.readings == 0:
+        pdf.text("No readings recorded for this period.")
+        pdf.save()
+        return 0
+    pdf.text(f"Period: {summary.first:%Y-%m-%d %H:%M} to {summary.last:%Y-%m-%d %H:%M} "
+             f"({summary.readings:,} readings, {len(daily)} days)")
+    pdf.y -= 6
+
+    pdf.text("Summary", size=13, bold=True)
+    pdf.table(['Metric', 'Mean', 'Min', 'Max'],
+              ([r['metric'], _fmt(r['mean']), _fmt(r['min']), _fmt(r['max'])] for r in summary.overall(daily)),
+              [160, 80, 80, 80])
+    pdf.y -= 6
+
+    chart_width = pdf.width - 2 * PAGE_MARGIN
+    pdf.text("Daily Trends (mean with min-max band)", size=13, bold=True)
+    pdf.image(render_trend_chart(daily), chart_width, chart_width * 0.6)
+
+    pdf.text("Risk Findings", size=13, bold=True)
+    pdf.table(['Risk', 'Readings'], ([name, f"{int(count):,}"] for name, count in zip(RISK_TYPES, summary.risk_counts)),
+              [160, 80])
+    pdf.y -= 6
+
+    pdf.text("Daily Summary", size=13, bold=True)
+    pdf.table(['Day', 'Readings', 'HR mean', 'HR range', 'O2 mean', 'O2 min', 'Temp mean', 'Temp max',
+               'Resp mean', 'Score', '% at risk'],
+              ([f"{day:%Y-%m-%d}", f"{int(r.readings):,}",
+                _fmt(r.get('heart_rate_mean')), f"{_fmt(r.get('heart_rate_min'), 0)}-{_fmt(r.get('heart_rate_max'), 0)}",
+                _fmt(r.get('blood_oxygen_mean')), _fmt(r.get('blood_oxygen_min'), 0),
+                _fmt(r.get('temperature_mean'), 2), _fmt(r.get('temperature_max'), 2),
+                _fmt(r.get('respiration_rate_mean')), _fmt(r.health_score_mean), _fmt(r.at_risk_pct)]
+               for day, r in daily.iterrows()),
+              [58, 45, 42, 50, 42, 36, 48, 45, 45, 35, 45])
+
+    if detail_days:
+        detail_start = summary.last.normalize() - timedelta(days=detail_days - 1)
+        if start is not None:
+            detail_start = max(detail_start, pd.Timestamp(start))
+        pdf.new_page()
+        pdf.text(f"Readings since {detail_start:%Y-%m-%d}", size=13, bold=True)
+
+        def detail_rows():
+            for chunk in iter_user_history_chunks(user_id, chunk_size, detail_start, end):
+                timestamps = pd.to_datetime(chunk['timestamp'])
+                for ts, values in zip(timestamps, chunk[[c for c in VITAL_COLUMNS if c in chunk.columns]].itertuples(index=False)):
+                    yield [f"{ts:%Y-%m-%d %H:%M}", *values]
+
+        pdf.table(['Time'] + [VITAL_LABELS[c] for c in VITAL_COLUMNS], detail_rows(), [100, 100, 100, 100, 100])
+
+    pdf.save()
+    return summary.readings
@@ -0,0 +1,223 @@
+import bisect
+import itertools
+from datetime import datetime, timedelta
+from reminders import parse_appointment_time, parse_medication_schedule, iter_occurrences
+
+# Appointments for the same doctor closer than this are double-booked
+APPOINTMENT_DURATION = timedelta(minutes=30)
+
+# How far ahead medication doses are materialized
+DOSE_HORIZON = timedelta(days=7)
+
+# Entries per TimeIndex bucket (a bucket is split once it holds twice this many)
+BUCKET_SIZE = 1000
+
+
+class TimeIndex:
+    """
+    Entries kept sorted by datetime in buckets of bounded size (sortedcontainers.SortedList style)
+    An insert bisects the bucket maxima and then one bucket, and shifts at most
+    2 * BUCKET_SIZE entries, so it is O(log n) rather than a shift of the whole index.
+    Range bounds are found the same way; ties keep insertion order through a sequence number.
+    """
+
+    def __init__(self):
+        self._keys = []      # buckets of (when, seq), each sorted
+        self._items = []     # payloads, parallel to _keys
+        self._maxes = []     # last key of each bucket
+        self._len = 0
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return self._len
+
+    def insert(self, when, item):
+        key = (when, next(self._seq))
+        self._len += 1
+        if not self._maxes:
+            self._keys.append([key])
+            self._items.append([item])
+            self._maxes.append(key)
+            return
+        b = bisect.bisect_right(self._maxes, key)
+        if b == len(self._maxes):
+            # Later than everything indexed: append to the last bucket
+            b -= 1
+            self._keys[b].append(key)
+            self._items[b].append(item)
+            self._maxes[b] = key
+        else:
+            i = bisect.bisect_right(self._keys[b], key)
+            self._keys[b].insert(i, key)
+            self._items[b].insert(i, item)
+        if len(self._keys[b]) > 2 * BUCKET_SIZE:
+            self._split(b)
+
+    def _split(self, b):
+        half = len(self._keys[b]) // 2
+        self._keys.insert(b + 1, self._keys[b][half:])
+        self._items.insert(b + 1, self._items[b][half:])
+        del self._keys[b][half:]
+        del self._items[b][half:]
+        self._maxes[b] = self._keys[b][-1]
+        self._maxes.insert(b + 1, self._keys[b + 1][-1])
+
+    def extend(self, pairs):
+        """Bulk insert (when, item) pairs with one sort instead of n insertions"""
+        keys = [key for bucket in self._keys for key in bucket]
+        items = [item for bucket in self._items for item in bucket]
+        for when, item in pairs:
+            keys.append((when, next(self._seq)))
+            items.append(item)
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        self._keys = [[keys[i] for i in order[lo:lo + BUCKET_SIZE]] for lo in range(0, len(order), BUCKET_SIZE)]
+        self._items = [[items[i] for i in order[lo:lo + BUCKET_SIZE]] for lo in range(0, len(order), BUCKET_SIZE)]
+        self._maxes = [bucket[-1] for bucket in self._keys]
+        self._len = len(keys)
+
+    def _position(self, when):
+        """(bucket, offset) of the first entry at or after `when`"""
+        probe = (when, -1)
+        b = bisect.bisect_left(self._maxes, probe)
+        if b == len(self._maxes):
+            return b, 0
+        return b, bisect.bisect_left(self._keys[b], probe)
+
+    def range(self, start=None, end=None):
+        """Items with start <= when < end, in time order"""
+        lo = (0, 0) if start is None else self._position(start)
+        hi = (len(self._maxes), 0) if end is None else self._position(end)
+        if hi <= lo:
+            return []
+        if lo[0] == hi[0]:
+            return self._items[lo[0]][lo[1]:hi[1]]
+        items = self._items[lo[0]][lo[1]:]
+        for bucket in self._items[lo[0] + 1:hi[0]]:
+            items.extend(bucket)
+        if hi[0] < len(self._items):
+            items.extend(self._items[hi[0]][:hi[1]])
+        return items
+
+    def __iter__(self):
+        return itertools.chain.from_iterable(self._items)
+
+
+class AppointmentBook:
+    """Appointments indexed by time, with secondary indexes by doctor and by user"""
+
+    def __init__(self, duration=APPOINTMENT_DURATION):
+        self.duration = duration
+        self.by_time = TimeIndex()
+        self.by_doctor = {}
+        self.by_user = {}
+        self.unparsed = []
+
+    @classmethod
+    def from_appointments(cls, appointments, duration=APPOINTMENT_DURATION):
+        """Build from the appointments.json shape: user_id -> list of appointments"""
+        book = cls(duration)
+        by_doctor, by_user, entries = {}, {}, []
+        for user_id, user_appts in appointments.items():
+            for appt in user_appts:
+                entry = book._entry(user_id, appt)
+                if entry is None:
+                    continue
+                entries.append((entry['when'], entry))
+                by_doctor.setdefault(appt.get('doctor'), []).append((entry['when'], entry))
+                by_user.setdefault(user_id, []).append((entry['when'], entry))
+        book.by_time.extend(entries)
+        for doctor, pairs in by_doctor.items():
+            book.by_doctor.setdefault(doctor, TimeIndex()).extend(pairs)
+        for user_id, pairs in by_user.items():
+            book.by_user.setdefault(user_id, TimeIndex()).extend(pairs)
+        return book
+
+    def _entry(self, user_id, appt):
+        when = parse_appointment_time(appt.get('date_time'))
+        entry = {'user_id': user_id, **appt}
+        if when is None:
+            self.unparsed.append(entry)
+            return None
+        entry['when'] = when
+        return entry
+
+    def add(self, user_id, appt):
+        entry = self._entry(user_id, appt)
+        if entry is None:
+            return None
+        when = entry['when']
+        self.by_time.insert(when, entry)
+        self.by_doctor.setdefault(appt.get('doctor'), TimeIndex()).insert(when, entry)
+        self.by_user.setdefault(user_id, TimeIndex()).insert(when, entry)
+        return entry
+
+    def find_conflicts(self, doctor, date_time):
+        """Existing appointments of `doctor` overlapping one starting at date_time"""
+        when = parse_appointment_time(date_time)
+        if when is None or doctor not in self.by_doctor:
+            return []
+        # Open interval: back-to-back appointments do not conflict
+        return self.by_doctor[doctor].range(when - self.duration + timedelta(microseconds=1),
+                                            when + self.duration)
+
+    def double_bookings(self, doctor=None):
+        """Pairs of overlapping appointments per doctor, from one pass over each sorted list"""
+        doctors = [doctor] if doctor is not None else list(self.by_doctor)
+        conflicts = []
+        for name in doctors:
+            entries = list(self.by_doctor.get(name, []))
+            for previous, current in zip(entries, entries[1:]):
+                if current['when'] - previous['when'] < self.duration:
+                    conflicts.append((previous, current))
+        return conflicts
+
+    def upcoming(self, start=None, end=None, doctor=None, user_id=None):
+        """Appointments in [start, end), optionally for one doctor or one user"""
+        if doctor is not None:
+            index = self.by_doctor.get(doctor)
+        elif user_id is not None:
+            index = self.by_user.get(user_id)
+        else:
+            index = self.by_time
+        if index is None:
+            return []
+        entries = index.range(start, end)
+        if doctor is not None and user_id is not None:
+            entries = [e for e in entries if e['user_id'] == user_id]
+        return entries
+
+
+class MedicationDoseIndex:
+    """Medication doses materialized over a rolling horizon and indexed by time"""
+
+    def __init__(self, medications, start=None, horizon=DOSE_HORIZON):
+        self.start = start or datetime.now()
+        self.end = self.start + horizon
+        self.by_time = TimeIndex()
+        self.by_user = {}
+        self.unparsed = []
+        doses = []
+        for user_id, meds in medications.items():
+            user_doses = []
+            for med in meds:
+                rule = parse_medication_schedule(med.get('schedule'))
+                if rule is None:
+                    self.unparsed.append({'user_id': user_id, **med})
+                    continue
+                # Include a dose exactly at the window start
+                for when in iter_occurrences(rule, self.start - timedelta(microseconds=1), self.end):
+                    dose = {'user_id': user_id, 'name': med.get('name'), 'schedule': med.get('schedule'), 'when': when}
+                    user_doses.append((when, dose))
+            if user_doses:
+                self.by_user[user_id] = TimeIndex()
+                self.by_user[user_id].extend(user_doses)
+                doses.extend(user_doses)
+        self.by_time.extend(doses)
+
+    def covers(self, start, end):
+        return start >= self.start and end <= self.end
+
+    def due(self, start, end, user_id=None):
+        """Doses in [start, end), optionally for one user"""
+        index = self.by_time if user_id is None else self.by_user.get(user_id)
+        return [] if index is None else index.range(start, end)
@@ -0,0 +1,167 @@
+"""Compact in-memory schema for vitals DataFrames, and validation of incoming device readings.
+
+Usage: python schema.py [--users 50] [--minutes 1440]   (memory report for a simulated panel)
+"""
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from vitals_store import ACTIVITY_LEVELS, ACTIVITY_CODES
+
+# Integer vitals are int16 rather than uint8: scalar rules such as (95 - o2) would
+# wrap around on unsigned values. Columns with missing values fall back to float32.
+INT_VITALS = ['heart_rate', 'blood_oxygen', 'respiration_rate']
+FLOAT_VITALS = ['temperature']
+
+# Categoricals with a fixed category order; other known label columns infer theirs
+FIXED_CATEGORIES = {
+    'activity_level': ACTIVITY_LEVELS,
+    'anomaly': ['Normal', 'Anomaly'],
+}
+INFERRED_CATEGORIES = ['user_id', 'anomaly_type']
+BOOL_COLUMNS = ['is_anomaly']
+
+# Vitals a device reading may carry
+VITAL_FIELDS = ('heart_rate', 'blood_oxygen', 'temperature', 'respiration_rate')
+
+
+def parse_reading(obj, received_at=None):
+    """Validate one device reading; returns (user_id, record) or raises ValueError"""
+    if not isinstance(obj, dict):
+        raise ValueError('reading must be an object')
+    user_id = obj.get('user_id')
+    if not isinstance(user_id, str) or not user_id:
+        raise ValueError('user_id is required')
+
+    timestamp = obj.get('timestamp')
+    if timestamp is None:
+        timestamp = received_at or datetime.now().isoformat()
+    else:
+        try:
+            timestamp = datetime.fromisoformat(timestamp).isoformat()
+        except (TypeError, ValueError):
+            raise ValueError(f'invalid timestamp: {timestamp!r}')
+
+    record = {'timestamp': timestamp}
+    for field in VITAL_FIELDS:
+        value = obj.get(field)
+        if value is None:
+            continue
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not np.isfinite(value):
+            raise ValueError(f'{field} must be a number')
+        record[field] = value
+    if len(record) == 1:
+        raise ValueError('reading has no vitals')
+    activity = obj.get('activity_level')
+    if activity is not None:
+        if activity not in ACTIVITY_CODES:
+            raise ValueError(f'activity_level must be one of {ACTIVITY_LEVELS}')
+        record['activity_level'] = activity
+    return user_id, record
+
+
+def parse_payload(payload, received_at=None):
+    """Readings from a POST/WebSocket payload: one reading, a list, or {"readings": [...]}"""
+    if isinstance(payload, dict) and 'readings' in payload:
+        payload = payload['readings']
+    if isinstance(payload, dict):
+        payload = [payload]
+    if not isinstance(payload, list) or not payload:
+        raise ValueError('expected a reading or a non-empty list of readings')
+    received_at = received_at or datetime.now().isoformat()
+    return [parse_reading(obj, received_at) for obj in payload]
+
+
+def _compact_timestamp(column):
+    if not pd.api.types.is_datetime64_any_dtype(column):
+        column = pd.to_datetime(column, format='ISO8601')
+    if getattr(column.dt, 'tz', None) is None:
+        column = column.astype('datetime64[ns]')
+    return column
+
+
+def _compact_int(column):
+    values = pd.to_numeric(column, errors='coerce')
+    if values.isna().any():
+        return values.astype(np.float32)
+    if len(values) and (values.min() < np.iinfo(np.int16).min or values.max() > np.iinfo(np.int16).max):
+        return values.astype(np.int32)
+    return values.astype(np.int16)
+
+
+def _compact_fixed_category(column, categories):
+    if isinstance(column.dtype, pd.CategoricalDtype) and list(column.cat.categories) == list(categories):
+        return column
+    extra = sorted(set(column.dropna().astype(str)) - set(categories))
+    return column.astype(pd.CategoricalDtype(list(categories) + extra))
+
+
+def compact_vitals_frame(df):
+    """
+    Vitals frame in the canonical compact schema
+    datetime64[ns] timestamps, int16 vitals (float32 where values are missing),
+    float32 temperature, categorical user/activity/label columns. Other columns
+    are passed through. Returns a new frame; columns already compact are not copied.
+    """
+    columns = {}
+    for name in df.columns:
+        column = df[name]
+        if name == 'timestamp':
+            column = _compact_timestamp(column)
+        elif name in INT_VITALS:
+            column = _compact_int(column)
+        elif name in FLOAT_VITALS:
+            column = pd.to_numeric(column, errors='coerce').astype(np.float32)
+        elif name in FIXED_CATEGORIES:
+            column = _compact_fixed_category(column, FIXED_CATEGORIES[name])
+        elif name in INFERRED_CATEGORIES and not isinstance(column.dtype, pd.CategoricalDtype):
+            column = column.astype('category')
+        elif name in BOOL_COLUMNS:
+            column = column.fillna(False).astype(bool)
+        columns[name] = column
+    return pd.DataFrame(columns, index=df.index)
+
+
+def memory_report(df):
+    """Per-column dtype and deep memory use (bytes), with a total row"""
+    usage = df.memory_usage(deep=True, index=True)
+    report = pd.DataFrame({
+        'dtype': [str(df.index.dtype)] + [str(df[c].dtype) for c in df.columns],
+        'bytes': usage.to_numpy(),
+    }, index=['(index)'] + list(df.columns))
+    report.loc['total'] = ['', int(usage.sum())]
+    report['bytes_per_row'] = report['bytes'] / max(len(df), 1)
+    return report
+
+
+def compare_memory(before, after):
+    """Total deep memory of two frames and the reduction factor"""
+    before_bytes = int(before.memory_usage(deep=True).sum())
+    after_bytes = int(after.memory_usage(deep=True).sum())
+    return {
+        'rows': len(after),
+        'before_mb': before_bytes / 1e6,
+        'after_mb': after_bytes / 1e6,
+        'reduction': before_bytes / after_bytes if after_bytes else float('inf'),
+    }
+
+
+if __name__ == '__main__':
+    import argparse
+    from data import simulate_health_data
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--minutes', type=int, default=1440)
+    args = parser.parse_args()
+
+    records = []
+    for i in range(args.users):
+        records.extend(simulate_health_data(f"User_{i+1}", args.minutes))
+    raw = pd.DataFrame(records)
+    compact = compact_vitals_frame(raw)
+    print(memory_report(raw).to_string())
+    print()
+    print(memory_report(compact).to_string())
+    summary = compare_memory(raw, compact)
+    print(f"\n{summary['rows']:,} rows: {summary['before_mb']:.1f} MB -> {summary['after_mb']:.1f} MB "
+          f"({summary['reduction']:.1f}x smaller)")
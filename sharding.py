@@ -0,0 +1,246 @@
+"""Shard patients across worker processes by a stable hash of user_id.
+
+Each shard is one worker process that owns its patients outright: its own JSON
+and vitals stores under SHARD_DATA_DIR/shard_NN, anomaly model, rolling feature
+state, at-risk index and alert suppression. ShardRouter sends every call for a
+patient to that patient's shard, fans cohort-wide calls out to all shards and
+merges the answers, so the data/model/alert code runs on N cores instead of one.
+Users, medications, appointments, reminders and alert threshold profiles are not
+sharded: every worker reads and writes the same files as the app.
+
+    with ShardRouter(num_shards=4) as router:
+        router.ingest([{'user_id': 'User_1', 'heart_rate': 82, ...}, ...])
+        router.top_at_risk(10)
+"""
+import os
+import json
+import heapq
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+SHARD_DATA_DIR = os.getenv('SHARD_DATA_DIR', 'shards')
+SHARD_MANIFEST = 'shards.json'
+
+
+def shard_for(user_id, num_shards):
+    """Shard index for a patient; crc32 is stable across processes and runs, unlike hash()"""
+    return zlib.crc32(str(user_id).encode('utf-8')) % num_shards
+
+
+def shard_dir(data_dir, shard_id):
+    return os.path.join(data_dir, f'shard_{shard_id:02d}')
+
+
+class ShardWorker:
+    """State and operations of one shard; lives in that shard's worker process"""
+
+    def __init__(self, shard_id, num_shards, data_dir):
+        from alerts import AlertSuppressor, RECENT_ALERTS_LIMIT
+        from features import RollingFeatureEngine
+        from models import AnomalyScorer
+
+        self.shard_id = shard_id
+        self.num_shards = num_shards
+        self.directory = shard_dir(data_dir, shard_id)
+        os.makedirs(self.directory, exist_ok=True)
+        # The shard's own health stores, passed to every data call
+        self.health_file = os.path.join(self.directory, 'health_data.json')
+        self.store_dir = os.path.join(self.directory, 'vitals_store')
+
+        self.scorer = AnomalyScorer().fit_from_storage(health_file=self.health_file, store_dir=self.store_dir)
+        self.rolling = RollingFeatureEngine(self.scorer.windows)
+        self.suppressor = AlertSuppressor()
+        self.alerts = deque(maxlen=RECENT_ALERTS_LIMIT)
+        self.latest = {}
+        self.readings = 0
+
+    def _warm(self, user_ids):
+        """Seed rolling state for patients first seen by this process from stored history"""
+        from data import warm_rolling_features
+        warm_rolling_features(self.rolling, user_ids, self.health_file, self.store_dir)
+
+    def ingest(self, readings):
+        """Store, score and check (user_id, record) pairs; returns counts and the raised alerts"""
+        from alerts import check_vitals_batch, alerts_from_flags
+        from data import add_health_records
+        from instrumentation import count
+
+        user_ids = [user_id for user_id, _ in readings]
+        records = [record for _, record in readings]
+        df = pd.DataFrame(records)
+
+        new_users = [user_id for user_id in dict.fromkeys(user_ids) if user_id not in self.latest]
+        if new_users:
+            self._warm(new_users)
+        # Rolling features before scoring, so the model sees the same columns it was fitted on
+        rolling = self.rolling.update_many(user_ids, records)
+        anomalies = self.scorer.score(df, rolling)
+
+        records_by_user, labels_by_user, last_row = {}, {}, {}
+        for i, (user_id, record, anomaly) in enumerate(zip(user_ids, records, anomalies)):
+            if anomaly:
+                self.rolling.mark_anomaly(user_id, record.get('timestamp'))
+            records_by_user.setdefault(user_id, []).append(record)
+            labels_by_user.setdefault(user_id, []).append(bool(anomaly))
+            last_row[user_id] = i
+        for user_id, i in last_row.items():
+            self.latest[user_id] = {'reading': records[i], 'features': rolling.iloc[i].to_dict(),
+                                    'anomaly': bool(anomalies[i])}
+        add_health_records(records_by_user, labels_by_user, self.health_file, self.store_dir)
+
+        flags, thresholds = check_vitals_batch(user_ids, df)
+        alerts = self.suppressor.filter(alerts_from_flags(flags, thresholds, user_ids, df, record=False))
+        self.alerts.extend(alerts)
+        if alerts:
+            count('alerts_raised', len(alerts))
+        self.readings += len(readings)
+        return {'written': len(readings), 'anomalies': int(anomalies.sum()), 'alerts': alerts}
+
+    def user_history(self, user_id, start=None, end=None):
+        from data import get_user_health_df
+        return get_user_health_df(user_id, start, end, health_file=self.health_file, store_dir=self.store_dir)
+
+    def latest_state(self, user_ids):
+        return {user_id: self.latest[user_id] for user_id in user_ids if user_id in self.latest}
+
+    def top_at_risk(self, n):
+        from cohort import at_risk_index
+        return at_risk_index.top_at_risk(n)
+
+    def alert_history(self, user_id=None, limit=50):
+        alerts = [alert for alert in self.alerts if user_id is None or alert['user_id'] == user_id]
+        return alerts[-limit:]
+
+    def stats(self):
+        from cohort import at_risk_index
+        return {'shard': self.shard_id, 'pid': os.getpid(), 'patients': len(at_risk_index),
+                'readings': self.readings, 'alerts_suppressed': self.suppressor.suppressed,
+                'scorer': self.scorer.source}
+
+
+# The ShardWorker of the current worker process
+_worker = None
+
+
+def _init_worker(shard_id, num_shards, data_dir):
+    global _worker
+    _worker = ShardWorker(shard_id, num_shards, data_dir)
+
+
+def _call(method, *args):
+    return getattr(_worker, method)(*args)
+
+
+def _check_manifest(data_dir, num_shards):
+    """Refuse to open a shard directory laid out for a different shard count"""
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, SHARD_MANIFEST)
+    if os.path.exists(path):
+        with open(path) as f:
+            stored = json.load(f)['num_shards']
+        if stored != num_shards:
+            raise ValueError(f"{data_dir} holds {stored} shards; patients would hash to different "
+                             f"shards with num_shards={num_shards}")
+    else:
+        with open(path, 'w') as f:
+            json.dump({'num_shards': num_shards, 'hash': 'crc32'}, f)
+
+
+class ShardRouter:
+    """
+    Routes patient calls to their shard and merges fan-out queries
+    Each shard is a single-process pool, so a shard handles its calls in order
+    while different shards run in parallel.
+    """
+
+    def __init__(self, num_shards=None, data_dir=SHARD_DATA_DIR):
+        self.num_shards = num_shards or os.cpu_count() or 1
+        self.data_dir = data_dir
+        _check_manifest(data_dir, self.num_shards)
+        self.executors = [
+            ProcessPoolExecutor(max_workers=1, initializer=_init_worker,
+                                initargs=(shard_id, self.num_shards, data_dir))
+            for shard_id in range(self.num_shards)
+        ]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        for executor in self.executors:
+            executor.shutdown(wait=True)
+
+    def shard_for(self, user_id):
+        return shard_for(user_id, self.num_shards)
+
+    def _submit(self, shard_id, method, *args):
+        return self.executors[shard_id].submit(_call, method, *args)
+
+    def _fan_out(self, method, *args):
+        futures = [self._submit(shard_id, method, *args) for shard_id in range(self.num_shards)]
+        return [future.result() for future in futures]
+
+    def ready(self):
+        """Block until every shard process has started (models fitted); returns shard stats"""
+        return self._fan_out('stats')
+
+    def ingest_async(self, readings):
+        """Partition readings by shard and submit them; returns {shard_id: future}"""
+        from schema import parse_reading
+        by_shard = {}
+        for reading in readings:
+            user_id, record = reading if isinstance(reading, tuple) else parse_reading(reading)
+            by_shard.setdefault(self.shard_for(user_id), []).append((user_id, record))
+        return {shard_id: self._submit(shard_id, 'ingest', batch) for shard_id, batch in by_shard.items()}
+
+    def ingest(self, readings):
+        """
+        Ingest reading dicts (or (user_id, record) pairs) across the shards and wait
+        Returns merged counts and the raised alerts in time order.
+        """
+        merged = {'written': 0, 'anomalies': 0, 'alerts': []}
+        for future in self.ingest_async(readings).values():
+            result = future.result()
+            merged['written'] += result['written']
+            merged['anomalies'] += result['anomalies']
+            merged['alerts'].extend(result['alerts'])
+        merged['alerts'].sort(key=lambda alert: alert['timestamp'])
+        return merged
+
+    def get_user_health_df(self, user_id, start=None, end=None):
+        return self._submit(self.shard_for(user_id), 'user_history', user_id, start, end).result()
+
+    def latest_state(self, user_ids):
+        """Latest reading, rolling features and anomaly flag per patient"""
+        by_shard = {}
+        for user_id in user_ids:
+            by_shard.setdefault(self.shard_for(user_id), []).append(user_id)
+        futures = [self._submit(shard_id, 'latest_state', ids) for shard_id, ids in by_shard.items()]
+        merged = {}
+        for future in futures:
+            merged.update(future.result())
+        return merged
+
+    def top_at_risk(self, n=10):
+        """Cohort-wide sickest n: each shard's top n merged in AtRiskIndex rank order"""
+        from models import SEVERITY_RANK
+        per_shard = self._fan_out('top_at_risk', n)
+        top = heapq.nsmallest(n, (entry for entries in per_shard for entry in entries),
+                              key=lambda e: (-SEVERITY_RANK.get(e['severity'], 0), e['health_score'],
+                                             -e['anomaly_rate']))
+        return [{**entry, 'rank': rank} for rank, entry in enumerate(top, start=1)]
+
+    def alert_history(self, user_id=None, limit=50):
+        if user_id is not None:
+            return self._submit(self.shard_for(user_id), 'alert_history', user_id, limit).result()
+        alerts = [alert for alerts in self._fan_out('alert_history', None, limit) for alert in alerts]
+        return sorted(alerts, key=lambda alert: alert['timestamp'])[-limit:]
+
+    def stats(self):
+        return self._fan_out('stats')
@@ -1,11 +1,41 @@
 import json
 import os
+import queue
+import tempfile
+import threading
+import warnings
+from contextlib import contextmanager
 from cryptography.fernet import Fernet
 import smtplib
 from email.mime.text import MIMEText
 import pandas as pd
 from datetime import datetime
 from sklearn.preprocessing import StandardScaler
+from dotenv import load_dotenv
+from instrumentation import timed
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+# Load environment variables
+load_dotenv()
 
 # Generate or load encryption key
 def get_encryption_key():
@@ -20,27 +50,260 @@ def get_encryption_key():
         return key
 
 # Encrypt data
+@timed()
 def encrypt_data(data):
     fernet = Fernet(get_encryption_key())
     return fernet.encrypt(data.encode()).decode()
 
 # Decrypt data
+@timed()
 def decrypt_data(encrypted_data):
     fernet = Fernet(get_encryption_key())
     return fernet.decrypt(encrypted_data.encode()).decode()
 
-# Save data to JSON
-def save_data_to_json(data, filename):
-    with open(filename, 'w') as f:
-        json.dump(data, f, indent=4)
+# Hold an exclusive advisory lock on a sidecar lock file for the duration of the block
+@contextmanager
+def file_lock(filename):
+    """Serialize writers of ``filename`` across threads and processes"""
+    with open(filename + '.lock', 'a+b') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        else:
+            lock_file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+def try_acquire_lease(filename):
+    """
+    Exclusive lock on ``filename`` held until the returned file is closed (or the process
+    exits), or None if another process holds it. Used to pick a single owner for a job.
+    """
+    lease = open(filename, 'a+b')
+    try:
+        if fcntl is not None:
+            fcntl.flock(lease.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            lease.seek(0)
+            msvcrt.locking(lease.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        lease.close()
+        return None
+    return lease
+
+# Serializers for the data stores: name -> (encode to bytes, decode from bytes)
+def _json_encode(data):
+    return json.dumps(data, separators=(',', ':')).encode('utf-8')
+
+def _orjson_encode(data):
+    # Non-str keys are stringified, as json.dumps does
+    return orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+
+def _msgpack_encode(data):
+    return msgpack.packb(data, use_bin_type=True)
+
+def _json_decode(payload):
+    if ORJSON_AVAILABLE:
+        return orjson.loads(payload)
+    return json.loads(payload)
+
+def _msgpack_decode(payload):
+    return msgpack.unpackb(payload, raw=False)
+
+SERIALIZERS = {
+    'json': (_json_encode, _json_decode),
+    'orjson': (_orjson_encode, _json_decode),
+    'msgpack': (_msgpack_encode, _msgpack_decode),
+}
+
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+# Fallback warnings already issued; settings are resolved on every write
+_serializer_warnings = set()
+
+def _warn_once(message):
+    if message not in _serializer_warnings:
+        _serializer_warnings.add(message)
+        warnings.warn(message, RuntimeWarning, stacklevel=3)
+
+def get_serializer_settings():
+    """
+    Serializer and compression for new writes, from DATA_SERIALIZER / DATA_COMPRESSION
+    Unset DATA_SERIALIZER picks the fastest installed codec: orjson, else compact json.
+    """
+    serializer = os.getenv('DATA_SERIALIZER', 'orjson' if ORJSON_AVAILABLE else 'json').lower()
+    compression = os.getenv('DATA_COMPRESSION', 'none').lower()
+    if serializer not in SERIALIZERS:
+        raise ValueError(f"Unknown DATA_SERIALIZER '{serializer}' (choose from {', '.join(SERIALIZERS)})")
+    if serializer == 'orjson' and not ORJSON_AVAILABLE:
+        _warn_once("orjson not available. Falling back to json serializer.")
+        serializer = 'json'
+    if serializer == 'msgpack' and not MSGPACK_AVAILABLE:
+        _warn_once("msgpack not available. Falling back to json serializer.")
+        serializer = 'json'
+    if compression == 'zstd' and not ZSTD_AVAILABLE:
+        _warn_once("zstandard not available. Writing uncompressed data.")
+        compression = 'none'
+    return serializer, compression
+
+def serialize_data(data, serializer=None, compression=None):
+    if serializer is None or compression is None:
+        default_serializer, default_compression = get_serializer_settings()
+        serializer = serializer or default_serializer
+        compression = compression or default_compression
+    encode, _ = SERIALIZERS[serializer]
+    payload = encode(data)
+    if compression == 'zstd':
+        payload = zstandard.ZstdCompressor(level=3).compress(payload)
+    return payload
+
+def deserialize_data(payload):
+    """Decode a store payload, detecting compression and format from its leading bytes"""
+    if payload.startswith(ZSTD_MAGIC):
+        if not ZSTD_AVAILABLE:
+            raise ImportError("zstandard not available. Cannot read compressed data store.")
+        payload = zstandard.ZstdDecompressor().decompress(payload)
+    stripped = payload.lstrip()
+    if not stripped:
+        return {}
+    # JSON documents start with '{' or '['; msgpack maps and arrays never do
+    if stripped[:1] in (b'{', b'['):
+        return _json_decode(payload)
+    if not MSGPACK_AVAILABLE:
+        raise ImportError("msgpack not available. Cannot read msgpack data store.")
+    return _msgpack_decode(payload)
+
+# Process umask, read once (os.umask can only be read by setting it)
+_UMASK = os.umask(0)
+os.umask(_UMASK)
 
-# Load data from JSON
+def _file_mode(filename):
+    """Permissions for a rewrite of filename: the existing file's, else what open() would create"""
+    try:
+        return os.stat(filename).st_mode & 0o7777
+    except FileNotFoundError:
+        return 0o666 & ~_UMASK
+
+# Write to a temp file in the same directory and rename it over the target
+def _atomic_write_json(data, filename, serializer=None, compression=None):
+    payload = serialize_data(data, serializer, compression)
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(filename) + '.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp creates 0600 files; keep the target's mode across the rename
+        os.chmod(tmp_path, _file_mode(filename))
+        os.replace(tmp_path, filename)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+# Save data to JSON (or the configured compact format)
+@timed()
+def save_data_to_json(data, filename, serializer=None, compression=None):
+    with file_lock(filename):
+        _atomic_write_json(data, filename, serializer, compression)
+
+# Load data from JSON (or any supported format, auto-detected)
+@timed()
 def load_data_from_json(filename):
     if os.path.exists(filename):
-        with open(filename, 'r') as f:
-            return json.load(f)
+        with open(filename, 'rb') as f:
+            return deserialize_data(f.read())
     return {}
 
+# Read-modify-write a JSON store under its lock
+@timed()
+def update_json_file(filename, update_fn, on_write=None):
+    """Apply ``update_fn(data)`` to the stored dict and persist it atomically.
+
+    The callback mutates ``data`` in place (or returns a replacement dict).
+    ``on_write(data)``, if given, runs after the write while the lock is still held,
+    e.g. to stamp an in-memory index with the file version it matches.
+    """
+    with file_lock(filename):
+        data = load_data_from_json(filename)
+        result = update_fn(data)
+        if result is not None:
+            data = result
+        _atomic_write_json(data, filename)
+        if on_write is not None:
+            on_write(data)
+        return data
+
+class JsonAppendWriter:
+    """Background writer that coalesces concurrent list appends into one locked write per file"""
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='json-append-writer', daemon=True)
+                self._thread.start()
+
+    def append(self, filename, key, record, wait=True):
+        """Queue ``record`` for ``data[key]`` in ``filename``; block until it is on disk if ``wait``"""
+        entry = {'filename': filename, 'key': key, 'record': record,
+                 'done': threading.Event(), 'error': None}
+        self._ensure_started()
+        self._queue.put(entry)
+        if wait:
+            entry['done'].wait()
+            if entry['error'] is not None:
+                raise entry['error']
+        return entry
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            # Drain whatever else arrived while the previous write was in flight
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            by_file = {}
+            for entry in batch:
+                by_file.setdefault(entry['filename'], []).append(entry)
+
+            for filename, entries in by_file.items():
+                def merge(data, entries=entries):
+                    for entry in entries:
+                        data.setdefault(entry['key'], []).append(entry['record'])
+                try:
+                    update_json_file(filename, merge)
+                except Exception as e:
+                    for entry in entries:
+                        entry['error'] = e
+                for entry in entries:
+                    entry['done'].set()
+
+_append_writer = JsonAppendWriter()
+
+# Append one record to a per-key list in a JSON store
+def append_json_record(filename, key, record, wait=True):
+    return _append_writer.append(filename, key, record, wait=wait)
+
 # Send alert email (simulation)
 def send_alert_email(to_email, subject, message):
     # Note: In real app, configure SMTP server
@@ -48,6 +311,8 @@ def send_alert_email(to_email, subject, message):
     print(f"Alert sent to {to_email}: {subject} - {message}")
 
 # Generate PDF report
+# (summary dict; see reports.generate_history_pdf for full histories)
+@timed()
 def generate_pdf_report(data, filename):
     from reportlab.lib.pagesizes import letter
     from reportlab.pdfgen import canvas
@@ -55,18 +320,23 @@ def generate_pdf_report(data, filename):
     c.drawString(100, 750, "Health Report")
     y = 700
     for key, value in data.items():
+        if y < 50:
+            c.showPage()
+            y = 750
         c.drawString(100, y, f"{key}: {value}")
         y -= 20
     c.save()
 
 # Generate Excel report
+@timed()
 def generate_excel_report(df, filename):
-    df.to_excel(filename, index=False)
+    from exports import write_xlsx
+    write_xlsx([df], filename)
 
-# Schedule reminders (basic simulation)
-def schedule_reminder(reminder_time, message):
-    # Use schedule library for real scheduling
-    print(f"Reminder scheduled for {reminder_time}: {message}")
+# Schedule a one-off reminder with the background reminder scheduler
+def schedule_reminder(reminder_time, message, user_id=None):
+    from reminders import get_reminder_scheduler
+    return get_reminder_scheduler().add(reminder_time, message, user_id)
 
 # Calculate baseline for user
 def calculate_baseline(user_data):
@@ -94,8 +364,13 @@ def generate_insight(current_vitals, baseline):
     return insights
 
 # Preprocess data for anomaly detection
-def preprocess_data(df):
-    """Preprocess health data with activity level encoding and scaling"""
+@timed()
+def preprocess_data(df, include_rolling=False, windows=None, anomaly_col=None):
+    """
+    Preprocess health data with activity level encoding and scaling
+    include_rolling adds per-user rolling-window features (see features.py); the live
+    path gets the same columns from RollingFeatureEngine.
+    """
     features = ['heart_rate', 'blood_oxygen', 'temperature', 'respiration_rate']
     
     # Create a copy for processing
@@ -104,8 +379,15 @@ def preprocess_data(df):
     # Encode activity level if present
     if 'activity_level' in df_processed.columns:
         activity_mapping = {'low': 0, 'moderate': 1, 'high': 2}
-        df_processed['activity_level_encoded'] = df_processed['activity_level'].map(activity_mapping)
+        # astype(object) so categorical columns map to plain numbers, not a new categorical
+        df_processed['activity_level_encoded'] = df_processed['activity_level'].astype(object).map(activity_mapping)
         features.append('activity_level_encoded')
+
+    if include_rolling:
+        from features import compute_rolling_features, DEFAULT_WINDOWS
+        rolling = compute_rolling_features(df_processed, windows or DEFAULT_WINDOWS, anomaly_col=anomaly_col)
+        df_processed = pd.concat([df_processed, rolling], axis=1)
+        features.extend(rolling.columns)
     
     # Select only available features
     available_features = [f for f in features if f in df_processed.columns]
@@ -5,7 +5,9 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
+from instrumentation import timed
 
+@timed()
 def create_multi_user_time_series(df, metric='heart_rate', anomaly_col='anomaly', title=None):
     """Create interactive Plotly time series for multiple users with anomaly highlighting"""
     fig = go.Figure()
@@ -73,6 +75,7 @@ def create_multi_user_time_series(df, metric='heart_rate', anomaly_col='anomaly'
     
     return fig
 
+@timed()
 def create_multi_metric_dashboard(df, user_id=None):
     """Create 2x2 dashboard with heart rate, blood oxygen, temperature, respiration"""
     metrics = ['heart_rate', 'blood_oxygen', 'temperature', 'respiration_rate']
@@ -110,15 +113,20 @@ def create_multi_metric_dashboard(df, user_id=None):
     fig.update_layout(height=700, showlegend=False, title_text="Health Metrics Dashboard")
     return fig
 
+@timed()
 def create_anomaly_heatmap(df):
     """Create heatmap showing anomaly distribution by user and hour"""
     if 'user_id' not in df.columns or 'anomaly' not in df.columns:
         return None
     
-    df['hour'] = pd.to_datetime(df['timestamp']).dt.hour
+    anomalies = df[df['anomaly'] == 'Anomaly']
+    timestamps = anomalies['timestamp']
+    if not pd.api.types.is_datetime64_any_dtype(timestamps):
+        timestamps = pd.to_datetime(timestamps)
     
     # Create pivot table
-    pivot = df[df['anomaly'] == 'Anomaly'].groupby(['user_id', 'hour']).size().reset_index(name='count')
+    pivot = anomalies.groupby([anomalies['user_id'], timestamps.dt.hour.rename('hour')],
+                              observed=True).size().reset_index(name='count')
     pivot_table = pivot.pivot(index='user_id', columns='hour', values='count').fillna(0)
     
     fig = go.Figure(data=go.Heatmap(
@@ -138,6 +146,7 @@ def create_anomaly_heatmap(df):
     
     return fig
 
+@timed()
 def create_correlation_matrix(df):
     """Create correlation heatmap for health metrics"""
     metrics = ['heart_rate', 'blood_oxygen', 'temperature', 'respiration_rate']
@@ -166,6 +175,7 @@ def create_correlation_matrix(df):
     
     return fig
 
+@timed()
 def create_distribution_plots(df, metric='heart_rate'):
     """Create distribution plot with box plot and histogram"""
     fig = make_subplots(
@@ -197,6 +207,7 @@ def create_distribution_plots(df, metric='heart_rate'):
     fig.update_layout(height=400, showlegend=True)
     return fig
 
+@timed()
 def create_prediction_comparison(actual, predicted, timestamps, metric='heart_rate'):
     """Create comparison plot for actual vs predicted values"""
     fig = go.Figure()
@@ -229,6 +240,7 @@ def create_prediction_comparison(actual, predicted, timestamps, metric='heart_ra
     
     return fig
 
+@timed()
 def create_metric_cards_data(df, user_id=None):
     """Calculate metrics for display cards"""
     if user_id and 'user_id' in df.columns:
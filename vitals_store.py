@@ -0,0 +1,206 @@
+import os
+import re
+import bisect
+import hashlib
+import numpy as np
+import pandas as pd
+from utils import file_lock
+
+# Fixed-width per-user vitals files, readable with np.memmap
+VITALS_STORE_DIR = 'vitals_store'
+
+VITALS_DTYPE = np.dtype([
+    ('timestamp', '<i8'),          # nanoseconds since epoch (naive local time, like the JSON store)
+    ('heart_rate', '<i2'),
+    ('respiration_rate', '<i2'),
+    ('blood_oxygen', 'u1'),
+    ('temperature', '<f4'),
+    ('activity_level', 'u1'),
+])
+
+ACTIVITY_LEVELS = ['low', 'moderate', 'high']
+ACTIVITY_CODES = {level: code for code, level in enumerate(ACTIVITY_LEVELS)}
+
+# Sentinels for fields missing from a reading
+MISSING_INT16 = -1
+MISSING_UINT8 = 255
+INT_FIELDS = {'heart_rate': MISSING_INT16, 'respiration_rate': MISSING_INT16, 'blood_oxygen': MISSING_UINT8}
+
+
+def vitals_store_enabled():
+    # Opt-in: the store keeps only VITALS_DTYPE fields, stores tz-aware timestamps as UTC and is
+    # backfilled from JSON only for users without a file, so enable it per deployment
+    return os.getenv('USE_VITALS_STORE', 'false').lower() == 'true'
+
+
+def user_store_path(user_id, store_dir=None):
+    store_dir = store_dir or VITALS_STORE_DIR
+    safe = re.sub(r'[^A-Za-z0-9_.-]', '_', str(user_id))
+    if safe != str(user_id):
+        # Keep sanitized names unique
+        safe += '-' + hashlib.sha1(str(user_id).encode()).hexdigest()[:8]
+    return os.path.join(store_dir, f'{safe}.vitals')
+
+
+def user_store_exists(user_id, store_dir=None):
+    return os.path.exists(user_store_path(user_id, store_dir))
+
+
+def _to_ns(timestamp):
+    return int(pd.Timestamp(timestamp).value)
+
+
+def _timestamps_to_ns(timestamps):
+    try:
+        return pd.DatetimeIndex(pd.to_datetime(timestamps, format='ISO8601')).as_unit('ns').asi8
+    except (ValueError, TypeError):
+        # Mixed UTC offsets or naive/aware mixes: convert one at a time
+        return np.fromiter((_to_ns(timestamp) for timestamp in timestamps), dtype=np.int64, count=len(timestamps))
+
+
+def records_to_array(records):
+    """Convert reading dicts (as stored in health_data.json) to a VITALS_DTYPE array"""
+    arr = np.zeros(len(records), dtype=VITALS_DTYPE)
+    if not len(records):
+        return arr
+    arr['timestamp'] = _timestamps_to_ns([record['timestamp'] for record in records])
+    for field, missing in INT_FIELDS.items():
+        values = np.array([record.get(field) for record in records], dtype=object)
+        present = np.not_equal(values, None)
+        arr[field] = missing
+        arr[field][present] = values[present].astype(np.int64)
+    temperature = np.array([record.get('temperature') for record in records], dtype=object)
+    temperature[np.equal(temperature, None)] = np.nan
+    arr['temperature'] = temperature.astype(np.float64)
+    arr['activity_level'] = [ACTIVITY_CODES.get(record.get('activity_level'), MISSING_UINT8) for record in records]
+    return arr
+
+
+def open_user_vitals(user_id, store_dir=None):
+    """Read-only memory map of a user's readings (empty array if none)"""
+    path = user_store_path(user_id, store_dir)
+    if not os.path.exists(path):
+        return np.zeros(0, dtype=VITALS_DTYPE)
+    # Ignore a partially written trailing record from a concurrent append
+    count = os.path.getsize(path) // VITALS_DTYPE.itemsize
+    if count == 0:
+        return np.zeros(0, dtype=VITALS_DTYPE)
+    return np.memmap(path, dtype=VITALS_DTYPE, mode='r', shape=(count,))
+
+
+class _TimestampView:
+    """Sequence over the timestamp field so bisect touches only O(log n) records"""
+
+    def __init__(self, arr):
+        self.arr = arr
+
+    def __len__(self):
+        return len(self.arr)
+
+    def __getitem__(self, i):
+        return int(self.arr[i]['timestamp'])
+
+
+def read_user_vitals(user_id, start=None, end=None, store_dir=None):
+    """Zero-copy slice of a user's readings with start <= timestamp < end"""
+    arr = open_user_vitals(user_id, store_dir)
+    view = _TimestampView(arr)
+    lo = 0 if start is None else bisect.bisect_left(view, _to_ns(start))
+    hi = len(arr) if end is None else bisect.bisect_left(view, _to_ns(end), lo)
+    return arr[lo:hi]
+
+
+def append_user_vitals(user_id, records, store_dir=None):
+    """Append readings for one user, keeping the file sorted by timestamp"""
+    if len(records) == 0:
+        return
+    new = records if isinstance(records, np.ndarray) else records_to_array(records)
+    if len(new) > 1 and np.any(np.diff(new['timestamp']) < 0):
+        new = np.sort(new, order='timestamp', kind='stable')
+
+    path = user_store_path(user_id, store_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with file_lock(path):
+        existing = open_user_vitals(user_id, store_dir)
+        if len(existing) and new['timestamp'][0] < existing[-1]['timestamp']:
+            # Out-of-order data: merge and rewrite instead of appending
+            merged = np.concatenate([np.asarray(existing), new])
+            merged = np.sort(merged, order='timestamp', kind='stable')
+            del existing
+            tmp_path = path + '.tmp'
+            merged.tofile(tmp_path)
+            os.replace(tmp_path, path)
+        else:
+            del existing
+            with open(path, 'r+b' if os.path.exists(path) else 'wb') as f:
+                # Drop any torn record left by a crash before appending
+                f.seek((os.path.getsize(path) // VITALS_DTYPE.itemsize) * VITALS_DTYPE.itemsize)
+                f.truncate()
+                f.write(new.tobytes())
+
+
+def _sorted_array(records):
+    arr = records if isinstance(records, np.ndarray) else records_to_array(records)
+    return np.sort(arr, order='timestamp', kind='stable')
+
+
+def _replace_file(path, arr):
+    tmp_path = path + '.tmp'
+    arr.tofile(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def write_user_vitals(user_id, records, store_dir=None):
+    """Replace a user's store file with the given readings"""
+    arr = _sorted_array(records)
+    path = user_store_path(user_id, store_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with file_lock(path):
+        _replace_file(path, arr)
+
+
+def backfill_user_vitals(user_id, records, store_dir=None):
+    """
+    Create a user's store file from existing readings unless it already exists
+    The existence check runs under the store lock, so of two concurrent backfills only
+    one writes, and a file an append created in the meantime is never overwritten.
+    Returns True if this call created the file.
+    """
+    arr = _sorted_array(records)
+    path = user_store_path(user_id, store_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with file_lock(path):
+        if os.path.exists(path):
+            return False
+        _replace_file(path, arr)
+        return True
+
+
+def vitals_to_dataframe(arr):
+    """Build a DataFrame (compact schema, see schema.py) from a vitals slice, mapping missing-value sentinels to NaN"""
+    df = pd.DataFrame({'timestamp': np.asarray(arr['timestamp']).view('datetime64[ns]')})
+    for field, missing in INT_FIELDS.items():
+        column = np.asarray(arr[field])
+        if np.any(column == missing):
+            column = np.where(column == missing, np.nan, column).astype(np.float32)
+        df[field] = column.astype(np.int16) if column.dtype.kind in 'iu' else column
+    df['temperature'] = np.asarray(arr['temperature'])
+    codes = np.asarray(arr['activity_level']).astype(np.int16)  # signed, so the sentinel can become -1
+    df['activity_level'] = pd.Categorical.from_codes(
+        np.where(codes == MISSING_UINT8, -1, codes), categories=ACTIVITY_LEVELS)
+    return df[['timestamp', 'heart_rate', 'blood_oxygen', 'temperature', 'respiration_rate', 'activity_level']]
+
+
+def migrate_json_history(health_data, store_dir=None):
+    """Rebuild store files from a health_data.json-shaped dict; returns readings written"""
+    total = 0
+    for user_id, records in health_data.items():
+        write_user_vitals(user_id, records, store_dir)
+        total += len(records)
+    return total
+
+
+if __name__ == '__main__':
+    from data import load_health_data
+    written = migrate_json_history(load_health_data())
+    print(f"Migrated {written} readings into {VITALS_STORE_DIR}/")